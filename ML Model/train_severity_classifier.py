@@ -1,90 +1,80 @@
 import pandas as pd
-import numpy as np
-import snowflake.connector
 from dotenv import load_dotenv
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import sklearn
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report
 import joblib
 
+# Shared pool, rules and population stats live at the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import dq_rules
+import population_stats
+from db_pool import get_pool
+from dq_rules import CUSTOMER_KEY
+from severity_model import FEATURES, MODEL_VERSION, heuristic_severity
+
 # -----------------------------------
-# Load env + Snowflake connection
+# Load env + Snowflake pool
 # -----------------------------------
 load_dotenv("variables.env")
-conn = snowflake.connector.connect(
-    user=os.getenv("SNOWFLAKE_USER"),
-    password=os.getenv("SNOWFLAKE_PASSWORD"),
-    account=os.getenv("SNOWFLAKE_ACCOUNT"),
-    warehouse=os.getenv("SNOWFLAKE_WAREHOUSE"),
-    database=os.getenv("SNOWFLAKE_DATABASE"),
-    schema=os.getenv("SNOWFLAKE_SCHEMA"),
-)
+pool = get_pool()
+
+PROFILE_CHUNK_ROWS = int(os.getenv("PROFILE_CHUNK_ROWS", "100000"))
+# Profiles kept for training (uniform sample); 0 keeps all
+TRAIN_SAMPLE_ROWS = int(os.getenv("TRAIN_SAMPLE_ROWS", "500000"))
 
 # -----------------------------------
-# Utility: compute profiling metrics
+# Utility: per-customer profiles
+# The model scores dq_rules.column_profiles() of one customer at a time,
+# so it is trained on exactly those profiles (streamed in chunks that
+# never split a customer, one table per thread)
 # -----------------------------------
-def compute_features(df, key_cols):
-    features = []
-    for col in df.columns:
-        if col in key_cols:
-            continue
-        col_data = df[col]
-
-        # missing %
-        missing_pct = col_data.isna().mean()
-
-        # duplicates rate
-        dup_rate = df.duplicated(subset=key_cols).mean()
-
-        # outlier rate (zscore)
-        if pd.api.types.is_numeric_dtype(col_data):
-            mean, std = col_data.mean(), col_data.std()
-            if std > 0:
-                zscore = (col_data - mean) / std
-                zscore_outlier_pct = ((np.abs(zscore) > 3).mean())
-            else:
-                zscore_outlier_pct = 0
-        else:
-            zscore_outlier_pct = 0
-
-        features.append({
-            "column": col,
-            "missing_pct": missing_pct,
-            "dup_rate": dup_rate,
-            "zscore_outlier_pct": zscore_outlier_pct
-        })
-    return pd.DataFrame(features)
+def customer_chunks(table):
+    sql, key = dq_rules.source_query(table)
+    with pool.connection() as conn:
+        carry = None
+        for chunk in pd.read_sql(f"{sql} WHERE {key} IS NOT NULL ORDER BY {key}", conn,
+                                 chunksize=PROFILE_CHUNK_ROWS):
+            chunk = dq_rules.source_frame(chunk)
+            if carry is not None:
+                chunk = pd.concat([carry, chunk], ignore_index=True)
+            # the last customer may continue in the next chunk
+            tail = (chunk[CUSTOMER_KEY] == chunk[CUSTOMER_KEY].iloc[-1]).to_numpy()
+            carry = chunk[tail]
+            if not tail.all():
+                yield chunk[~tail]
+        if carry is not None and not carry.empty:
+            yield carry
+
+def profile_table(table):
+    parts = [dq_rules.column_profiles({table: chunk}, population=stats) for chunk in customer_chunks(table)]
+    feats = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=dq_rules.PROFILE_COLUMNS)
+    print(f"✅ Profiled {table}: {len(feats)} customer/column profiles")
+    return feats
 
 # -----------------------------------
-# Fetch data from SAMPLE tables
+# Fetch + profile the rule tables
 # -----------------------------------
-app_df = pd.read_sql("SELECT * FROM SAMPLE_APPLICATION", conn)
-bureau_df = pd.read_sql("SELECT * FROM SAMPLE_BUREAU", conn)
-
-# compute features
-app_feats = compute_features(app_df, key_cols=["SK_ID_CURR"])
-bureau_feats = compute_features(bureau_df, key_cols=["SK_ID_CURR"])
-
-all_feats = pd.concat([app_feats, bureau_feats], ignore_index=True)
+stats = population_stats.load(pool)
+tables = dq_rules.tables()
+with ThreadPoolExecutor(max_workers=len(tables)) as executor:
+    all_feats = pd.concat(list(executor.map(profile_table, tables)), ignore_index=True)
+if TRAIN_SAMPLE_ROWS and len(all_feats) > TRAIN_SAMPLE_ROWS:
+    all_feats = all_feats.sample(TRAIN_SAMPLE_ROWS, random_state=42)
 
 # -----------------------------------
 # Auto-generate labels (bootstrap)
 # -----------------------------------
-def assign_severity(row):
-    if row["missing_pct"] > 0.4 or row["zscore_outlier_pct"] > 0.2:
-        return "High"
-    elif row["missing_pct"] > 0.1 or row["zscore_outlier_pct"] > 0.05:
-        return "Medium"
-    else:
-        return "Low"
-
-all_feats["severity"] = all_feats.apply(assign_severity, axis=1)
+all_feats["severity"] = heuristic_severity(all_feats)
 
 # -----------------------------------
 # Train classifier
 # -----------------------------------
-X = all_feats[["missing_pct", "dup_rate", "zscore_outlier_pct"]]
+X = all_feats[FEATURES]
 y = all_feats["severity"]
 
 X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42)
@@ -95,6 +85,12 @@ clf.fit(X_train, y_train)
 print("Classification Report:")
 print(classification_report(y_test, clf.predict(X_test)))
 
-# save model
-joblib.dump(clf, "dq_severity_model.pkl")
+# save model (bundled with the metadata severity_model.load_scorer checks)
+joblib.dump({
+    "model": clf,
+    "features": FEATURES,
+    "model_version": MODEL_VERSION,
+    "sklearn_version": sklearn.__version__,
+    "profiles": "per_customer",
+}, "dq_severity_model.pkl")
 print("✅ Model saved as dq_severity_model.pkl")
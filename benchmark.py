@@ -0,0 +1,413 @@
+# benchmark.py
+"""
+Reproducible end-to-end benchmark: synthetic Home Credit data in a local
+SQLite stand-in, a fake /analyze_combined server with configurable
+latency, and the orchestrator driven directly (process_customer) and
+over HTTP (orchestrator_api). Reports customers/sec, p50/p99 latency and
+peak RSS; --json writes the report (with the git commit) for comparing
+runs across commits.
+
+    python benchmark.py run --customers 5000 --requests 500 --concurrency 16 --llm-latency-ms 200
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# -------------------------------
+# Synthetic data
+# -------------------------------
+RESULT_TABLES_DDL = """
+    CREATE TABLE COLUMN_DICTIONARY (TABLE_NAME TEXT, ROW_NAME TEXT, DESCRIPTION TEXT);
+    CREATE TABLE DQ_ANOMALIES (
+        TABLE_NAME TEXT, COLUMN_NAME TEXT, SK_ID_CURR INT, SK_ID_PREV INT,
+        ANOMALY_TYPE TEXT, ANOMALY_DETAILS TEXT, TIMESTAMP TEXT
+    );
+    CREATE TABLE DQ_AI_SUGGESTIONS (
+        TABLE_NAME TEXT, COLUMN_NAME TEXT, SK_ID_CURR INT, ISSUE_DESCRIPTION TEXT, RAW_LLM_OUTPUT TEXT,
+        AI_SUGGESTION TEXT, CONFIDENCE_SCORE REAL, ROOT_CAUSE_HYPOTHESIS TEXT, LINEAGE_HYPOTHESIS TEXT,
+        TIMESTAMP TEXT
+    );
+"""
+
+# (column, typical magnitude) per source table
+AMOUNT_COLUMNS = {
+    "SAMPLE_APPLICATION": [
+        ("AMT_ANNUITY", 25000), ("AMT_CREDIT", 600000), ("AMT_INCOME_TOTAL", 170000), ("DAYS_EMPLOYED", 2400),
+    ],
+    "SAMPLE_BUREAU": [("AMT_CREDIT_SUM", 350000), ("AMT_ANNUITY", 15000)],
+    "SAMPLE_PREVIOUS_APP": [
+        ("AMT_ANNUITY", 16000), ("AMT_APPLICATION", 175000), ("AMT_CREDIT", 195000),
+        ("AMT_DOWN_PAYMENT", 6700), ("AMT_GOODS_PRICE", 227000),
+    ],
+    "SAMPLE_INSTALLMENTS": [("AMT_INSTALMENT", 17000), ("AMT_PAYMENT", 17000)],
+}
+
+def _amounts(rng, n, scale, rates):
+    """Log-normal amounts with injected nulls, negatives and outliers."""
+    values = rng.lognormal(np.log(scale), 0.5, n)
+    r = rng.random(n)
+    nulls = r < rates["nulls"]
+    negatives = (r >= rates["nulls"]) & (r < rates["nulls"] + rates["negatives"])
+    outliers = (r >= 1 - rates["outliers"])
+    values[negatives] *= -1
+    values[outliers] *= 50
+    values[nulls] = np.nan
+    return values.round(2)
+
+def _duplicate_keys(rng, keys, rate):
+    # A `rate` share of rows takes the key of another row
+    keys = keys.copy()
+    dup = rng.random(len(keys)) < rate
+    keys[dup] = rng.choice(keys, dup.sum())
+    return keys
+
+def generate_dataset(path, customers=2000, seed=42, nulls=0.03, negatives=0.01, duplicates=0.005, outliers=0.002):
+    """
+    Writes SAMPLE_APPLICATION / _BUREAU / _PREVIOUS_APP / _INSTALLMENTS,
+    COLUMN_DICTIONARY and empty result tables to a fresh SQLite file.
+    Returns {table: row count}.
+    """
+    rng = np.random.default_rng(seed)
+    rates = {"nulls": nulls, "negatives": negatives, "outliers": outliers}
+    now = pd.Timestamp("2024-01-01")
+    sk_ids = np.arange(100001, 100001 + customers)
+
+    def updated_at(n):
+        return (now + pd.to_timedelta(rng.integers(0, 30 * 86400, n), unit="s")).astype(str)
+
+    def with_amounts(frame, table):
+        for column, scale in AMOUNT_COLUMNS[table]:
+            frame[column] = _amounts(rng, len(frame), scale, rates)
+        frame["UPDATED_AT"] = updated_at(len(frame))
+        return frame
+
+    frames = {}
+    frames["SAMPLE_APPLICATION"] = with_amounts(pd.DataFrame({"SK_ID_CURR": sk_ids}), "SAMPLE_APPLICATION")
+
+    bureau_owner = rng.choice(sk_ids, customers * 3)
+    frames["SAMPLE_BUREAU"] = with_amounts(pd.DataFrame({
+        "SK_ID_CURR": bureau_owner,
+        "SK_ID_BUREAU": _duplicate_keys(rng, np.arange(5000001, 5000001 + len(bureau_owner)), duplicates),
+    }), "SAMPLE_BUREAU")
+
+    prev_owner = rng.choice(sk_ids, customers * 2)
+    prev_ids = _duplicate_keys(rng, np.arange(2000001, 2000001 + len(prev_owner)), duplicates)
+    frames["SAMPLE_PREVIOUS_APP"] = with_amounts(pd.DataFrame({
+        "SK_ID_PREV": prev_ids,
+        "SK_ID_CURR": prev_owner,
+    }), "SAMPLE_PREVIOUS_APP")
+
+    per_prev = rng.integers(1, 8, len(prev_ids))
+    frames["SAMPLE_INSTALLMENTS"] = with_amounts(pd.DataFrame({
+        "SK_ID_PREV": np.repeat(prev_ids, per_prev),
+        "SK_ID_CURR": np.repeat(prev_owner, per_prev),
+        "NUM_INSTALMENT_VERSION": 1.0,
+        "NUM_INSTALMENT_NUMBER": np.concatenate([np.arange(1, k + 1) for k in per_prev]),
+    }), "SAMPLE_INSTALLMENTS")
+
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    try:
+        conn.executescript(RESULT_TABLES_DDL)
+        for table, frame in frames.items():
+            frame.to_sql(table, conn, index=False)
+        key_cols = {"SAMPLE_APPLICATION": "SK_ID_CURR", "SAMPLE_BUREAU": "SK_ID_CURR",
+                    "SAMPLE_PREVIOUS_APP": "SK_ID_CURR", "SAMPLE_INSTALLMENTS": "SK_ID_PREV"}
+        for table, column in key_cols.items():
+            conn.execute(f"CREATE INDEX IX_{table} ON {table} ({column})")
+        conn.executemany(
+            "INSERT INTO COLUMN_DICTIONARY VALUES (?, ?, ?)",
+            [(t, c, f"{c.replace('_', ' ').title()} ({t})") for t, cols in AMOUNT_COLUMNS.items() for c, _ in cols],
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return {table: len(frame) for table, frame in frames.items()}
+
+# -------------------------------
+# Fake LLM service
+# -------------------------------
+FAKE_SUGGESTION = {
+    "dq_dimension": "Validity",
+    "suggestion": "Reject negative amounts at ingestion",
+    "rule_template_sql": "amount >= 0",
+    "severity": "high",
+    "confidence": 0.8,
+    "rationale": "Synthetic benchmark answer",
+    "anomaly_signature": "amount < 0",
+    "root_cause_hypothesis": "Sign flip in the source extract",
+    "lineage_hypothesis": [],
+    "follow_up_checks": [],
+}
+
+def fake_llm_handler(latency_ms, jitter_ms):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            time.sleep(max(0.0, latency_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000)
+            answer = {"raw_output": json.dumps([FAKE_SUGGESTION]), "parsed_json": [FAKE_SUGGESTION], "cache_hit": False}
+            if self.path.endswith("/analyze_batch"):
+                answer = {"results": [{"sk_id": c["sk_id"], **answer, "packed": True} for c in body["customers"]]}
+            out = json.dumps(answer).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+def serve_fake_llm(port, latency_ms=200.0, jitter_ms=50.0):
+    server = ThreadingHTTPServer(("127.0.0.1", port), fake_llm_handler(latency_ms, jitter_ms))
+    server.daemon_threads = True
+    server.serve_forever()
+
+# -------------------------------
+# Measurements
+# -------------------------------
+def peak_rss_mb(pid="self"):
+    # VmHWM is the process's peak resident set size (Linux only)
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+def summarize(latencies, wall_seconds, errors):
+    lat = np.array(latencies) * 1000
+    return {
+        "customers": len(latencies),
+        "errors": errors,
+        "wall_s": round(wall_seconds, 3),
+        "customers_per_s": round(len(latencies) / wall_seconds, 2) if wall_seconds else 0.0,
+        "p50_ms": round(float(np.percentile(lat, 50)), 1) if len(lat) else None,
+        "p99_ms": round(float(np.percentile(lat, 99)), 1) if len(lat) else None,
+    }
+
+def _drive(call, sk_ids, concurrency):
+    latencies, errors = [], 0
+    lock = threading.Lock()
+
+    def one(sk_id):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            ok = call(sk_id)
+        except Exception as e:
+            print(f"⚠️ Customer {sk_id} failed: {e}")
+            ok = False
+        with lock:
+            latencies.append(time.perf_counter() - start)
+            errors += 0 if ok else 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, sk_ids))
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+def run_direct(sk_ids, concurrency, force):
+    """In-process process_customer calls (run in its own interpreter so RSS is the pipeline's)."""
+    import orchestrate
+    started = time.perf_counter()
+    orchestrate.process_customer(sk_ids[0], force=True)  # population stats, model, pool warm-up
+    warmup_s = time.perf_counter() - started
+    report = _drive(
+        lambda sk_id: orchestrate.process_customer(sk_id, force=force)["status"] in ("processed", "unchanged", "no_data"),
+        sk_ids, concurrency,
+    )
+    orchestrate.pool.close_all()
+    return {**report, "warmup_s": round(warmup_s, 3), "peak_rss_mb": peak_rss_mb()}
+
+def run_api(sk_ids, concurrency, force, port, env):
+    """orchestrator_api under uvicorn; POST /process_customer with wait=true."""
+    import requests
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "orchestrator_api:app", "--port", str(port), "--log-level", "warning"],
+        cwd=HERE, env=env, stdout=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.time() + 120
+        while True:
+            try:
+                if requests.get(f"{url}/healthz", timeout=1).ok:
+                    break
+            except requests.ConnectionError:
+                pass
+            if time.time() > deadline or server.poll() is not None:
+                raise RuntimeError("orchestrator_api did not start")
+            time.sleep(0.2)
+
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+        session.mount("http://", adapter)
+
+        def call(sk_id):
+            resp = session.post(f"{url}/process_customer",
+                                json={"sk_id": int(sk_id), "force": force, "wait": True}, timeout=600)
+            resp.raise_for_status()
+            return resp.json()["status"] in ("processed", "unchanged", "no_data")
+
+        started = time.perf_counter()
+        call(sk_ids[0])
+        warmup_s = time.perf_counter() - started
+        report = _drive(call, sk_ids, concurrency)
+        return {**report, "warmup_s": round(warmup_s, 3), "peak_rss_mb": peak_rss_mb(server.pid)}
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+# -------------------------------
+# Orchestration of a full run
+# -------------------------------
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _service_env(db_path, llm_port, extra=None):
+    env = dict(os.environ)
+    env.update({
+        "DB_BACKEND": "sqlite",
+        "SQLITE_PATH": db_path,
+        "LLM_API_URL": f"http://127.0.0.1:{llm_port}/analyze_combined",
+        "DEBUG_LOG_SAMPLE_RATE": "0",
+    })
+    env.update(extra or {})
+    return env
+
+def run_benchmark(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix="dq-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    db_path = os.path.join(workdir, "bench.db")
+    print(f"🧪 Generating {args.customers} customers into {db_path}")
+    started = time.perf_counter()
+    rows = generate_dataset(db_path, args.customers, args.seed, args.nulls, args.negatives,
+                            args.duplicates, args.outliers)
+    print(f"✅ Generated {sum(rows.values())} rows in {time.perf_counter() - started:.1f}s: {rows}")
+
+    llm = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "fake-llm", "--port", str(args.llm_port),
+         "--latency-ms", str(args.llm_latency_ms), "--jitter-ms", str(args.llm_jitter_ms)],
+        cwd=HERE,
+    )
+    time.sleep(0.5)
+    if llm.poll() is not None:
+        raise RuntimeError(f"fake LLM could not start on port {args.llm_port}")
+
+    sk_ids = random.Random(args.seed).sample(range(100001, 100001 + args.customers),
+                                             min(args.requests, args.customers))
+    env = _service_env(db_path, args.llm_port, dict(kv.split("=", 1) for kv in args.env))
+    report = {
+        "commit": _git_commit(),
+        "params": {k: v for k, v in vars(args).items() if k not in ("command", "json", "workdir")},
+        "rows": rows,
+        "results": {},
+    }
+    try:
+        if args.mode in ("direct", "both"):
+            print(f"⏱️ Direct: {len(sk_ids)} customers, concurrency {args.concurrency}")
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "_direct", "--concurrency", str(args.concurrency),
+                 "--sk-ids", ",".join(map(str, sk_ids))] + (["--no-force"] if args.no_force else []),
+                cwd=HERE, env=env, stdout=subprocess.PIPE, text=True,
+            )
+            if out.returncode != 0:
+                raise RuntimeError(f"direct run failed with exit code {out.returncode}")
+            report["results"]["direct"] = json.loads(out.stdout.strip().splitlines()[-1])
+        if args.mode in ("api", "both"):
+            print(f"⏱️ API: {len(sk_ids)} customers, concurrency {args.concurrency}")
+            report["results"]["api"] = run_api(sk_ids, args.concurrency, not args.no_force, args.api_port, env)
+    finally:
+        llm.terminate()
+        llm.wait(timeout=10)
+
+    print(f"\n{'mode':<8}{'cust/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}{'peak RSS MB':>13}")
+    for mode, r in report["results"].items():
+        print(f"{mode:<8}{r['customers_per_s']:>10}{r['p50_ms']:>10}{r['p99_ms']:>10}{r['errors']:>8}"
+              f"{str(r['peak_rss_mb']):>13}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report written to {args.json}")
+    return report
+
+# -------------------------------
+# CLI
+# -------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end DQ pipeline benchmark")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="generate data, start the fake LLM and benchmark the pipeline")
+    run.add_argument("--customers", type=int, default=2000)
+    run.add_argument("--requests", type=int, default=200, help="customers to process")
+    run.add_argument("--concurrency", type=int, default=8)
+    run.add_argument("--mode", choices=["direct", "api", "both"], default="both")
+    run.add_argument("--llm-latency-ms", type=float, default=200.0)
+    run.add_argument("--llm-jitter-ms", type=float, default=50.0)
+    run.add_argument("--llm-port", type=int, default=18001)
+    run.add_argument("--api-port", type=int, default=18002)
+    run.add_argument("--seed", type=int, default=42)
+    run.add_argument("--nulls", type=float, default=0.03)
+    run.add_argument("--negatives", type=float, default=0.01)
+    run.add_argument("--duplicates", type=float, default=0.005)
+    run.add_argument("--outliers", type=float, default=0.002)
+    run.add_argument("--no-force", action="store_true", help="let unchanged customers be skipped")
+    run.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                     help="extra environment for the pipeline, e.g. CHECK_MODE=pushdown")
+    run.add_argument("--workdir", help="keep the generated database here")
+    run.add_argument("--json", help="write the report to this file")
+
+    gen = sub.add_parser("generate", help="only write the synthetic database")
+    gen.add_argument("path")
+    gen.add_argument("--customers", type=int, default=2000)
+    gen.add_argument("--seed", type=int, default=42)
+
+    llm = sub.add_parser("fake-llm", help="serve a fake /analyze_combined")
+    llm.add_argument("--port", type=int, default=18001)
+    llm.add_argument("--latency-ms", type=float, default=200.0)
+    llm.add_argument("--jitter-ms", type=float, default=50.0)
+
+    direct = sub.add_parser("_direct")  # worker for "run", prints one JSON line
+    direct.add_argument("--sk-ids", required=True)
+    direct.add_argument("--concurrency", type=int, default=8)
+    direct.add_argument("--no-force", action="store_true")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run_benchmark(args)
+    elif args.command == "generate":
+        print(generate_dataset(args.path, args.customers, args.seed))
+    elif args.command == "fake-llm":
+        serve_fake_llm(args.port, args.latency_ms, args.jitter_ms)
+    elif args.command == "_direct":
+        sk_ids = [int(x) for x in args.sk_ids.split(",")]
+        report = run_direct(sk_ids, args.concurrency, not args.no_force)
+        print(json.dumps(report))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# column_dictionary.py
+import time
+import threading
+
+DEFAULT_DESCRIPTION = "No description available"
+
+# -------------------------------
+# In-process COLUMN_DICTIONARY cache
+# -------------------------------
+class ColumnDictionaryCache:
+    """
+    Holds COLUMN_DICTIONARY as a {(TABLE_NAME, ROW_NAME): DESCRIPTION} map.
+    The map is loaded lazily, reloaded after `ttl` seconds and can be
+    dropped explicitly with invalidate().
+    """
+
+    def __init__(self, loader, ttl=3600):
+        self.loader = loader  # callable returning {(table, column): description}
+        self.ttl = ttl
+        self._map = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._map is None or time.monotonic() - self._loaded_at > self.ttl:
+                self._map = self.loader()
+                self._loaded_at = time.monotonic()
+                self.loads += 1
+            return self._map
+
+    def get(self, table, column, default=DEFAULT_DESCRIPTION):
+        desc = self._ensure_loaded().get((table, column))
+        if desc is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return desc
+
+    def invalidate(self):
+        with self._lock:
+            self._map = None
+
+    def stats(self):
+        return {
+            "entries": len(self._map) if self._map is not None else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "loads": self.loads,
+            "ttl_seconds": self.ttl,
+            "age_seconds": round(time.monotonic() - self._loaded_at, 1) if self._map is not None else None,
+        }
@@ -1,16 +1,21 @@
 import streamlit as st
 import pandas as pd
-import snowflake.connector
 import os
 import requests
 import json
+import time
 from dotenv import load_dotenv
 
 # Import formatter for business-friendly display
 from formatter import display_ai_suggestion
+from db_pool import get_pool
+from dq_pushdown import dialect_for
+import dq_runs
+import dq_summary
+from metrics import REQUEST_ID_HEADER, new_request_id
 
 # -------------------------------
-# Load env vars & connect to Snowflake
+# Load env vars
 # -------------------------------
 load_dotenv("variables.env")
 
@@ -18,14 +23,313 @@ ORCHESTRATOR_API_URL = os.getenv(
     "ORCHESTRATOR_API_URL", "http://orchestrator-api:8002"
 )
 
-conn = snowflake.connector.connect(
-    user=os.getenv("SNOWFLAKE_USER"),
-    password=os.getenv("SNOWFLAKE_PASSWORD"),
-    account=os.getenv("SNOWFLAKE_ACCOUNT"),
-    warehouse=os.getenv("SNOWFLAKE_WAREHOUSE"),
-    database=os.getenv("SNOWFLAKE_DATABASE"),
-    schema=os.getenv("SNOWFLAKE_SCHEMA"),
-)
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+JOB_POLL_TIMEOUT = float(os.getenv("JOB_POLL_TIMEOUT", "600"))
+
+# Reads are cached this long; results newer than RESULTS_MAX_AGE are shown without reprocessing
+RESULTS_CACHE_TTL = int(os.getenv("DASHBOARD_CACHE_TTL", "300"))
+RESULTS_MAX_AGE = int(os.getenv("DASHBOARD_RESULTS_MAX_AGE", "86400"))
+
+# Rows per page in the portfolio view
+PORTFOLIO_PAGE_SIZE = int(os.getenv("DASHBOARD_PAGE_SIZE", "50"))
+
+SQL = dialect_for(os.getenv("DB_BACKEND", "snowflake").lower())
+
+STAGE_LABELS = {
+    "queued": "⏳ Waiting in queue...",
+    "checks": "🔎 Running data quality checks...",
+    "llm": "🤖 Checks done, waiting for AI suggestions...",
+    "persist": "💾 Saving results...",
+    "done": "✅ Done",
+}
+
+# -------------------------------
+# Shared Snowflake pool
+# (one per Streamlit server, not rebuilt on every rerun)
+# -------------------------------
+@st.cache_resource
+def get_db_pool():
+    return get_pool()
+
+# -------------------------------
+# Cached, parameterized reads
+# -------------------------------
+@st.cache_data(ttl=RESULTS_CACHE_TTL, show_spinner=False)
+def load_results(sk_id):
+    # Only the customer's published run, never a run still being written
+    dq_runs.ensure_tables(get_db_pool())
+    with get_db_pool().connection() as conn:
+        anomalies_df = pd.read_sql(
+            f"""
+            SELECT a.*
+            FROM {dq_runs.CURRENT_ANOMALIES}
+            WHERE a.SK_ID_CURR = %s
+            ORDER BY a.TIMESTAMP DESC
+            LIMIT 50
+            """,
+            conn,
+            params=[sk_id],
+        )
+        suggestions_df = pd.read_sql(
+            f"""
+            SELECT a.*
+            FROM {dq_runs.CURRENT_SUGGESTIONS}
+            WHERE a.SK_ID_CURR = %s
+            ORDER BY a.TIMESTAMP DESC
+            LIMIT 10
+            """,
+            conn,
+            params=[sk_id],
+        )
+    return anomalies_df, suggestions_df
+
+@st.cache_data(ttl=RESULTS_CACHE_TTL, show_spinner=False)
+def results_age(sk_id):
+    """Seconds since the customer was last processed, or None if never."""
+    ages = []
+    # Only runs whose suggestions were published count (not checks-only or failed LLM runs)
+    for table, column in (("DQ_WATERMARKS", "PROCESSED_AT"), ("DQ_CURRENT_RUN", "SUGGESTIONS_PUBLISHED_AT")):
+        try:
+            with get_db_pool().cursor() as cur:
+                cur.execute(
+                    f"SELECT {SQL.seconds_since(f'MAX({column})')} FROM {table} WHERE SK_ID_CURR = %s",
+                    [sk_id],
+                )
+                age = cur.fetchone()[0]
+        except Exception:
+            continue  # DQ_WATERMARKS only exists once a batch has been processed
+        if age is not None:
+            ages.append(int(age))
+    return min(ages) if ages else None
+
+@st.cache_data(ttl=RESULTS_CACHE_TTL, show_spinner=False)
+def load_portfolio(filters, page):
+    """Severity totals and one page of the DQ_SUMMARY groups for the filters."""
+    filters = dict(filters)
+    dq_summary.ensure_table(get_db_pool())
+    with get_db_pool().cursor() as cur:
+        totals = dq_summary.severity_totals(cur, filters)
+        rows, total_groups = dq_summary.portfolio_page(cur, filters, page, PORTFOLIO_PAGE_SIZE)
+    page_df = pd.DataFrame(
+        [list(row) for row in rows],
+        columns=["TABLE_NAME", "COLUMN_NAME", "ANOMALY_TYPE", "SEVERITY", "ANOMALIES"],
+    )
+    return totals, page_df, total_groups
+
+@st.cache_data(ttl=RESULTS_CACHE_TTL, show_spinner=False)
+def load_filter_options():
+    dq_summary.ensure_table(get_db_pool())
+    with get_db_pool().cursor() as cur:
+        return dq_summary.filter_options(cur)
+
+def format_age(seconds):
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m"
+    if seconds < 86400:
+        return f"{seconds // 3600}h"
+    return f"{seconds // 86400}d"
+
+# -------------------------------
+# Orchestrator job polling
+# -------------------------------
+def wait_for_job(job_id, status_box, early_box):
+    """
+    Polls the orchestrator until the job finishes, showing the current
+    stage and the detected anomalies as soon as the check stage is done.
+    """
+    shown_anomalies = False
+    deadline = time.time() + JOB_POLL_TIMEOUT
+    while time.time() < deadline:
+        resp = requests.get(f"{ORCHESTRATOR_API_URL}/jobs/{job_id}", timeout=10)
+        resp.raise_for_status()
+        job = resp.json()
+        status_box.info(STAGE_LABELS.get(job["stage"], job["stage"]))
+
+        if job.get("anomalies") is not None and not shown_anomalies:
+            with early_box.container():
+                st.markdown(f"#### 🚨 {len(job['anomalies'])} anomalies detected")
+                if job["anomalies"]:
+                    st.dataframe(pd.DataFrame(job["anomalies"]), width=1200)
+            shown_anomalies = True
+
+        if job["status"] in ("completed", "failed"):
+            status_box.empty()
+            early_box.empty()
+            return job
+        time.sleep(JOB_POLL_INTERVAL)
+    raise TimeoutError(f"Job {job_id} did not finish within {JOB_POLL_TIMEOUT:.0f}s")
+
+def process_customer(sk_id, force=False):
+    """
+    Queues the customer on orchestrator-api and waits for the job, then
+    drops the cached reads so the new results are picked up. The request
+    id sent along shows up in the orchestrator and LLM service logs.
+    """
+    request_id = new_request_id()
+    resp = requests.post(
+        f"{ORCHESTRATOR_API_URL}/process_customer",
+        json={"sk_id": sk_id, "force": force},
+        headers={REQUEST_ID_HEADER: request_id},
+        timeout=10,
+    )
+    if resp.status_code == 429:
+        st.warning("⚠️ The orchestrator is busy. Please try again in a moment.")
+        st.stop()
+    resp.raise_for_status()
+    job = wait_for_job(resp.json()["job_id"], st.empty(), st.empty())
+    if job["status"] == "failed":
+        st.error(f"❌ Processing failed: {job.get('error')} (request id {job.get('request_id') or request_id})")
+    load_results.clear()
+    results_age.clear()
+    load_portfolio.clear()
+    load_filter_options.clear()
+    return job
+
+# -------------------------------
+# Results view
+# -------------------------------
+def render_results(customer_id, banner):
+    with st.spinner("⏳ Loading results..."):
+        anomalies_df, suggestions_df = load_results(customer_id)
+
+    # -------------------------------
+    # Refresh Banner
+    # -------------------------------
+    st.success(banner)
+
+    # -------------------------------
+    # Business Snapshot
+    # -------------------------------
+    if anomalies_df.empty:
+        st.info(f"✅ No anomalies detected for customer {customer_id}.")
+    else:
+        total_anomalies = len(anomalies_df)
+        severities = anomalies_df["ANOMALY_DETAILS"].map(dq_summary.severity_of)
+        high_count = int((severities == "High").sum())
+        med_count = int((severities == "Medium").sum())
+        low_count = total_anomalies - high_count - med_count
+
+        st.markdown(
+            f"""
+            ### 🚨 Customer {customer_id} Summary
+            - **Total anomalies:** {total_anomalies}  
+            - 🔴 High severity: **{high_count}**  
+            - 🟠 Medium severity: **{med_count}**  
+            - 🟢 Low severity: **{low_count}**
+            """
+        )
+
+        # Show 3 latest AI suggestions (business-friendly)
+        if not suggestions_df.empty:
+            st.markdown("### 💡 Latest AI Suggestions")
+            for _, row in suggestions_df.head(3).iterrows():
+                try:
+                    suggestion = json.loads(row["AI_SUGGESTION"])
+                    sev = suggestion.get("severity", "low").lower()
+                    icon = "🔴" if sev == "high" else ("🟠" if sev == "medium" else "🟢")
+                    st.markdown(f"- {icon} **{suggestion.get('suggestion', 'No suggestion')}**")
+                except Exception:
+                    st.markdown("- (Could not parse suggestion)")
+
+    # -------------------------------
+    # Business Impact Section
+    # -------------------------------
+    st.subheader("📈 Business Impact Assessment")
+    if suggestions_df.empty:
+        st.info("No AI-based business impact assessment available.")
+    else:
+        latest = None
+        try:
+            latest = json.loads(suggestions_df.iloc[0]["AI_SUGGESTION"])
+        except Exception:
+            pass
+
+        if latest:
+            severity = latest.get("severity", "Unknown").capitalize()
+            root_cause = latest.get("root_cause_hypothesis", "No root cause identified")
+            action = latest.get("suggestion", "No actionable recommendation")
+
+            severity_icon = "🔴" if severity.lower() == "high" else (
+                "🟠" if severity.lower() == "medium" else "🟢"
+            )
+
+            st.markdown(
+                f"""
+                - **Overall Data Risk Level:** {severity_icon} {severity}  
+                - **Likely Root Cause:** {root_cause}  
+                - **Recommended Action:** {action}
+                """
+            )
+        else:
+            st.info("Could not parse latest AI suggestion for business impact.")
+
+    # -------------------------------
+    # AI Suggestions (Detailed)
+    # -------------------------------
+    st.subheader("AI Suggestions (Business-Friendly View)")
+    if suggestions_df.empty:
+        st.info("No AI suggestions available for this customer.")
+    else:
+        for _, row in suggestions_df.iterrows():
+            display_ai_suggestion(row)
+            st.divider()
+
+    # -------------------------------
+    # Raw Tables (Hidden in Expanders)
+    # -------------------------------
+    with st.expander("📋 Show Raw Anomalies Table"):
+        st.dataframe(anomalies_df, width=1200)
+
+    with st.expander("📋 Show Raw AI Suggestions Table"):
+        st.dataframe(suggestions_df, width=1200)
+
+# -------------------------------
+# Portfolio view (reads the pre-aggregated DQ_SUMMARY table)
+# -------------------------------
+def render_portfolio():
+    tables, anomaly_types = load_filter_options()
+    date_col, table_col, type_col, severity_col = st.columns(4)
+    days = date_col.date_input("Date range", value=())
+    table = table_col.selectbox("Table", ["All"] + tables)
+    anomaly_type = type_col.selectbox("Anomaly type", ["All"] + anomaly_types)
+    severity = severity_col.selectbox("Severity", ["All"] + dq_summary.SEVERITIES)
+
+    filters = (
+        ("since", str(days[0]) if len(days) > 0 else None),
+        ("until", str(days[-1]) if len(days) > 0 else None),
+        ("table", None if table == "All" else table),
+        ("anomaly_type", None if anomaly_type == "All" else anomaly_type),
+        ("severity", None if severity == "All" else severity),
+    )
+    # Back to the first page whenever the filters change
+    if st.session_state.get("portfolio_filters") != filters:
+        st.session_state.portfolio_filters = filters
+        st.session_state.portfolio_page = 0
+    page = st.session_state.get("portfolio_page", 0)
+
+    totals, page_df, total_groups = load_portfolio(filters, page)
+    total_col, high_col, med_col, low_col = st.columns(4)
+    total_col.metric("Total anomalies", sum(totals.values()))
+    high_col.metric("🔴 High", totals.get("High", 0))
+    med_col.metric("🟠 Medium", totals.get("Medium", 0))
+    low_col.metric("🟢 Low", totals.get("Low", 0))
+
+    if page_df.empty:
+        st.info("No anomalies match these filters.")
+        return
+    st.dataframe(page_df, width=1200)
+
+    pages = max(1, -(-total_groups // PORTFOLIO_PAGE_SIZE))
+    prev_col, label_col, next_col = st.columns([1, 2, 1])
+    if prev_col.button("⬅️ Previous", disabled=page == 0):
+        st.session_state.portfolio_page = page - 1
+        st.rerun()
+    label_col.caption(f"Page {page + 1} of {pages} ({total_groups} groups)")
+    if next_col.button("Next ➡️", disabled=page + 1 >= pages):
+        st.session_state.portfolio_page = page + 1
+        st.rerun()
 
 # -------------------------------
 # App state (session)
@@ -34,6 +338,8 @@ if "page" not in st.session_state:
     st.session_state.page = "front"  # default to front page
 if "selected_id" not in st.session_state:
     st.session_state.selected_id = None
+if "results" not in st.session_state:
+    st.session_state.results = None  # {"sk_id", "banner"} of the results on screen
 
 # -------------------------------
 # Front Page
@@ -66,148 +372,58 @@ elif st.session_state.page == "dashboard":
     st.set_page_config(page_title="CreditSense Dashboard", layout="wide")
     st.title("📊 CreditSense Dashboard")
 
-    # Sample Customer IDs
-    st.markdown("### 🔑 Try with Sample Customer IDs")
-    sample_ids = [103065, 108032, 111950, 112961, 121072, 103788]
-    cols = st.columns(len(sample_ids))
-    for i, cid in enumerate(sample_ids):
-        if cols[i].button(str(cid)):
-            st.session_state.selected_id = cid
-
-    # Customer ID input (pre-filled if chosen)
-    customer_id = st.text_input(
-        "Enter Customer ID (SK_ID_CURR):",
-        value=st.session_state.selected_id if st.session_state.selected_id else "",
-    )
+    customer_tab, portfolio_tab = st.tabs(["🔍 Customer", "📈 Portfolio"])
 
-    if st.button("Process Results"):
-        if not customer_id.strip():
-            st.warning("⚠️ Please enter a valid Customer ID.")
-        else:
-            try:
-                with st.spinner("⏳ Processing customer data and fetching AI suggestions..."):
-                    # ✅ Call orchestrator-api
-                    resp = requests.post(
-                        f"{ORCHESTRATOR_API_URL}/process_customer",
-                        json={"sk_id": int(customer_id)},
-                    )
-                    resp.raise_for_status()
-
-                    # Fetch anomalies
-                    anomalies_query = f"""
-                        SELECT *
-                        FROM DQ_ANOMALIES
-                        WHERE SK_ID_CURR = {customer_id}
-                        ORDER BY TIMESTAMP DESC
-                        LIMIT 50
-                    """
-                    anomalies_df = pd.read_sql(anomalies_query, conn)
-
-                    # Fetch AI suggestions
-                    suggestions_query = f"""
-                        SELECT *
-                        FROM DQ_AI_SUGGESTIONS
-                        WHERE SK_ID_CURR = {customer_id}
-                        ORDER BY TIMESTAMP DESC
-                        LIMIT 10
-                    """
-                    suggestions_df = pd.read_sql(suggestions_query, conn)
-
-                # -------------------------------
-                # Refresh Banner
-                # -------------------------------
-                st.success(
-                    f"✅ Processing complete! Results for Customer {customer_id} were refreshed."
-                )
+    with customer_tab:
+        # Sample Customer IDs
+        st.markdown("### 🔑 Try with Sample Customer IDs")
+        sample_ids = [103065, 108032, 111950, 112961, 121072, 103788]
+        cols = st.columns(len(sample_ids))
+        for i, cid in enumerate(sample_ids):
+            if cols[i].button(str(cid)):
+                st.session_state.selected_id = cid
+
+        # Customer ID input (pre-filled if chosen)
+        customer_id = st.text_input(
+            "Enter Customer ID (SK_ID_CURR):",
+            value=st.session_state.selected_id if st.session_state.selected_id else "",
+        )
 
-                # -------------------------------
-                # Business Snapshot
-                # -------------------------------
-                if anomalies_df.empty:
-                    st.info(f"✅ No anomalies detected for customer {customer_id}.")
-                else:
-                    total_anomalies = len(anomalies_df)
-                    high_count = sum(
-                        1 for x in anomalies_df["ANOMALY_DETAILS"].astype(str).values if "High" in x
-                    )
-                    med_count = sum(
-                        1 for x in anomalies_df["ANOMALY_DETAILS"].astype(str).values if "Medium" in x
-                    )
-                    low_count = total_anomalies - high_count - med_count
-
-                    st.markdown(
-                        f"""
-                        ### 🚨 Customer {customer_id} Summary
-                        - **Total anomalies:** {total_anomalies}  
-                        - 🔴 High severity: **{high_count}**  
-                        - 🟠 Medium severity: **{med_count}**  
-                        - 🟢 Low severity: **{low_count}**
-                        """
-                    )
-
-                    # Show 3 latest AI suggestions (business-friendly)
-                    if not suggestions_df.empty:
-                        st.markdown("### 💡 Latest AI Suggestions")
-                        for _, row in suggestions_df.head(3).iterrows():
-                            try:
-                                suggestion = json.loads(row["AI_SUGGESTION"])
-                                sev = suggestion.get("severity", "low").lower()
-                                icon = "🔴" if sev == "high" else ("🟠" if sev == "medium" else "🟢")
-                                st.markdown(f"- {icon} **{suggestion.get('suggestion', 'No suggestion')}**")
-                            except Exception:
-                                st.markdown("- (Could not parse suggestion)")
-
-                # -------------------------------
-                # Business Impact Section
-                # -------------------------------
-                st.subheader("📈 Business Impact Assessment")
-                if suggestions_df.empty:
-                    st.info("No AI-based business impact assessment available.")
-                else:
-                    latest = None
-                    try:
-                        latest = json.loads(suggestions_df.iloc[0]["AI_SUGGESTION"])
-                    except Exception:
-                        pass
-
-                    if latest:
-                        severity = latest.get("severity", "Unknown").capitalize()
-                        root_cause = latest.get("root_cause_hypothesis", "No root cause identified")
-                        action = latest.get("suggestion", "No actionable recommendation")
-
-                        severity_icon = "🔴" if severity.lower() == "high" else (
-                            "🟠" if severity.lower() == "medium" else "🟢"
-                        )
-
-                        st.markdown(
-                            f"""
-                            - **Overall Data Risk Level:** {severity_icon} {severity}  
-                            - **Likely Root Cause:** {root_cause}  
-                            - **Recommended Action:** {action}
-                            """
-                        )
+        view_col, reprocess_col = st.columns(2)
+        view = view_col.button("Process Results")
+        reprocess = reprocess_col.button("🔄 Reprocess")
+        st.caption(
+            f"Results processed within the last {format_age(RESULTS_MAX_AGE)} are shown as-is; "
+            "use Reprocess to run the checks again."
+        )
+
+        if view or reprocess:
+            if not customer_id.strip():
+                st.warning("⚠️ Please enter a valid Customer ID.")
+            else:
+                try:
+                    sk_id = int(customer_id)
+                    age = None if reprocess else results_age(sk_id)
+                    if age is not None and age <= RESULTS_MAX_AGE:
+                        # ✅ Fresh results already stored: skip the orchestrator round trip
+                        banner = f"📂 Showing existing results for Customer {sk_id} (processed {format_age(age)} ago)."
                     else:
-                        st.info("Could not parse latest AI suggestion for business impact.")
-
-                # -------------------------------
-                # AI Suggestions (Detailed)
-                # -------------------------------
-                st.subheader("AI Suggestions (Business-Friendly View)")
-                if suggestions_df.empty:
-                    st.info("No AI suggestions available for this customer.")
-                else:
-                    for _, row in suggestions_df.iterrows():
-                        display_ai_suggestion(row)
-                        st.divider()
-
-                # -------------------------------
-                # Raw Tables (Hidden in Expanders)
-                # -------------------------------
-                with st.expander("📋 Show Raw Anomalies Table"):
-                    st.dataframe(anomalies_df, width=1200)
-
-                with st.expander("📋 Show Raw AI Suggestions Table"):
-                    st.dataframe(suggestions_df, width=1200)
+                        # ✅ Queue the job on orchestrator-api, then poll it
+                        process_customer(sk_id, force=reprocess)
+                        banner = f"✅ Processing complete! Results for Customer {sk_id} were refreshed."
+                    st.session_state.results = {"sk_id": sk_id, "banner": banner}
+                except Exception as e:
+                    st.error(f"❌ Error: {e}")
 
+        # Results stay on screen across reruns (served from the read cache)
+        if st.session_state.results:
+            try:
+                render_results(st.session_state.results["sk_id"], st.session_state.results["banner"])
             except Exception as e:
                 st.error(f"❌ Error: {e}")
+
+    with portfolio_tab:
+        try:
+            render_portfolio()
+        except Exception as e:
+            st.error(f"❌ Error: {e}")
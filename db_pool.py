@@ -0,0 +1,237 @@
+# db_pool.py
+import os
+import time
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv("variables.env")
+
+# -------------------------------
+# Connection factories
+# -------------------------------
+def snowflake_connect():
+    import snowflake.connector
+    return snowflake.connector.connect(
+        user=os.getenv("SNOWFLAKE_USER"),
+        password=os.getenv("SNOWFLAKE_PASSWORD"),
+        account=os.getenv("SNOWFLAKE_ACCOUNT"),
+        warehouse=os.getenv("SNOWFLAKE_WAREHOUSE"),
+        database=os.getenv("SNOWFLAKE_DATABASE"),
+        schema=os.getenv("SNOWFLAKE_SCHEMA"),
+    )
+
+class _SqliteCursor:
+    # Accepts the Snowflake-style %s placeholders used throughout the repo
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=None):
+        if sql.strip().upper() == "BEGIN":
+            # Take the write lock up front: a transaction that reads before it
+            # writes (the DQ_SUMMARY deltas) can't upgrade under WAL and fails
+            # with "database is locked" instead of waiting for the busy timeout
+            sql = "BEGIN IMMEDIATE"
+        self._cursor.execute(sql.replace("%s", "?"), tuple(params or ()))
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(sql.replace("%s", "?"), seq_of_params)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size or self._cursor.arraysize)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def arraysize(self):
+        return self._cursor.arraysize
+
+    @arraysize.setter
+    def arraysize(self, value):
+        self._cursor.arraysize = value
+
+    def close(self):
+        self._cursor.close()
+
+class SqliteConnection:
+    """
+    Local DB-API stand-in for Snowflake. Translates %s placeholders and
+    registers PARSE_JSON so the orchestrator's SQL runs unchanged.
+    """
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.create_function("PARSE_JSON", 1, lambda s: s)
+        if path != ":memory:":
+            # WAL lets streaming readers and the writer work side by side
+            self._conn.execute("PRAGMA journal_mode=WAL")
+
+    def cursor(self):
+        return _SqliteCursor(self._conn.cursor())
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+def sqlite_connect(path=None):
+    return SqliteConnection(path or os.getenv("SQLITE_PATH", "creditsense.db"))
+
+# -------------------------------
+# Pool
+# -------------------------------
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of DB-API connections.
+
+    Connections are created lazily up to `size`. A connection that has been
+    idle longer than `health_check_interval` seconds is pinged before being
+    handed out, and one that fails the ping (e.g. an expired Snowflake
+    session) or raises while checked out is closed and replaced.
+    """
+
+    def __init__(self, connect, size=4, timeout=30, health_check_interval=300,
+                 health_query="SELECT 1"):
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.health_query = health_query
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self.reconnects = 0
+
+    def _is_healthy(self, conn):
+        is_closed = getattr(conn, "is_closed", None)
+        if callable(is_closed) and is_closed():
+            return False
+        try:
+            cur = conn.cursor()
+            try:
+                cur.execute(self.health_query)
+                cur.fetchone()
+            finally:
+                cur.close()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def _new(self):
+        conn = self.connect()
+        with self._lock:
+            self._created += 1
+        return conn
+
+    def _acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"No database connection available after {self.timeout}s")
+        try:
+            try:
+                conn, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self._new()
+            if time.monotonic() - last_used > self.health_check_interval and not self._is_healthy(conn):
+                print("🔄 Reconnecting stale database connection")
+                self._discard(conn)
+                self.reconnects += 1
+                return self._new()
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, conn, broken=False):
+        try:
+            if broken and not self._is_healthy(conn):
+                self._discard(conn)
+                self.reconnects += 1
+            else:
+                self._idle.put((conn, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        broken = False
+        try:
+            yield conn
+        except Exception:
+            broken = True
+            raise
+        finally:
+            self._release(conn, broken)
+
+    @contextmanager
+    def cursor(self):
+        with self.connection() as conn:
+            cur = conn.cursor()
+            try:
+                yield cur
+            finally:
+                cur.close()
+
+    def close_all(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "open": self._created,
+            "idle": self._idle.qsize(),
+            "reconnects": self.reconnects,
+        }
+
+# -------------------------------
+# Process-wide pool
+# -------------------------------
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """
+    Returns the shared pool, built from env on first use:
+    DB_BACKEND=snowflake|sqlite, DB_POOL_SIZE, SQLITE_PATH.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            backend = os.getenv("DB_BACKEND", "snowflake").lower()
+            connect = sqlite_connect if backend == "sqlite" else snowflake_connect
+            _pool = ConnectionPool(connect, size=int(os.getenv("DB_POOL_SIZE", "4")))
+        return _pool
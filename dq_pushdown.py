@@ -0,0 +1,246 @@
+# dq_pushdown.py
+import json
+import threading
+import numpy as np
+import pandas as pd
+import dq_rules
+from dq_rules import CUSTOMER_KEY, PREV_KEY
+
+# -------------------------------
+# SQL dialects
+# -------------------------------
+class SnowflakeDialect:
+    name = "snowflake"
+
+    def count_if(self, cond):
+        return f"COUNT_IF({cond})"
+
+    def array_agg(self, expr, cond):
+        # ARRAY_AGG skips the NULLs the CASE yields for non-matching rows
+        return f"ARRAY_AGG(CASE WHEN {cond} THEN {expr} END)"
+
+    def object(self, fields):
+        return "OBJECT_CONSTRUCT(" + ", ".join(f"'{k}', {v}" for k, v in fields.items()) + ")"
+
+    def count_distinct(self, exprs):
+        return f"COUNT(DISTINCT {', '.join(exprs)})"
+
+    def seconds_since(self, expr):
+        return f"DATEDIFF('second', {expr}, CURRENT_TIMESTAMP)"
+
+class SqliteDialect:
+    name = "sqlite"
+
+    def count_if(self, cond):
+        return f"SUM(CASE WHEN {cond} THEN 1 ELSE 0 END)"
+
+    def array_agg(self, expr, cond):
+        return f"json_group_array({expr}) FILTER (WHERE {cond})"
+
+    def object(self, fields):
+        return "json_object(" + ", ".join(f"'{k}', {v}" for k, v in fields.items()) + ")"
+
+    def count_distinct(self, exprs):
+        # SQLite's COUNT(DISTINCT ...) takes a single expression
+        return "COUNT(DISTINCT " + " || '|' || ".join(exprs) + ")"
+
+    def seconds_since(self, expr):
+        return f"CAST((julianday('now') - julianday({expr})) * 86400 AS INTEGER)"
+
+DIALECTS = {"snowflake": SnowflakeDialect(), "sqlite": SqliteDialect()}
+
+def dialect_for(backend):
+    # Same backend names as db_pool.get_pool(); anything else is Snowflake
+    return DIALECTS["sqlite" if backend == "sqlite" else "snowflake"]
+
+# -------------------------------
+# Source columns (read once per table)
+# -------------------------------
+_columns = {}
+_columns_lock = threading.Lock()
+
+def table_columns(conn, table):
+    with _columns_lock:
+        if table not in _columns:
+            sql, _ = dq_rules.source_query(table)
+            cur = conn.cursor()
+            try:
+                cur.execute(f"{sql} WHERE 1 = 0")
+                _columns[table] = [d[0] for d in cur.description]
+            finally:
+                cur.close()
+        return _columns[table]
+
+# -------------------------------
+# Rule compiler
+# -------------------------------
+def compile_table(table, rules, columns, dialect, table_stats=None):
+    """
+    Compiles the rules of one table into a single aggregate SELECT grouped
+    by SK_ID_CURR. Returns (sql, key_expr, outputs): callers append
+    "WHERE key_expr IN (...) GROUP BY key_expr", and outputs lists
+    (kind, column) for each select item after SK_ID_CURR.
+
+    Only counts and the offending values come back: NEGATIVE / OUTLIER
+    values (with SK_ID_PREV where the table has it) and the key values
+    the DUPLICATE lookup needs.
+    """
+    from_clause, key = dq_rules.source_from(table)
+    has_prev = PREV_KEY in columns
+    items, outputs = [f"{key} AS {CUSTOMER_KEY}", "COUNT(*)"], [("rows", None)]
+
+    def add(kind, column, expr):
+        if (kind, column) not in outputs:
+            items.append(expr)
+            outputs.append((kind, column))
+
+    def offending(column, cond):
+        fields = {"v": f"t.{column}"}
+        if has_prev:
+            fields["p"] = f"t.{PREV_KEY}"
+        return dialect.array_agg(dialect.object(fields), cond)
+
+    def outlier_cond(column):
+        moments = table_stats.moments(column) if table_stats is not None else None
+        if moments is None:
+            return None
+        mean, std = moments
+        return f"ABS(t.{column} - {mean!r}) > {dq_rules.OUTLIER_Z * std!r}"
+
+    for rule in rules:
+        col = rule.column
+        if rule.check == "MISSING":
+            add("nulls", col, dialect.count_if(f"t.{col} IS NULL"))
+            # inputs for the severity model's column profile
+            cond = outlier_cond(col)
+            if cond is not None:
+                add("outlier_count", col, dialect.count_if(cond))
+        elif rule.check == "NEGATIVE":
+            add("negatives", col, offending(col, f"t.{col} < 0"))
+        elif rule.check == "OUTLIER":
+            cond = outlier_cond(col)
+            if cond is not None:
+                add("outliers", col, offending(col, cond))
+        elif rule.check == "DUPLICATE":
+            if table_stats is not None:
+                add("keys", col, dialect.array_agg(f"t.{col}", f"t.{col} IS NOT NULL"))
+        else:
+            raise ValueError(f"Check {rule.check} has no push-down form")
+
+    keys = dq_rules.TABLE_KEYS.get(table, [])
+    if keys and all(k in columns for k in keys):
+        add("distinct_keys", None, dialect.count_distinct([f"t.{k}" for k in keys]))
+
+    return f"SELECT {', '.join(items)} FROM {from_clause}", key, outputs
+
+# -------------------------------
+# Aggregate results -> check inputs
+# -------------------------------
+def _parse(value):
+    # Both backends return arrays as JSON text
+    if value is None:
+        return []
+    return json.loads(value) if isinstance(value, str) else list(value)
+
+def _explode(agg, alias, column, has_prev):
+    """Turns one array column of the aggregate back into (customer, value) rows."""
+    lists = agg[alias].map(_parse)
+    flat = [item for items in lists for item in items]
+    out = pd.DataFrame({CUSTOMER_KEY: np.repeat(agg[CUSTOMER_KEY].to_numpy(), lists.map(len).to_numpy())})
+    if not flat:
+        out[column] = pd.Series(dtype=float)
+    elif isinstance(flat[0], dict):
+        out[column] = pd.to_numeric(pd.Series([d.get("v") for d in flat], dtype=object))
+        if has_prev:
+            out[PREV_KEY] = [d.get("p") for d in flat]
+    else:
+        out[column] = flat
+    return out
+
+# -------------------------------
+# Push-down run
+# -------------------------------
+def run_checks(conn, sk_ids, dialect, population=None, rules=None):
+    """
+    Evaluates the rule set inside the database for `sk_ids`. Returns
+    (anomalies, profiles, present): the same anomalies DataFrame as
+    dq_rules.run_checks, the severity-model profiles, and the set of
+    customers that have any source rows.
+    """
+    rules = rules if rules is not None else dq_rules.RULES
+    ids = [int(x) for x in sk_ids]
+    ph = ", ".join(["%s"] * len(ids))
+
+    aggregates = {}
+    for table in dict.fromkeys(r.table for r in rules):
+        columns = table_columns(conn, table)
+        table_stats = population.get(table) if population is not None else None
+        sql, key, outputs = compile_table(
+            table, [r for r in rules if r.table == table], columns, dialect, table_stats
+        )
+        cur = conn.cursor()
+        try:
+            cur.execute(f"{sql} WHERE {key} IN ({ph}) GROUP BY {key}", ids)
+            rows = cur.fetchall()
+        finally:
+            cur.close()
+        aliases = [CUSTOMER_KEY] + [kind if col is None else f"{kind}:{col}" for kind, col in outputs]
+        agg = pd.DataFrame(rows, columns=aliases)
+        agg[CUSTOMER_KEY] = agg[CUSTOMER_KEY].astype("int64")
+        aggregates[table] = (agg, PREV_KEY in columns, table_stats)
+
+    present = set()
+    for agg, _, _ in aggregates.values():
+        present.update(agg[CUSTOMER_KEY].tolist())
+
+    return _anomalies(aggregates, rules), _profiles(aggregates, rules), present
+
+def _anomalies(aggregates, rules):
+    parts = []
+    for order, rule in enumerate(rules):
+        agg, has_prev, table_stats = aggregates[rule.table]
+        if agg.empty:
+            continue
+        col = rule.column
+        if rule.check == "MISSING":
+            pct = agg[f"nulls:{col}"].astype(float) / agg["rows"]
+            hit = (pct > 0).to_numpy()
+            found = pd.DataFrame({
+                CUSTOMER_KEY: agg[CUSTOMER_KEY].to_numpy()[hit],
+                "METRIC": pct.to_numpy()[hit],
+                "DETAIL": (pct.to_numpy()[hit] * 100).round(1),
+            })
+        elif rule.check == "NEGATIVE":
+            found = dq_rules.CHECKS["NEGATIVE"](_explode(agg, f"negatives:{col}", col, has_prev), col)
+        else:
+            # OUTLIER / DUPLICATE: the local check re-runs on the returned values only
+            alias = f"outliers:{col}" if rule.check == "OUTLIER" else f"keys:{col}"
+            if alias not in agg.columns:
+                continue  # no population stats for this column
+            found = dq_rules.CHECKS[rule.check](_explode(agg, alias, col, has_prev), col, table_stats)
+        if not found.empty:
+            parts.append(dq_rules.label_found(found, rule, order))
+    return dq_rules.combine_found(parts)
+
+def _profiles(aggregates, rules):
+    parts = []
+    for rule in rules:
+        if rule.check not in dq_rules.MODEL_SCORED_CHECKS:
+            continue
+        agg, _, _ = aggregates[rule.table]
+        if agg.empty:
+            continue
+        rows = agg["rows"].astype(float)
+        profile = pd.DataFrame({
+            CUSTOMER_KEY: agg[CUSTOMER_KEY],
+            "TABLE_NAME": rule.table,
+            "COLUMN_NAME": rule.column,
+            "missing_pct": agg[f"nulls:{rule.column}"].astype(float) / rows,
+            "dup_rate": ((rows - agg["distinct_keys"]) / rows) if "distinct_keys" in agg.columns else 0.0,
+            "zscore_outlier_pct": (agg[f"outlier_count:{rule.column}"] / rows)
+            if f"outlier_count:{rule.column}" in agg.columns else 0.0,
+        })
+        parts.append(profile.drop_duplicates([CUSTOMER_KEY, "TABLE_NAME", "COLUMN_NAME"]))
+    if not parts:
+        return pd.DataFrame(columns=dq_rules.PROFILE_COLUMNS)
+    return pd.concat(parts, ignore_index=True)[dq_rules.PROFILE_COLUMNS]
@@ -0,0 +1,316 @@
+# dq_rules.py
+from dataclasses import dataclass
+from typing import Optional
+import numpy as np
+import pandas as pd
+
+# -------------------------------
+# Severity thresholds per check type
+# -------------------------------
+# Each entry: ((bound, severity), ...), default severity.
+# The first bound the metric is strictly above wins, otherwise the default.
+SEVERITY_THRESHOLDS = {
+    "MISSING": (((0.3, "High"), (0.1, "Medium")), "Low"),
+    "NEGATIVE": ((), "High"),
+    "DUPLICATE": ((), "High"),
+    "OUTLIER": ((), "Medium"),
+}
+
+# -------------------------------
+# Rule registry
+# -------------------------------
+@dataclass(frozen=True)
+class Rule:
+    table: str
+    column: str
+    check: str
+    thresholds: Optional[tuple] = None  # overrides SEVERITY_THRESHOLDS[check]
+
+CUSTOMER_KEY = "SK_ID_CURR"
+PREV_KEY = "SK_ID_PREV"
+
+# Natural row key per table (used for duplicate rates)
+TABLE_KEYS = {
+    "SAMPLE_APPLICATION": ["SK_ID_CURR"],
+    "SAMPLE_BUREAU": ["SK_ID_BUREAU"],
+    "SAMPLE_PREVIOUS_APP": ["SK_ID_PREV"],
+    "SAMPLE_INSTALLMENTS": ["SK_ID_PREV", "NUM_INSTALMENT_VERSION", "NUM_INSTALMENT_NUMBER"],
+}
+
+# Tables that reach SK_ID_CURR through a parent: {table: (parent table, link column)}
+TABLE_LINKS = {
+    "SAMPLE_INSTALLMENTS": ("SAMPLE_PREVIOUS_APP", "SK_ID_PREV"),
+}
+
+# Check types whose severity the column-profile model may decide
+MODEL_SCORED_CHECKS = {"MISSING"}
+
+# Check types that compare a customer's rows against population statistics
+# (population_stats.py); they are skipped when no statistics are available
+POPULATION_CHECKS = {"OUTLIER", "DUPLICATE"}
+
+# |z| above this is an outlier (same cut as the profiler's zscore_outlier_pct)
+OUTLIER_Z = 3.0
+
+RULES = []
+
+def register_rule(table, column, check, thresholds=None):
+    if check not in CHECKS:
+        raise ValueError(f"Unknown check type: {check}")
+    RULES.append(Rule(table, column, check, thresholds))
+
+def tables():
+    return list(dict.fromkeys(r.table for r in RULES))
+
+def duplicate_key_columns(table):
+    return [r.column for r in RULES if r.table == table and r.check == "DUPLICATE"]
+
+# -------------------------------
+# Source queries
+# -------------------------------
+def source_from(table):
+    """
+    Returns (from_clause, key_expr) for reading `table` (aliased `t`) by
+    SK_ID_CURR. Linked tables are joined to their parent's distinct
+    (link, SK_ID_CURR) pairs in the same query, so a duplicated parent key
+    does not repeat the child rows.
+    """
+    if table not in TABLE_LINKS:
+        return f"{table} t", f"t.{CUSTOMER_KEY}"
+    parent, link = TABLE_LINKS[table]
+    parent_keys = f"(SELECT DISTINCT {link}, {CUSTOMER_KEY} FROM {parent})"
+    return f"{table} t JOIN {parent_keys} p ON t.{link} = p.{link}", f"p.{CUSTOMER_KEY}"
+
+def source_query(table):
+    """
+    Returns (sql, key_expr): a SELECT of every column of `table` plus its
+    SK_ID_CURR. Callers append WHERE / ORDER BY on key_expr.
+    """
+    from_clause, key = source_from(table)
+    columns = "t.*" if table not in TABLE_LINKS else f"{key} AS {CUSTOMER_KEY}, t.*"
+    return f"SELECT {columns} FROM {from_clause}", key
+
+def source_frame(df):
+    # A linked table may carry its own SK_ID_CURR as well; keep the joined one
+    return df.loc[:, ~df.columns.duplicated()]
+
+# -------------------------------
+# Vectorized severity
+# -------------------------------
+def severity(check, metric, thresholds=None):
+    bounds, default = thresholds or SEVERITY_THRESHOLDS[check]
+    metric = np.asarray(metric, dtype=float)
+    if not bounds:
+        return np.full(metric.shape, default, dtype=object)
+    conditions = [metric > bound for bound, _ in bounds]
+    choices = [label for _, label in bounds]
+    return np.select(conditions, choices, default=default).astype(object)
+
+# -------------------------------
+# Check implementations
+# Each returns a DataFrame with SK_ID_CURR, METRIC, DETAIL and, for
+# row-level findings on tables that have it, SK_ID_PREV
+# (population checks also receive the table's TableStats)
+# -------------------------------
+def _row_level(df, mask, metric, detail):
+    out = pd.DataFrame({
+        CUSTOMER_KEY: df[CUSTOMER_KEY].to_numpy()[mask],
+        "METRIC": metric,
+        "DETAIL": detail,
+    })
+    if PREV_KEY in df.columns:
+        out[PREV_KEY] = df[PREV_KEY].to_numpy()[mask]
+    return out
+
+def _check_missing(df, column):
+    missing_pct = df[column].isna().groupby(df[CUSTOMER_KEY], sort=False).mean()
+    missing_pct = missing_pct[missing_pct > 0]
+    return pd.DataFrame({
+        CUSTOMER_KEY: missing_pct.index.values,
+        "METRIC": missing_pct.values,
+        "DETAIL": (missing_pct.values * 100).round(1),
+    })
+
+def _check_negative(df, column):
+    mask = (df[column] < 0).to_numpy()
+    vals = df[column].to_numpy()[mask]
+    return _row_level(df, mask, vals, vals)
+
+def _check_outlier(df, column, table_stats):
+    z = table_stats.zscores(df, column)
+    if z is None:
+        return pd.DataFrame(columns=[CUSTOMER_KEY, "METRIC", "DETAIL"])
+    z = z.abs().to_numpy()
+    mask = z > OUTLIER_Z
+    return _row_level(df, mask, z[mask], df[column].to_numpy()[mask])
+
+def _check_duplicate(df, column, table_stats):
+    # One anomaly per customer: how many of its rows carry a key value
+    # that occurs more than once in the whole table
+    counts = table_stats.duplicate_counts(df, column)
+    if counts is None:
+        return pd.DataFrame(columns=[CUSTOMER_KEY, "METRIC", "DETAIL"])
+    dup_rows = pd.Series(counts > 1).groupby(df[CUSTOMER_KEY].to_numpy(), sort=False).sum()
+    dup_rows = dup_rows[dup_rows > 0]
+    return pd.DataFrame({
+        CUSTOMER_KEY: dup_rows.index.values,
+        "METRIC": dup_rows.values,
+        "DETAIL": dup_rows.values,
+    })
+
+CHECKS = {
+    "MISSING": _check_missing,
+    "NEGATIVE": _check_negative,
+    "OUTLIER": _check_outlier,
+    "DUPLICATE": _check_duplicate,
+}
+
+# -------------------------------
+# Default rule set
+# -------------------------------
+for _col in ["AMT_ANNUITY", "AMT_CREDIT", "AMT_INCOME_TOTAL", "DAYS_EMPLOYED"]:
+    register_rule("SAMPLE_APPLICATION", _col, "MISSING")
+    register_rule("SAMPLE_APPLICATION", _col, "NEGATIVE")
+    register_rule("SAMPLE_APPLICATION", _col, "OUTLIER")
+
+for _col in ["AMT_CREDIT_SUM", "AMT_ANNUITY"]:
+    register_rule("SAMPLE_BUREAU", _col, "MISSING")
+    register_rule("SAMPLE_BUREAU", _col, "NEGATIVE")
+    register_rule("SAMPLE_BUREAU", _col, "OUTLIER")
+
+for _col in ["AMT_ANNUITY", "AMT_APPLICATION", "AMT_CREDIT", "AMT_DOWN_PAYMENT", "AMT_GOODS_PRICE"]:
+    register_rule("SAMPLE_PREVIOUS_APP", _col, "MISSING")
+    register_rule("SAMPLE_PREVIOUS_APP", _col, "NEGATIVE")
+    register_rule("SAMPLE_PREVIOUS_APP", _col, "OUTLIER")
+
+for _col in ["AMT_INSTALMENT", "AMT_PAYMENT"]:
+    register_rule("SAMPLE_INSTALLMENTS", _col, "MISSING")
+    register_rule("SAMPLE_INSTALLMENTS", _col, "NEGATIVE")
+    register_rule("SAMPLE_INSTALLMENTS", _col, "OUTLIER")
+
+# Uniqueness is only checked on single-column keys
+for _table, _keys in TABLE_KEYS.items():
+    if len(_keys) == 1:
+        register_rule(_table, _keys[0], "DUPLICATE")
+
+# -------------------------------
+# Evaluate all rules over whole tables
+# -------------------------------
+ANOMALY_COLUMNS = [CUSTOMER_KEY, PREV_KEY, "TABLE_NAME", "COLUMN_NAME", "ANOMALY_TYPE", "SEVERITY", "DETAIL"]
+
+def run_checks(frames, rules=None, population=None):
+    """
+    Evaluates every rule against `frames` ({table_name: DataFrame}) with one
+    column-wise pass per rule and returns a single anomalies DataFrame,
+    ordered by customer and then by rule registration order.
+    `population` (a PopulationStats) enables the POPULATION_CHECKS.
+    """
+    parts = []
+    for order, rule in enumerate(rules if rules is not None else RULES):
+        df = frames.get(rule.table)
+        if df is None or df.empty:
+            continue
+        if rule.check in POPULATION_CHECKS:
+            table_stats = population.get(rule.table) if population is not None else None
+            if table_stats is None:
+                continue
+            found = CHECKS[rule.check](df, rule.column, table_stats)
+        else:
+            found = CHECKS[rule.check](df, rule.column)
+        if not found.empty:
+            parts.append(label_found(found, rule, order))
+    return combine_found(parts)
+
+def label_found(found, rule, order):
+    # Adds rule columns and severity to a check's output
+    if PREV_KEY not in found.columns:
+        found[PREV_KEY] = None
+    found["TABLE_NAME"] = rule.table
+    found["COLUMN_NAME"] = rule.column
+    found["ANOMALY_TYPE"] = rule.check
+    found["SEVERITY"] = severity(rule.check, found["METRIC"], rule.thresholds)
+    found["_ORDER"] = order
+    return found
+
+def combine_found(parts):
+    if not parts:
+        return pd.DataFrame(columns=ANOMALY_COLUMNS)
+
+    out = pd.concat(parts, ignore_index=True)
+    out = out.sort_values([CUSTOMER_KEY, "_ORDER"], kind="stable")
+    return out[ANOMALY_COLUMNS].reset_index(drop=True)
+
+# -------------------------------
+# Column profiles & model-based severity
+# -------------------------------
+PROFILE_COLUMNS = [CUSTOMER_KEY, "TABLE_NAME", "COLUMN_NAME", "missing_pct", "dup_rate", "zscore_outlier_pct"]
+
+def column_profiles(frames, rules=None, population=None):
+    """
+    Per-customer profile (missing_pct, dup_rate, zscore_outlier_pct) of every
+    (table, column) that has a model-scored rule, computed per table with
+    one groupby. Outlier rates need `population` and are 0 without it.
+    """
+    targets = {(r.table, r.column) for r in (rules if rules is not None else RULES)
+               if r.check in MODEL_SCORED_CHECKS}
+    parts = []
+    for table, df in frames.items():
+        cols = sorted(c for t, c in targets if t == table)
+        if df is None or df.empty or not cols:
+            continue
+        by_customer = df[CUSTOMER_KEY]
+        missing = df[cols].isna().groupby(by_customer, sort=False).mean()
+        # Duplicates within the customer's own rows, so a profile doesn't
+        # depend on which other customers share the batch
+        keys = TABLE_KEYS.get(table, [])
+        if keys and all(k in df.columns for k in keys):
+            dup = df.duplicated(subset=list(dict.fromkeys([CUSTOMER_KEY] + keys)))
+            dup_rate = dup.groupby(by_customer, sort=False).mean()
+        else:
+            dup_rate = pd.Series(dtype=float)
+
+        profile = missing.melt(ignore_index=False, var_name="COLUMN_NAME", value_name="missing_pct")
+        profile = profile.reset_index()
+        profile["TABLE_NAME"] = table
+        profile["dup_rate"] = profile[CUSTOMER_KEY].map(dup_rate).fillna(0.0).astype(float)
+        profile["zscore_outlier_pct"] = 0.0
+        table_stats = population.get(table) if population is not None else None
+        if table_stats is not None:
+            flags = {}
+            for c in cols:
+                z = table_stats.zscores(df, c)
+                flags[c] = (z.abs() > OUTLIER_Z) if z is not None else False
+            outliers = pd.DataFrame(flags, index=df.index).groupby(by_customer, sort=False).mean()
+            outliers = outliers.melt(ignore_index=False, var_name="COLUMN_NAME", value_name="pct").reset_index()
+            profile = profile.merge(outliers, on=[CUSTOMER_KEY, "COLUMN_NAME"], how="left")
+            profile["zscore_outlier_pct"] = profile["pct"].fillna(0.0).astype(float)
+        parts.append(profile[PROFILE_COLUMNS])
+
+    if not parts:
+        return pd.DataFrame(columns=PROFILE_COLUMNS)
+    return pd.concat(parts, ignore_index=True)
+
+def score_severity(anomalies, frames, scorer, population=None, profiles=None):
+    """
+    Replaces SEVERITY on model-scored anomalies with the scorer's label for
+    the matching (customer, table, column) profile. A rule-assigned High is
+    never lowered. Precomputed `profiles` (e.g. from the push-down mode) are
+    used instead of `frames` when given.
+    """
+    mask = anomalies["ANOMALY_TYPE"].isin(MODEL_SCORED_CHECKS).to_numpy()
+    if not mask.any():
+        return anomalies
+    if profiles is None:
+        profiles = column_profiles(frames, population=population)
+    profiles = profiles.copy()
+    labels, _ = scorer.predict(profiles)
+    profiles["MODEL_SEVERITY"] = labels
+
+    keys = [CUSTOMER_KEY, "TABLE_NAME", "COLUMN_NAME"]
+    scored = anomalies.loc[mask, keys].merge(profiles[keys + ["MODEL_SEVERITY"]], on=keys, how="left")
+    model_sev = scored["MODEL_SEVERITY"].to_numpy()
+    current = anomalies.loc[mask, "SEVERITY"].to_numpy()
+    anomalies = anomalies.copy()
+    keep = pd.isna(model_sev) | (current == "High")
+    anomalies.loc[mask, "SEVERITY"] = np.where(keep, current, model_sev)
+    return anomalies
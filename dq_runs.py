@@ -0,0 +1,264 @@
+# dq_runs.py
+import os
+import time
+import uuid
+import threading
+from dq_pushdown import dialect_for
+
+# -------------------------------
+# Versioned results
+# Every flush writes its anomalies / suggestions under a new RUN_ID and
+# then points the customer at it; readers join through DQ_CURRENT_RUN, so
+# they see the previous run until the pointer moves. Superseded runs are
+# deleted later by compact().
+# -------------------------------
+POINTER_DDL = """
+    CREATE TABLE IF NOT EXISTS DQ_CURRENT_RUN (
+        SK_ID_CURR NUMBER,
+        ANOMALY_RUN_ID VARCHAR,
+        SUGGESTION_RUN_ID VARCHAR,
+        PUBLISHED_AT TIMESTAMP,
+        SUGGESTIONS_PUBLISHED_AT TIMESTAMP
+    )
+"""
+POINTER_COLUMNS = ["SK_ID_CURR", "ANOMALY_RUN_ID", "SUGGESTION_RUN_ID"]
+VERSIONED_TABLES = {"DQ_ANOMALIES": "ANOMALY_RUN_ID", "DQ_AI_SUGGESTIONS": "SUGGESTION_RUN_ID"}
+# RUN_ID given to rows written before runs were versioned
+LEGACY_RUN_ID = "legacy"
+
+# FROM clauses that only see the published run of each customer (alias a)
+CURRENT_ANOMALIES = (
+    "DQ_ANOMALIES a JOIN DQ_CURRENT_RUN r "
+    "ON r.SK_ID_CURR = a.SK_ID_CURR AND r.ANOMALY_RUN_ID = a.RUN_ID"
+)
+CURRENT_SUGGESTIONS = (
+    "DQ_AI_SUGGESTIONS a JOIN DQ_CURRENT_RUN r "
+    "ON r.SK_ID_CURR = a.SK_ID_CURR AND r.SUGGESTION_RUN_ID = a.RUN_ID"
+)
+
+# Superseded runs are kept this long before compaction deletes them
+RUN_RETENTION_SECONDS = int(os.getenv("RUN_RETENTION_SECONDS", "3600"))
+# 0 disables the background compactor
+RUN_COMPACTION_INTERVAL = int(os.getenv("RUN_COMPACTION_INTERVAL", "600"))
+
+SQL = dialect_for(os.getenv("DB_BACKEND", "snowflake").lower())
+
+# Rows per MERGE statement
+MAX_ROWS_PER_STATEMENT = 1000
+
+def new_run_id():
+    return uuid.uuid4().hex
+
+# -------------------------------
+# Publishing (runs inside the writer's transaction)
+# A NULL SUGGESTION_RUN_ID keeps the published suggestions and their
+# SUGGESTIONS_PUBLISHED_AT (checks-only runs, failed LLM calls)
+# -------------------------------
+def _publish_sql(n):
+    if SQL.name == "sqlite":
+        return f"""
+            INSERT INTO DQ_CURRENT_RUN ({", ".join(POINTER_COLUMNS)}, PUBLISHED_AT, SUGGESTIONS_PUBLISHED_AT)
+            SELECT column1, column2, column3, CURRENT_TIMESTAMP,
+                   CASE WHEN column3 IS NOT NULL THEN CURRENT_TIMESTAMP END
+            FROM (VALUES {", ".join(["(%s, %s, %s)"] * n)}) WHERE true
+            ON CONFLICT (SK_ID_CURR) DO UPDATE SET
+                ANOMALY_RUN_ID = excluded.ANOMALY_RUN_ID,
+                SUGGESTION_RUN_ID = COALESCE(excluded.SUGGESTION_RUN_ID, DQ_CURRENT_RUN.SUGGESTION_RUN_ID),
+                PUBLISHED_AT = excluded.PUBLISHED_AT,
+                SUGGESTIONS_PUBLISHED_AT = COALESCE(excluded.SUGGESTIONS_PUBLISHED_AT,
+                                                    DQ_CURRENT_RUN.SUGGESTIONS_PUBLISHED_AT)
+        """
+    return f"""
+        MERGE INTO DQ_CURRENT_RUN c
+        USING (
+            SELECT column1 AS SK_ID_CURR, column2 AS ANOMALY_RUN_ID, column3 AS SUGGESTION_RUN_ID
+            FROM (VALUES {", ".join(["(%s, %s, %s)"] * n)})
+        ) s
+        ON c.SK_ID_CURR = s.SK_ID_CURR
+        WHEN MATCHED THEN UPDATE SET
+            ANOMALY_RUN_ID = s.ANOMALY_RUN_ID,
+            SUGGESTION_RUN_ID = COALESCE(s.SUGGESTION_RUN_ID, c.SUGGESTION_RUN_ID),
+            PUBLISHED_AT = CURRENT_TIMESTAMP,
+            SUGGESTIONS_PUBLISHED_AT = CASE WHEN s.SUGGESTION_RUN_ID IS NOT NULL
+                                            THEN CURRENT_TIMESTAMP ELSE c.SUGGESTIONS_PUBLISHED_AT END
+        WHEN NOT MATCHED THEN INSERT ({", ".join(POINTER_COLUMNS)}, PUBLISHED_AT, SUGGESTIONS_PUBLISHED_AT)
+            VALUES (s.SK_ID_CURR, s.ANOMALY_RUN_ID, s.SUGGESTION_RUN_ID, CURRENT_TIMESTAMP,
+                    CASE WHEN s.SUGGESTION_RUN_ID IS NOT NULL THEN CURRENT_TIMESTAMP END)
+    """
+
+def publish(cur, run_id, sk_ids, suggestion_ids):
+    """Points `sk_ids` at `run_id` (and their suggestions too for `suggestion_ids`)."""
+    suggestion_ids = set(suggestion_ids)
+    rows = [(sk_id, run_id, run_id if sk_id in suggestion_ids else None) for sk_id in dict.fromkeys(sk_ids)]
+    for i in range(0, len(rows), MAX_ROWS_PER_STATEMENT):
+        chunk = rows[i:i + MAX_ROWS_PER_STATEMENT]
+        cur.execute(_publish_sql(len(chunk)), [v for row in chunk for v in row])
+
+# -------------------------------
+# Table setup / migration
+# -------------------------------
+_tables_ready = False
+_tables_lock = threading.Lock()
+
+def _columns(cur, table):
+    cur.execute(f"SELECT * FROM {table} WHERE 1 = 0")
+    return {d[0].upper() for d in cur.description}
+
+def ensure_tables(pool):
+    """
+    Creates DQ_CURRENT_RUN and, on result tables from before versioned
+    runs, adds RUN_ID and publishes the existing rows as one legacy run.
+    """
+    global _tables_ready
+    with _tables_lock:
+        if _tables_ready:
+            return
+        with pool.connection() as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute(POINTER_DDL)
+                if SQL.name == "sqlite":
+                    # ON CONFLICT needs a unique index; Snowflake's MERGE doesn't
+                    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS UX_DQ_CURRENT_RUN ON DQ_CURRENT_RUN (SK_ID_CURR)")
+                if "SUGGESTIONS_PUBLISHED_AT" not in _columns(cur, "DQ_CURRENT_RUN"):
+                    cur.execute("ALTER TABLE DQ_CURRENT_RUN ADD COLUMN SUGGESTIONS_PUBLISHED_AT TIMESTAMP")
+                    cur.execute("""
+                        UPDATE DQ_CURRENT_RUN SET SUGGESTIONS_PUBLISHED_AT = PUBLISHED_AT
+                        WHERE SUGGESTION_RUN_ID IS NOT NULL
+                    """)
+                migrated = False
+                for table in VERSIONED_TABLES:
+                    if "RUN_ID" not in _columns(cur, table):
+                        cur.execute(f"ALTER TABLE {table} ADD COLUMN RUN_ID VARCHAR")
+                        cur.execute(f"UPDATE {table} SET RUN_ID = %s", [LEGACY_RUN_ID])
+                        migrated = True
+                if migrated:
+                    cur.execute("""
+                        INSERT INTO DQ_CURRENT_RUN
+                            (SK_ID_CURR, ANOMALY_RUN_ID, SUGGESTION_RUN_ID, PUBLISHED_AT, SUGGESTIONS_PUBLISHED_AT)
+                        SELECT SK_ID_CURR, %s, %s, MAX(TIMESTAMP), MAX(TIMESTAMP)
+                        FROM (
+                            SELECT SK_ID_CURR, TIMESTAMP FROM DQ_ANOMALIES
+                            UNION ALL SELECT SK_ID_CURR, TIMESTAMP FROM DQ_AI_SUGGESTIONS
+                        ) existing
+                        WHERE SK_ID_CURR NOT IN (SELECT SK_ID_CURR FROM DQ_CURRENT_RUN)
+                        GROUP BY SK_ID_CURR
+                    """, [LEGACY_RUN_ID, LEGACY_RUN_ID])
+                    print("✅ Published existing DQ results as the legacy run")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cur.close()
+        _tables_ready = True
+
+# -------------------------------
+# Compaction
+# -------------------------------
+COMPACTION_STATS = {
+    "compactions": 0,
+    "anomalies_deleted": 0,
+    "suggestions_deleted": 0,
+    "last_compaction_ms": 0.0,
+    "last_error": None,
+}
+_stats_lock = threading.Lock()
+
+def compact(pool, retention=RUN_RETENTION_SECONDS):
+    """
+    Deletes anomaly / suggestion rows that are not in their customer's
+    published run and are older than `retention` seconds. One short
+    transaction per table; readers never depend on these rows.
+    """
+    ensure_tables(pool)
+    start = time.perf_counter()
+    deleted = {}
+    with pool.connection() as conn:
+        for table, pointer_column in VERSIONED_TABLES.items():
+            cur = conn.cursor()
+            try:
+                cur.execute(f"""
+                    DELETE FROM {table}
+                    WHERE {SQL.seconds_since("TIMESTAMP")} > %s
+                      AND NOT EXISTS (
+                          SELECT 1 FROM DQ_CURRENT_RUN r
+                          WHERE r.SK_ID_CURR = {table}.SK_ID_CURR AND r.{pointer_column} = {table}.RUN_ID
+                      )
+                """, [retention])
+                deleted[table] = max(cur.rowcount, 0)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cur.close()
+
+    result = {
+        "anomalies_deleted": deleted["DQ_ANOMALIES"],
+        "suggestions_deleted": deleted["DQ_AI_SUGGESTIONS"],
+        "compaction_ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+    with _stats_lock:
+        COMPACTION_STATS["compactions"] += 1
+        COMPACTION_STATS["anomalies_deleted"] += result["anomalies_deleted"]
+        COMPACTION_STATS["suggestions_deleted"] += result["suggestions_deleted"]
+        COMPACTION_STATS["last_compaction_ms"] = result["compaction_ms"]
+        COMPACTION_STATS["last_error"] = None
+    print(f"🧹 Compacted superseded runs: {result['anomalies_deleted']} anomalies, "
+          f"{result['suggestions_deleted']} suggestion(s) in {result['compaction_ms']} ms")
+    return result
+
+class Compactor:
+    """Runs compact() every `interval` seconds on a daemon thread."""
+
+    def __init__(self, pool, interval=RUN_COMPACTION_INTERVAL, retention=RUN_RETENTION_SECONDS):
+        self.pool = pool
+        self.interval = interval
+        self.retention = retention
+        self._thread = None
+        self._stopping = threading.Event()
+        self._wake = threading.Event()
+
+    def start(self):
+        if self.interval > 0 and self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="run-compactor", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def trigger(self):
+        # Next pass starts now instead of at the end of the interval
+        if self._thread is None:
+            threading.Thread(target=self._compact, daemon=True).start()
+        else:
+            self._wake.set()
+
+    def _compact(self):
+        try:
+            compact(self.pool, self.retention)
+        except Exception as e:
+            print(f"⚠️ Run compaction failed: {e}")
+            with _stats_lock:
+                COMPACTION_STATS["last_error"] = str(e)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if not self._stopping.is_set():
+                self._compact()
+
+    def stats(self):
+        with _stats_lock:
+            stats = dict(COMPACTION_STATS)
+        stats["interval_seconds"] = self.interval
+        stats["retention_seconds"] = self.retention
+        stats["running"] = self._thread is not None
+        return stats
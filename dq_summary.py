@@ -0,0 +1,197 @@
+# dq_summary.py
+import json
+import threading
+from collections import Counter
+import dq_runs
+
+# -------------------------------
+# Pre-aggregated anomaly counts
+# (one row per day / table / column / issue type / severity)
+# -------------------------------
+SUMMARY_DDL = """
+    CREATE TABLE IF NOT EXISTS DQ_SUMMARY (
+        DAY DATE,
+        TABLE_NAME VARCHAR,
+        COLUMN_NAME VARCHAR,
+        ANOMALY_TYPE VARCHAR,
+        SEVERITY VARCHAR,
+        ANOMALY_COUNT NUMBER,
+        UPDATED_AT TIMESTAMP
+    )
+"""
+KEY_COLUMNS = ["DAY", "TABLE_NAME", "COLUMN_NAME", "ANOMALY_TYPE", "SEVERITY"]
+SEVERITIES = ["High", "Medium", "Low", "Unknown"]
+
+# Rows read per fetch while counting stored anomalies
+FETCH_ROWS = 10000
+
+def severity_of(details):
+    # Rows written before severity was stored in ANOMALY_DETAILS count as "Unknown"
+    try:
+        parsed = json.loads(details) if isinstance(details, str) else (details or {})
+    except ValueError:
+        return "Unknown"
+    return parsed.get("severity") or "Unknown"
+
+def _day(value):
+    return str(value)[:10]
+
+def _in(ids):
+    return ", ".join(["%s"] * len(ids))
+
+# -------------------------------
+# Counting
+# -------------------------------
+def _count_rows(cur, counts):
+    while True:
+        rows = cur.fetchmany(FETCH_ROWS)
+        if not rows:
+            return counts
+        for day, table, column, issue_type, details in rows:
+            counts[(_day(day), table, column, issue_type, severity_of(details))] += 1
+
+def stored_counts(cur, sk_ids):
+    """Summary keys of the published anomalies of `sk_ids`."""
+    counts = Counter()
+    sk_ids = list(dict.fromkeys(sk_ids))
+    for i in range(0, len(sk_ids), 1000):
+        chunk = sk_ids[i:i + 1000]
+        cur.execute(f"""
+            SELECT DATE(a.TIMESTAMP), a.TABLE_NAME, a.COLUMN_NAME, a.ANOMALY_TYPE, a.ANOMALY_DETAILS
+            FROM {dq_runs.CURRENT_ANOMALIES}
+            WHERE a.SK_ID_CURR IN ({_in(chunk)})
+        """, chunk)
+        _count_rows(cur, counts)
+    return counts
+
+def new_counts(cur, anomaly_rows):
+    """Summary keys of anomaly rows about to be inserted today."""
+    cur.execute("SELECT CURRENT_DATE")
+    today = _day(cur.fetchone()[0])
+    # row: (table_name, col, sk_id, sk_id_prev, issue_type, details_json)
+    return Counter((today, row[0], row[1], row[4], severity_of(row[5])) for row in anomaly_rows)
+
+# -------------------------------
+# Incremental update (runs inside the writer's transaction)
+# -------------------------------
+def apply_deltas(cur, deltas):
+    deltas = {key: n for key, n in deltas.items() if n}
+    if not deltas:
+        return
+    days = sorted({key[0] for key in deltas})
+    cur.execute(f"SELECT {', '.join(KEY_COLUMNS)} FROM DQ_SUMMARY WHERE DAY IN ({_in(days)})", days)
+    existing = {(_day(row[0]),) + tuple(row[1:]) for row in cur.fetchall()}
+
+    updates = [(n,) + key for key, n in deltas.items() if key in existing]
+    inserts = [key + (n,) for key, n in deltas.items() if key not in existing]
+    if updates:
+        cur.executemany(f"""
+            UPDATE DQ_SUMMARY
+            SET ANOMALY_COUNT = ANOMALY_COUNT + %s, UPDATED_AT = CURRENT_TIMESTAMP
+            WHERE {" AND ".join(f"{c} = %s" for c in KEY_COLUMNS)}
+        """, updates)
+    if inserts:
+        cur.executemany(f"""
+            INSERT INTO DQ_SUMMARY ({", ".join(KEY_COLUMNS)}, ANOMALY_COUNT, UPDATED_AT)
+            VALUES ({_in(KEY_COLUMNS)}, %s, CURRENT_TIMESTAMP)
+        """, inserts)
+
+# -------------------------------
+# Table setup / full rebuild
+# -------------------------------
+_table_ready = False
+_table_lock = threading.Lock()
+
+def rebuild(conn):
+    """Recomputes DQ_SUMMARY from the published DQ_ANOMALIES in one transaction."""
+    cur = conn.cursor()
+    try:
+        cur.execute("BEGIN")
+        cur.execute("DELETE FROM DQ_SUMMARY")
+        cur.execute(f"""
+            SELECT DATE(a.TIMESTAMP), a.TABLE_NAME, a.COLUMN_NAME, a.ANOMALY_TYPE, a.ANOMALY_DETAILS
+            FROM {dq_runs.CURRENT_ANOMALIES}
+        """)
+        counts = _count_rows(cur, Counter())
+        apply_deltas(cur, counts)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    print(f"✅ Rebuilt DQ_SUMMARY from {sum(counts.values())} anomalies")
+    return {"anomalies": sum(counts.values()), "rows": len(counts)}
+
+def ensure_table(pool):
+    # Created (and back-filled from existing anomalies) on first use
+    global _table_ready
+    with _table_lock:
+        if _table_ready:
+            return
+        dq_runs.ensure_tables(pool)  # the back-fill reads through DQ_CURRENT_RUN
+        with pool.connection() as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute("SELECT COUNT(*) FROM DQ_SUMMARY")
+                created = False
+            except Exception:
+                conn.rollback()
+                cur.execute(SUMMARY_DDL)
+                conn.commit()
+                created = True
+            finally:
+                cur.close()
+            if created:
+                rebuild(conn)
+        _table_ready = True
+
+# -------------------------------
+# Portfolio reads
+# -------------------------------
+def _where(filters):
+    clauses, params = [], []
+    if filters.get("since"):
+        clauses.append("DAY >= %s")
+        params.append(str(filters["since"]))
+    if filters.get("until"):
+        clauses.append("DAY <= %s")
+        params.append(str(filters["until"]))
+    for column, key in (("TABLE_NAME", "table"), ("ANOMALY_TYPE", "anomaly_type"), ("SEVERITY", "severity")):
+        if filters.get(key):
+            clauses.append(f"{column} = %s")
+            params.append(filters[key])
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+def severity_totals(cur, filters):
+    where, params = _where(filters)
+    cur.execute(f"SELECT SEVERITY, SUM(ANOMALY_COUNT) FROM DQ_SUMMARY{where} GROUP BY SEVERITY", params)
+    return {severity: int(n or 0) for severity, n in cur.fetchall()}
+
+def portfolio_page(cur, filters, page=0, page_size=50):
+    """
+    One page of (table, column, issue type, severity, count) over the
+    filtered days, largest counts first. Returns (rows, total_groups).
+    """
+    where, params = _where(filters)
+    group = "TABLE_NAME, COLUMN_NAME, ANOMALY_TYPE, SEVERITY"
+    cur.execute(f"""
+        SELECT COUNT(*) FROM (
+            SELECT {group} FROM DQ_SUMMARY{where} GROUP BY {group} HAVING SUM(ANOMALY_COUNT) > 0
+        ) g
+    """, params)
+    total = int(cur.fetchone()[0])
+    cur.execute(f"""
+        SELECT {group}, SUM(ANOMALY_COUNT) AS ANOMALIES
+        FROM DQ_SUMMARY{where}
+        GROUP BY {group}
+        HAVING SUM(ANOMALY_COUNT) > 0
+        ORDER BY ANOMALIES DESC, {group}
+        LIMIT %s OFFSET %s
+    """, params + [int(page_size), int(page) * int(page_size)])
+    return cur.fetchall(), total
+
+def filter_options(cur):
+    cur.execute("SELECT DISTINCT TABLE_NAME, ANOMALY_TYPE FROM DQ_SUMMARY")
+    rows = cur.fetchall()
+    return sorted({t for t, _ in rows}), sorted({a for _, a in rows})
@@ -0,0 +1,156 @@
+# dq_writer.py
+import time
+import threading
+import dq_runs
+import dq_summary
+
+# -------------------------------
+# Target tables
+# -------------------------------
+ANOMALY_COLUMNS = [
+    "TABLE_NAME", "COLUMN_NAME", "SK_ID_CURR", "SK_ID_PREV", "ANOMALY_TYPE", "ANOMALY_DETAILS", "RUN_ID",
+]
+ANOMALY_SELECT = "column1, column2, column3, column4, column5, PARSE_JSON(column6), column7"
+
+SUGGESTION_COLUMNS = [
+    "TABLE_NAME", "COLUMN_NAME", "SK_ID_CURR", "ISSUE_DESCRIPTION", "RAW_LLM_OUTPUT", "AI_SUGGESTION",
+    "CONFIDENCE_SCORE", "ROOT_CAUSE_HYPOTHESIS", "LINEAGE_HYPOTHESIS", "RUN_ID",
+]
+SUGGESTION_SELECT = (
+    "column1, column2, column3, column4, column5, PARSE_JSON(column6), "
+    "column7, column8, PARSE_JSON(column9), column10"
+)
+
+WATERMARK_COLUMNS = ["SK_ID_CURR", "CONTENT_HASH"]
+WATERMARK_SELECT = "column1, column2"
+
+# Rows per INSERT statement (keeps bind counts well under driver limits)
+MAX_ROWS_PER_STATEMENT = 1000
+
+# Cumulative counters, readable from the API
+WRITE_STATS = {
+    "flushes": 0,
+    "anomalies_written": 0,
+    "suggestions_written": 0,
+    "customers_published": 0,
+    "last_flush_ms": 0.0,
+    "total_flush_ms": 0.0,
+}
+_stats_lock = threading.Lock()
+
+# -------------------------------
+# Multi-row INSERT ... SELECT FROM (VALUES ...)
+# (PARSE_JSON isn't allowed inside a VALUES clause on Snowflake)
+# -------------------------------
+def _insert_rows(cur, table, columns, select_list, rows, ts_column="TIMESTAMP"):
+    width = len(columns)
+    row_ph = "(" + ", ".join(["%s"] * width) + ")"
+    for i in range(0, len(rows), MAX_ROWS_PER_STATEMENT):
+        chunk = rows[i:i + MAX_ROWS_PER_STATEMENT]
+        cur.execute(f"""
+            INSERT INTO {table}
+            ({", ".join(columns)}, {ts_column})
+            SELECT {select_list}, CURRENT_TIMESTAMP
+            FROM (VALUES {", ".join([row_ph] * len(chunk))})
+        """, [v for row in chunk for v in row])
+
+def _delete_rows(cur, table, sk_ids):
+    for i in range(0, len(sk_ids), MAX_ROWS_PER_STATEMENT):
+        chunk = sk_ids[i:i + MAX_ROWS_PER_STATEMENT]
+        cur.execute(f"DELETE FROM {table} WHERE SK_ID_CURR IN ({', '.join(['%s'] * len(chunk))})", chunk)
+
+# -------------------------------
+# Buffered writer
+# -------------------------------
+class BulkWriter:
+    """
+    Buffers the anomalies and AI suggestions of a batch and, on
+    flush(conn), inserts them under a new run id and publishes that run
+    for the replaced customers in one transaction, so no connection is
+    held while the batch is still waiting on the LLM. With `summary`, the
+    DQ_SUMMARY counts are adjusted in the same transaction.
+    """
+
+    def __init__(self, summary=True):
+        self.summary = summary
+        self.run_id = dq_runs.new_run_id()
+        self.replace_ids = []
+        self.replace_suggestion_ids = []
+        self.anomalies = []
+        self.suggestions = []
+        self.watermarks = []
+
+    def replace_customers(self, sk_ids, suggestions=True):
+        # Published results of these customers are superseded by this run
+        sk_ids = [int(x) for x in sk_ids]
+        self.replace_ids.extend(sk_ids)
+        if suggestions:
+            self.replace_suggestion_ids.extend(sk_ids)
+
+    def replace_suggestions(self, sk_ids):
+        # Also publish this run's suggestions for customers already replaced
+        # (called once their LLM result is in, so a failed call keeps the old ones)
+        self.replace_suggestion_ids.extend(int(x) for x in sk_ids)
+
+    def add_anomaly(self, row):
+        # row: (table_name, col, sk_id, sk_id_prev, issue_type, details_json)
+        self.anomalies.append(row)
+
+    def add_suggestions(self, rows):
+        # rows: (table_name, col, sk_id, issue_desc, raw_output, suggestion_json,
+        #        confidence, root_cause, lineage_json)
+        self.suggestions.extend(rows)
+
+    def add_watermark(self, sk_id, content_hash):
+        self.watermarks.append((int(sk_id), content_hash))
+
+    def flush(self, conn):
+        if not (self.replace_ids or self.anomalies or self.suggestions or self.watermarks):
+            return {"anomalies": 0, "suggestions": 0, "flush_ms": 0.0}
+
+        start = time.perf_counter()
+        cur = conn.cursor()
+        try:
+            cur.execute("BEGIN")
+            if self.summary and (self.replace_ids or self.anomalies):
+                # -published rows of the re-checked customers, +new rows
+                deltas = dq_summary.new_counts(cur, self.anomalies)
+                deltas.subtract(dq_summary.stored_counts(cur, self.replace_ids))
+                dq_summary.apply_deltas(cur, deltas)
+            run = (self.run_id,)
+            _insert_rows(cur, "DQ_ANOMALIES", ANOMALY_COLUMNS, ANOMALY_SELECT,
+                         [row + run for row in self.anomalies])
+            _insert_rows(cur, "DQ_AI_SUGGESTIONS", SUGGESTION_COLUMNS, SUGGESTION_SELECT,
+                         [tuple(row) + run for row in self.suggestions])
+            # Readers switch to the new rows here; the superseded ones are compacted later
+            dq_runs.publish(cur, self.run_id, self.replace_ids, self.replace_suggestion_ids)
+            _delete_rows(cur, "DQ_WATERMARKS", [sk_id for sk_id, _ in self.watermarks])
+            _insert_rows(cur, "DQ_WATERMARKS", WATERMARK_COLUMNS, WATERMARK_SELECT, self.watermarks,
+                         ts_column="PROCESSED_AT")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+
+        flush_ms = (time.perf_counter() - start) * 1000
+        result = {
+            "anomalies": len(self.anomalies),
+            "suggestions": len(self.suggestions),
+            "flush_ms": round(flush_ms, 2),
+        }
+        with _stats_lock:
+            WRITE_STATS["flushes"] += 1
+            WRITE_STATS["anomalies_written"] += len(self.anomalies)
+            WRITE_STATS["suggestions_written"] += len(self.suggestions)
+            WRITE_STATS["customers_published"] += len(set(self.replace_ids))
+            WRITE_STATS["last_flush_ms"] = result["flush_ms"]
+            WRITE_STATS["total_flush_ms"] += result["flush_ms"]
+
+        print(f"💾 Flushed {result['anomalies']} anomalies, {result['suggestions']} suggestion(s) "
+              f"in {result['flush_ms']} ms")
+        self.run_id = dq_runs.new_run_id()  # a reused writer publishes a new run
+        self.replace_ids, self.replace_suggestion_ids = [], []
+        self.anomalies, self.suggestions, self.watermarks = [], [], []
+        return result
@@ -0,0 +1,138 @@
+# jobs.py
+import os
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+import orchestrate
+import metrics
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "8"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "1000"))
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", "10000"))
+
+STAGES = ["checks", "llm", "persist"]
+
+class QueueFull(Exception):
+    pass
+
+# -------------------------------
+# Customer processing jobs
+# -------------------------------
+class JobQueue:
+    """
+    Bounded queue of single-customer jobs served by a fixed set of worker
+    tasks. A customer already queued or running is not enqueued twice (a
+    forced submit upgrades a queued job, or follows a running unforced one),
+    and finished jobs are kept (up to JOB_HISTORY) for status polling.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, max_queue=JOB_QUEUE_SIZE, history=JOB_HISTORY):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.history = history
+        self.jobs = OrderedDict()  # job_id -> job dict
+        self.active = {}  # sk_id -> job_id (queued or running)
+        self._queue = None
+        self._tasks = []
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        metrics.QUEUE_DEPTH.labels("jobs").set_function(self.depth)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def depth(self):
+        return self._queue.qsize() if self._queue else 0
+
+    def submit(self, sk_id, force=False, request_id=None):
+        """
+        Returns (job, deduplicated). Raises QueueFull when the queue is at
+        capacity. `request_id` is carried through to the LLM calls.
+        """
+        if sk_id in self.active:
+            active = self.jobs[self.active[sk_id]]
+            if not force or active["force"]:
+                return active, True
+            if active["status"] == "queued":
+                active["force"] = True  # not started yet: run it forced instead
+                return active, True
+            # A running unforced job may skip the customer, so queue a forced one
+
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "sk_id": sk_id,
+            "force": force,
+            "request_id": request_id,
+            "status": "queued",
+            "stage": "queued",
+            "stages": {},
+            "anomalies": None,
+            "result": None,
+            "error": None,
+            "submitted_at": time.time(),
+        }
+        try:
+            self._queue.put_nowait(job_id)
+        except asyncio.QueueFull:
+            raise QueueFull(f"Job queue is full ({self.max_queue} jobs)")
+        self.jobs[job_id] = job
+        self.active[sk_id] = job_id
+        while len(self.jobs) > self.history:
+            old_id, old = next(iter(self.jobs.items()))
+            if old["status"] in ("queued", "running"):
+                break
+            del self.jobs[old_id]
+        return job, False
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def _enter_stage(self, job, stage, payloads=None):
+        now = time.time()
+        if job["stage"] in job["stages"]:
+            job["stages"][job["stage"]]["finished_at"] = now
+        job["stage"] = stage
+        job["stages"][stage] = {"started_at": now, "finished_at": None}
+        if stage == "llm" and payloads is not None:
+            # Anomalies are visible as soon as the checks finish
+            job["anomalies"] = payloads.get(job["sk_id"], [])
+
+    async def _run(self, job):
+        job["status"] = "running"
+        metrics.bind_request(job["request_id"])
+        self._enter_stage(job, "checks")
+        results = await orchestrate._process_batch_async(
+            [job["sk_id"]],
+            force=job["force"],
+            on_stage=lambda stage, payloads: self._enter_stage(job, stage, payloads),
+        )
+        self._enter_stage(job, "done")
+        job["result"] = results[0]
+        job["status"] = "completed"
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            job = self.jobs.get(job_id)
+            try:
+                if job is not None:
+                    await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Job {job_id} failed: {e}")
+                job["status"] = "failed"
+                job["error"] = str(e)
+            finally:
+                if job is not None:
+                    if self.active.get(job["sk_id"]) == job_id:
+                        del self.active[job["sk_id"]]
+                    job["finished_at"] = time.time()
+                self._queue.task_done()
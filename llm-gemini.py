@@ -5,7 +5,13 @@ import google.generativeai as genai
 import os
 import json
 import re
+import time
+from typing import Optional
 from dotenv import load_dotenv
+from llm_cache import LLMResponseCache, cache_key, fill_customer, strip_customer
+from llm_json import ABSTAIN
+from llm_prompt import COMPACTION_VERSION, build_summary, estimate_tokens, prompt_stats, record
+import metrics
 
 # -------------------------------
 # Load environment variables
@@ -17,6 +23,16 @@ MODEL_NAME = "gemini-1.5-flash"
 model = genai.GenerativeModel(MODEL_NAME)
 
 app = FastAPI(title="Gemini LLM Service")
+metrics.instrument(app)
+
+# -------------------------------
+# Response cache (keyed on the normalized issue set)
+# -------------------------------
+cache = LLMResponseCache(
+    max_entries=int(os.getenv("LLM_CACHE_SIZE", "10000")),
+    ttl=int(os.getenv("LLM_CACHE_TTL", "86400")),
+    path=os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite") or None,
+)
 
 # -------------------------------
 # Request schema
@@ -31,6 +47,9 @@ class CombinedRequest(BaseModel):
     sk_id: int
     issues: list[IssueCheck]
 
+class BatchRequest(BaseModel):
+    customers: list[CombinedRequest]
+
 # -------------------------------
 # Prompt template
 # -------------------------------
@@ -83,6 +102,44 @@ Output MUST be valid JSON following this schema:
 Return a valid JSON list (e.g., [{{...}}, {{...}}]) only.
 """
 
+BATCH_PROMPT_TEMPLATE = """
+You are an expert data quality analyst for a financial services company.
+Your task is to analyze profiling summaries for several customers and provide structured, actionable suggestions for each one independently.
+Focus on root cause, anomaly signature, and lineage.
+
+### DATA CONTEXT
+- Platform: Snowflake (platform-agnostic response required)
+- Dataset Focus: Home Credit (credit risk)
+- Core Tables & Relationships:
+  - SAMPLE_APPLICATION links to SAMPLE_BUREAU on SK_ID_CURR
+  - SAMPLE_APPLICATION links to SAMPLE_PREVIOUS_APP on SK_ID_CURR
+  - SAMPLE_PREVIOUS_APP links to SAMPLE_INSTALLMENTS on SK_ID_PREV
+
+### TASK
+For each customer below, identify anomalies, propose fixes, hypothesize a single root cause, and trace lineage if possible.
+Each suggestion MUST be valid JSON following this schema:
+{schema}
+
+### CUSTOMERS
+{customer_sections}
+
+### RESPONSE
+Return one JSON object only, mapping every Customer ID (as a string) to its JSON list of suggestions,
+e.g. {{"100001": [{{...}}], "100002": [{{...}}, {{...}}]}}. No extra text.
+"""
+
+# Input-token budget for one packed prompt (~4 characters per token)
+BATCH_TOKEN_BUDGET = int(os.getenv("LLM_BATCH_TOKEN_BUDGET", "8000"))
+# Token budget for one customer's (compacted) summaries
+PROMPT_TOKEN_BUDGET = int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", "1500"))
+
+def build_combined_summary(issues):
+    # Returns (text, stats): deduped, ranged and cut to PROMPT_TOKEN_BUDGET
+    return build_summary(
+        [(check.table, check.column, check.desc, check.summary) for check in issues],
+        PROMPT_TOKEN_BUDGET,
+    )
+
 # -------------------------------
 # Utility: extract valid JSON
 # -------------------------------
@@ -102,37 +159,72 @@ def extract_json(text: str):
         return "[" + text[start:end+1] + "]"  # normalize to list
     return "[]"
 
+# -------------------------------
+# Instrumented model call
+# -------------------------------
+def generate(prompt, endpoint):
+    start = time.perf_counter()
+    try:
+        response = model.generate_content(prompt)
+        raw_output = response.text.strip()
+    except Exception:
+        metrics.LLM_ERRORS.labels(endpoint).inc()
+        raise
+    finally:
+        metrics.LLM_SECONDS.labels(endpoint).observe(time.perf_counter() - start)
+
+    usage = getattr(response, "usage_metadata", None)
+    metrics.LLM_TOKENS.labels("in").observe(getattr(usage, "prompt_token_count", 0) or estimate_tokens(prompt))
+    metrics.LLM_TOKENS.labels("out").observe(getattr(usage, "candidates_token_count", 0) or estimate_tokens(raw_output))
+    return raw_output
+
 # -------------------------------
 # Endpoint
 # -------------------------------
+def request_cache_key(request: CombinedRequest):
+    return cache_key(
+        [issue.model_dump() for issue in request.issues],
+        PROMPT_TEMPLATE + JSON_SCHEMA,
+        MODEL_NAME,
+        f"budget={PROMPT_TOKEN_BUDGET};compaction={COMPACTION_VERSION}",
+    )
+
+def cached_result(request: CombinedRequest):
+    cached = cache.get(request_cache_key(request))
+    return None if cached is None else fill_customer(cached, request.sk_id)
+
+def cache_result(request: CombinedRequest, result):
+    issues = [issue.model_dump() for issue in request.issues]
+    stored = strip_customer(result, request.sk_id, issues)
+    if stored is not None:
+        cache.put(request_cache_key(request), stored)
+
 @app.post("/analyze_combined")
 def analyze_combined(request: CombinedRequest):
-    combined_summary = ""
-    for check in request.issues:
-        combined_summary += f"- Table: {check.table}, Column: {check.column} ({check.desc})\n"
-        combined_summary += f"  Check Summary: {check.summary}\n\n"
+    cached = cached_result(request)
+    if cached is not None:
+        return {**cached, "cache_hit": True}
 
+    combined_summary, stats = build_combined_summary(request.issues)
+    record(stats)
     prompt = PROMPT_TEMPLATE.format(
         schema=JSON_SCHEMA,
         sk_id=request.sk_id,
         combined_summary=combined_summary
     )
 
-    print("\n================= PROMPT SENT TO GEMINI =================")
-    print(prompt)
-    print("=========================================================\n")
+    metrics.debug_log("PROMPT SENT TO GEMINI", prompt)
 
     raw_output = ""
-    parsed_json = []
 
     try:
-        response = model.generate_content(prompt)
-        raw_output = response.text.strip()
-
-        print("\n================= RAW MODEL OUTPUT =================")
-        print(raw_output)
-        print("====================================================\n")
+        raw_output = generate(prompt, "analyze_combined")
+        metrics.debug_log("RAW MODEL OUTPUT", raw_output)
+    except Exception as e:
+        print(f"⚠️ [{metrics.request_id()}] Gemini call failed: {e}")
+        return {"raw_output": raw_output, "parsed_json": [dict(ABSTAIN)], "cache_hit": False}
 
+    try:
         clean_json_str = extract_json(raw_output)
         parsed_json = json.loads(clean_json_str)
 
@@ -140,21 +232,122 @@ def analyze_combined(request: CombinedRequest):
             parsed_json = [parsed_json]
 
     except Exception as e:
-        print(f"⚠️ Failed to parse JSON: {e}")
-        parsed_json = [{
-            "dq_dimension": "Unknown",
-            "suggestion": "Abstain",
-            "rule_template_sql": None,
-            "severity": "low",
-            "confidence": 0.0,
-            "rationale": "Failed to parse model output",
-            "anomaly_signature": None,
-            "root_cause_hypothesis": None,
-            "lineage_hypothesis": [],
-            "follow_up_checks": []
-        }]
-
-    return {"raw_output": raw_output, "parsed_json": parsed_json}
+        print(f"⚠️ [{metrics.request_id()}] Failed to parse JSON: {e}")
+        metrics.LLM_PARSE_FAILURES.inc()
+        return {"raw_output": raw_output, "parsed_json": [dict(ABSTAIN)], "cache_hit": False}
+
+    # Only successful analyses are cached
+    result = {"raw_output": raw_output, "parsed_json": parsed_json}
+    cache_result(request, result)
+    return {**result, "cache_hit": False}
+
+# -------------------------------
+# Batch endpoint: several customers per prompt
+# -------------------------------
+def pack_customers(customers):
+    """
+    Greedily groups customers into packs whose prompt stays within
+    BATCH_TOKEN_BUDGET. A customer too large for the budget gets a pack
+    of its own.
+    """
+    static_tokens = estimate_tokens(BATCH_PROMPT_TEMPLATE.format(schema=JSON_SCHEMA, customer_sections=""))
+    packs, current, used = [], [], static_tokens
+    for customer in customers:
+        combined_summary, stats = build_combined_summary(customer.issues)
+        section = f"#### Customer ID: {customer.sk_id}\n{combined_summary}"
+        tokens = estimate_tokens(section)
+        if current and used + tokens > BATCH_TOKEN_BUDGET:
+            packs.append(current)
+            current, used = [], static_tokens
+        current.append((customer, section, stats))
+        used += tokens
+    if current:
+        packs.append(current)
+    return packs
+
+def split_packed_output(raw_output: str, sk_ids):
+    # Returns {sk_id: [suggestion, ...]} for every customer with a valid answer
+    text = re.sub(r"```(?:json)?", "", raw_output.strip()).strip()
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end == -1:
+        return {}
+    try:
+        obj = json.loads(text[start:end+1])
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(obj, dict):
+        return {}
+
+    parsed = {}
+    for sk_id in sk_ids:
+        answer = obj.get(str(sk_id))
+        if isinstance(answer, dict):
+            answer = [answer]
+        if isinstance(answer, list) and answer and all(
+            isinstance(item, dict) and "suggestion" in item for item in answer
+        ):
+            parsed[sk_id] = answer
+    return parsed
+
+def analyze_pack(pack):
+    for _, _, stats in pack:
+        record(stats)
+    prompt = BATCH_PROMPT_TEMPLATE.format(
+        schema=JSON_SCHEMA,
+        customer_sections="\n".join(section for _, section, _ in pack)
+    )
+    print(f"📦 [{metrics.request_id()}] Sending packed prompt for {len(pack)} customer(s), "
+          f"~{estimate_tokens(prompt)} tokens")
+    metrics.debug_log("PACKED PROMPT SENT TO GEMINI", prompt)
+    try:
+        raw_output = generate(prompt, "analyze_batch")
+    except Exception as e:
+        print(f"⚠️ [{metrics.request_id()}] Packed call failed: {e}")
+        return {}
+    metrics.debug_log("RAW PACKED OUTPUT", raw_output)
+    parsed = split_packed_output(raw_output, [customer.sk_id for customer, _, _ in pack])
+    if not parsed:
+        metrics.LLM_PARSE_FAILURES.inc()
+    return parsed
+
+@app.post("/analyze_batch")
+def analyze_batch(request: BatchRequest):
+    results = {}
+    pending = []
+    for customer in request.customers:
+        cached = cached_result(customer)
+        if cached is not None:
+            results[customer.sk_id] = {**cached, "cache_hit": True, "packed": False}
+        else:
+            pending.append(customer)
+
+    for pack in pack_customers(pending):
+        parsed = analyze_pack(pack) if len(pack) > 1 else {}
+        for customer, _, _ in pack:
+            if customer.sk_id in parsed:
+                result = {"raw_output": json.dumps(parsed[customer.sk_id]), "parsed_json": parsed[customer.sk_id]}
+                cache_result(customer, result)
+                results[customer.sk_id] = {**result, "cache_hit": False, "packed": True}
+            else:
+                # Unparseable or missing from the packed answer: ask for this customer alone
+                results[customer.sk_id] = {**analyze_combined(customer), "packed": False}
+
+    return {"results": [{"sk_id": c.sk_id, **results[c.sk_id]} for c in request.customers]}
+
+# -------------------------------
+# Cache admin
+# -------------------------------
+@app.get("/admin/cache")
+def cache_stats():
+    return cache.stats()
+
+@app.delete("/admin/cache")
+def cache_invalidate(key: Optional[str] = None):
+    return {"removed": cache.invalidate(key)}
+
+@app.get("/prompt_stats")
+def get_prompt_stats():
+    return prompt_stats()
 
 # -------------------------------
 # Entry point
@@ -0,0 +1,154 @@
+# llm_batching.py
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+class QueueFull(Exception):
+    pass
+
+# -------------------------------
+# Dynamic batching in front of a generate(prompts) function
+# -------------------------------
+class BatchScheduler:
+    """
+    Coalesces concurrent prompts into batches for one model. A single
+    worker thread owns the model: it runs `load()` once (model load and
+    warm-up), then takes the first waiting prompt, waits up to `max_wait`
+    seconds for up to `max_batch_size - 1` more, and calls
+    `generate(prompts)` on the whole batch. Callers block on a Future.
+    """
+
+    def __init__(self, generate, load=None, max_batch_size=8, max_wait=0.02, max_queue=1000):
+        self._generate = generate
+        self._load = load
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._stopping = threading.Event()
+        self._ready = threading.Event()
+        self.load_error = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "batches": 0,
+            "requests": 0,
+            "largest_batch": 0,
+            "last_batch_ms": 0.0,
+            "total_batch_ms": 0.0,
+            "failed_batches": 0,
+        }
+
+    # ---- lifecycle ----
+    def start(self):
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def depth(self):
+        return self._queue.qsize()
+
+    # ---- submitting ----
+    def submit(self, prompt):
+        if self.load_error is not None:
+            raise RuntimeError(f"Model failed to load: {self.load_error}")
+        future = Future()
+        try:
+            self._queue.put_nowait((prompt, future))
+        except queue.Full:
+            raise QueueFull(f"Generation queue is full ({self._queue.maxsize} prompts)")
+        if self.load_error is not None:  # load failed while this prompt was being queued
+            self._fail_pending(RuntimeError(f"Model failed to load: {self.load_error}"))
+        return future
+
+    def generate(self, prompt, timeout=None):
+        return self.submit(prompt).result(timeout)
+
+    # ---- worker ----
+    def _run(self):
+        if self._load is not None:
+            try:
+                self._load()
+            except Exception as e:
+                print(f"❌ Model load failed: {e}")
+                self.load_error = str(e)
+                self._fail_pending(RuntimeError(f"Model failed to load: {e}"))
+                return
+        self._ready.set()
+
+        while not self._stopping.is_set():
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    # Whatever is already queued joins even once the window has passed
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        # Callers that gave up (cancelled futures) are dropped before generating
+        batch = [(prompt, future) for prompt, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        start = time.perf_counter()
+        try:
+            outputs = self._generate([prompt for prompt, _ in batch])
+            if len(outputs) != len(batch):
+                raise RuntimeError(f"Expected {len(batch)} outputs, got {len(outputs)}")
+        except Exception as e:
+            print(f"⚠️ Batch of {len(batch)} failed: {e}")
+            for _, future in batch:
+                future.set_exception(e)
+            with self._stats_lock:
+                self._stats["failed_batches"] += 1
+            return
+        for (_, future), output in zip(batch, outputs):
+            future.set_result(output)
+
+        batch_ms = (time.perf_counter() - start) * 1000
+        with self._stats_lock:
+            self._stats["batches"] += 1
+            self._stats["requests"] += len(batch)
+            self._stats["largest_batch"] = max(self._stats["largest_batch"], len(batch))
+            self._stats["last_batch_ms"] = round(batch_ms, 2)
+            self._stats["total_batch_ms"] += batch_ms
+
+    def _fail_pending(self, error):
+        while True:
+            try:
+                _, future = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if future.set_running_or_notify_cancel():
+                future.set_exception(error)
+
+    # ---- stats ----
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["total_batch_ms"] = round(stats["total_batch_ms"], 2)
+        stats["avg_batch_size"] = round(stats["requests"] / stats["batches"], 2) if stats["batches"] else 0.0
+        stats["queue_depth"] = self.depth()
+        stats["max_batch_size"] = self.max_batch_size
+        stats["max_wait_ms"] = self.max_wait * 1000
+        stats["ready"] = self.ready
+        stats["load_error"] = self.load_error
+        return stats
@@ -0,0 +1,141 @@
+# llm_cache.py
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+# -------------------------------
+# Cache key
+# -------------------------------
+def canonical_issues(issues):
+    # Order-insensitive, customer-agnostic form of an issue list
+    rows = [json.dumps(issue, sort_keys=True, separators=(",", ":")) for issue in issues]
+    return sorted(set(rows))
+
+def cache_key(issues, prompt_template, model_name, prompt_settings=""):
+    # prompt_settings: anything else that shapes the prompt (token budget, compaction version)
+    h = hashlib.sha256()
+    h.update(model_name.encode())
+    h.update(b"\0")
+    h.update(prompt_template.encode())
+    h.update(b"\0")
+    h.update(prompt_settings.encode())
+    h.update(b"\0")
+    h.update("\n".join(canonical_issues(issues)).encode())
+    return h.hexdigest()
+
+# -------------------------------
+# Customer ids in cached responses
+# An entry is shared by every customer with the same issues, so the id of
+# the customer it was generated for is stored as a placeholder. A number in
+# the issues that equals the id (e.g. DAYS_EMPLOYED 365243 for customer
+# 365243) can't be told apart from it, so such responses aren't cached.
+# -------------------------------
+CUSTOMER_PLACEHOLDER = "<SK_ID_CURR>"
+
+def _customer_re(sk_id):
+    return re.compile(rf"(?<!\d){int(sk_id)}(?!\d)")
+
+def strip_customer(value, sk_id, issues=()):
+    # None when the id also occurs in the issues the response was built from
+    pattern = _customer_re(sk_id)
+    if any(pattern.search(row) for row in canonical_issues(issues)):
+        return None
+    return json.loads(pattern.sub(CUSTOMER_PLACEHOLDER, json.dumps(value)))
+
+def fill_customer(value, sk_id):
+    return json.loads(json.dumps(value).replace(CUSTOMER_PLACEHOLDER, str(int(sk_id))))
+
+# -------------------------------
+# LRU + TTL cache with optional sqlite persistence
+# -------------------------------
+class LLMResponseCache:
+    """
+    Bounded LRU of analysis responses keyed by cache_key(). Entries expire
+    after `ttl` seconds. When `path` is set every entry is also written to a
+    sqlite file, so a restarted service starts warm.
+    """
+
+    def __init__(self, max_entries=10000, ttl=86400, path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self._entries = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, stored_at REAL, value TEXT)"
+            )
+            self._db.commit()
+            self._load()
+
+    def _load(self):
+        cutoff = time.time() - self.ttl
+        rows = self._db.execute(
+            "SELECT key, stored_at, value FROM llm_cache WHERE stored_at > ? ORDER BY stored_at DESC LIMIT ?",
+            (cutoff, self.max_entries),
+        ).fetchall()
+        for key, stored_at, value in reversed(rows):
+            self._entries[key] = (stored_at, json.loads(value))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        stored_at = time.time()
+        with self._lock:
+            self._entries[key] = (stored_at, value)
+            self._entries.move_to_end(key)
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[0])
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, stored_at, value) VALUES (?, ?, ?)",
+                    (key, stored_at, json.dumps(value)),
+                )
+                self._db.executemany("DELETE FROM llm_cache WHERE key = ?", [(k,) for k in evicted])
+                self._db.commit()
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                if self._db is not None:
+                    self._db.execute("DELETE FROM llm_cache")
+            else:
+                removed = 1 if self._entries.pop(key, None) is not None else 0
+                if self._db is not None:
+                    self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            if self._db is not None:
+                self._db.commit()
+            return removed
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "persisted": self._db is not None,
+        }
@@ -0,0 +1,129 @@
+# llm_json.py
+import json
+
+# -------------------------------
+# Incremental scanner for the first top-level JSON value
+# -------------------------------
+class JsonScanner:
+    """
+    Fed generated text piece by piece; tracks string/escape state and
+    bracket depth from the first "{" or "[" on, and reports `done` as
+    soon as that value is closed. `text` is the value seen so far.
+    """
+
+    def __init__(self):
+        self.done = False
+        self._parts = []
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, piece):
+        if self.done:
+            return True
+        for i, ch in enumerate(piece):
+            if not self._started:
+                if ch not in "{[":
+                    continue  # prose or a markdown fence before the value
+                self._started = True
+                piece = piece[i:]
+                break
+        else:
+            if not self._started:
+                return False
+
+        for i, ch in enumerate(piece):
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._parts.append(piece[:i + 1])
+                    self.done = True
+                    return True
+        self._parts.append(piece)
+        return False
+
+    @property
+    def text(self):
+        return "".join(self._parts)
+
+# -------------------------------
+# Schema validation
+# -------------------------------
+SEVERITIES = ("low", "medium", "high")
+STRING_FIELDS = [
+    "dq_dimension", "rule_template_sql", "rationale", "anomaly_signature", "root_cause_hypothesis",
+]
+LINEAGE_FIELDS = ["from_table", "to_table", "key", "reason"]
+
+# Returned when the model output can't be parsed
+ABSTAIN = {
+    "dq_dimension": "Unknown",
+    "suggestion": "Abstain",
+    "rule_template_sql": None,
+    "severity": "low",
+    "confidence": 0.0,
+    "rationale": "Failed to parse model output",
+    "anomaly_signature": None,
+    "root_cause_hypothesis": None,
+    "lineage_hypothesis": [],
+    "follow_up_checks": []
+}
+
+def validate_suggestion(obj):
+    """
+    Checks a parsed answer against JSON_SCHEMA and returns it normalized
+    (severity lower-cased, confidence clamped to [0, 1], optional fields
+    defaulted). Raises ValueError when it doesn't fit.
+    """
+    if isinstance(obj, list) and obj:
+        obj = obj[0]  # a single-element list of suggestions
+    if not isinstance(obj, dict):
+        raise ValueError(f"expected a JSON object, got {type(obj).__name__}")
+
+    suggestion = obj.get("suggestion")
+    if not isinstance(suggestion, str) or not suggestion.strip():
+        raise ValueError("missing 'suggestion'")
+    severity = str(obj.get("severity", "")).strip().lower()
+    if severity not in SEVERITIES:
+        raise ValueError(f"severity {obj.get('severity')!r} is not one of {'|'.join(SEVERITIES)}")
+    try:
+        confidence = min(max(float(obj.get("confidence", 0.0)), 0.0), 1.0)
+    except (TypeError, ValueError):
+        raise ValueError(f"confidence {obj.get('confidence')!r} is not a number")
+
+    result = {**obj, "suggestion": suggestion, "severity": severity, "confidence": confidence}
+    for field in STRING_FIELDS:
+        value = obj.get(field)
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"'{field}' must be a string")
+        result[field] = value
+
+    lineage = obj.get("lineage_hypothesis") or []
+    if not isinstance(lineage, list) or not all(isinstance(link, dict) for link in lineage):
+        raise ValueError("'lineage_hypothesis' must be a list of objects")
+    result["lineage_hypothesis"] = [{k: link.get(k) for k in LINEAGE_FIELDS} for link in lineage]
+
+    follow_ups = obj.get("follow_up_checks") or []
+    if not isinstance(follow_ups, list):
+        raise ValueError("'follow_up_checks' must be a list")
+    result["follow_up_checks"] = [str(check) for check in follow_ups]
+    return result
+
+def parse_suggestion(text):
+    """First complete JSON value in `text`, validated. Raises ValueError."""
+    scanner = JsonScanner()
+    if not scanner.feed(text):
+        raise ValueError("no complete JSON value in model output")
+    return validate_suggestion(json.loads(scanner.text))
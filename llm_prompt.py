@@ -0,0 +1,158 @@
+# llm_prompt.py
+import re
+import threading
+
+# -------------------------------
+# Compact customer sections for the LLM prompts
+# -------------------------------
+# Summaries come from orchestrate: "<Severity> severity <TYPE> issue: <detail>[ (SK_ID_PREV n)]"
+SUMMARY_RE = re.compile(
+    r"^(?P<severity>\w+) severity (?P<type>\w+) issue: (?P<detail>.*?)(?: \(SK_ID_PREV (?P<prev>\d+)\))?$"
+)
+# Row-level checks report one value per row; these collapse into one ranged line
+RANGED_TYPES = ("NEGATIVE", "OUTLIER")
+SEVERITY_RANK = {"High": 0, "Medium": 1, "Low": 2}
+# SK_ID_PREV values listed on a ranged line before "+n more"
+MAX_LISTED_PREV = 5
+# Bump when compact_issues / build_summary change what the model sees
+# (part of the LLM response cache key)
+COMPACTION_VERSION = "1"
+
+def estimate_tokens(text: str):
+    # ~4 characters per token
+    return len(text) // 4 + 1
+
+def render_issue(table, column, desc, summary):
+    return f"- Table: {table}, Column: {column} ({desc})\n  Check Summary: {summary}\n\n"
+
+def _number(text):
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+def _format_number(value):
+    return str(int(value)) if value.is_integer() else repr(round(value, 4))
+
+def _ranged_line(severity, issue_type, values, prevs):
+    summary = (
+        f"{severity} severity {issue_type} issue: {len(values)} values from "
+        f"{_format_number(min(values))} to {_format_number(max(values))}"
+    )
+    if prevs:
+        listed = ", ".join(str(p) for p in prevs[:MAX_LISTED_PREV])
+        more = f" +{len(prevs) - MAX_LISTED_PREV} more" if len(prevs) > MAX_LISTED_PREV else ""
+        summary += f" (SK_ID_PREV {listed}{more})"
+    return summary
+
+def compact_issues(issues):
+    """
+    `issues` is a list of (table, column, desc, summary). Drops exact
+    repeats and merges the per-value NEGATIVE / OUTLIER lines of one
+    column and severity into a single ranged line, in first-seen order.
+    Returns (entries, stats); each entry is
+    (table, column, desc, summary, severity, issue_count).
+    """
+    seen = set()
+    groups = {}  # (table, column, severity, type) -> index into entries
+    entries, duplicates = [], 0
+    for table, column, desc, summary in issues:
+        if (table, column, summary) in seen:
+            duplicates += 1
+            continue
+        seen.add((table, column, summary))
+
+        match = SUMMARY_RE.match(summary)
+        severity = match.group("severity") if match else None
+        value = _number(match.group("detail")) if match and match.group("type") in RANGED_TYPES else None
+        if value is None:
+            entries.append([table, column, desc, summary, severity, 1, None])
+            continue
+
+        key = (table, column, severity, match.group("type"))
+        if key not in groups:
+            groups[key] = len(entries)
+            entries.append([table, column, desc, summary, severity, 0, ([], [])])
+        entry = entries[groups[key]]
+        entry[5] += 1
+        entry[6][0].append(value)
+        if match.group("prev"):
+            entry[6][1].append(int(match.group("prev")))
+
+    collapsed = 0
+    for entry in entries:
+        if entry[6] is not None and entry[5] > 1:
+            collapsed += entry[5] - 1
+            severity, (values, prevs) = entry[4], entry[6]
+            entry[3] = _ranged_line(severity, SUMMARY_RE.match(entry[3]).group("type"), values, prevs)
+
+    stats = {"issues": len(issues), "duplicates": duplicates, "collapsed": collapsed}
+    return [tuple(entry[:6]) for entry in entries], stats
+
+def build_summary(issues, budget, count_tokens=estimate_tokens):
+    """
+    Compacted "Combined Summaries" text for one customer within `budget`
+    tokens. When the lines don't all fit, the highest-severity ones are
+    kept (in their original order) and a closing line says how many
+    issues were left out. Returns (text, stats).
+    """
+    entries, stats = compact_issues(issues)
+    lines = [render_issue(*entry[:4]) for entry in entries]
+    costs = [count_tokens(line) for line in lines]
+
+    keep = set(range(len(entries)))
+    if sum(costs) > budget:
+        keep, used = set(), 0
+        by_priority = sorted(range(len(entries)), key=lambda i: SEVERITY_RANK.get(entries[i][4], 3))
+        # room for the omission note
+        room = budget - count_tokens(render_issue("...", "...", "...", "0 more issue(s) omitted"))
+        for i in by_priority:
+            if used + costs[i] <= room:
+                keep.add(i)
+                used += costs[i]
+
+    text = "".join(lines[i] for i in range(len(entries)) if i in keep)
+    omitted = [entries[i] for i in range(len(entries)) if i not in keep]
+    omitted_issues = sum(entry[5] for entry in omitted)
+    if omitted:
+        text += f"- {omitted_issues} more issue(s) on {len(omitted)} column check(s) omitted to fit the prompt\n\n"
+
+    stats.update({
+        "lines": len(keep),
+        "omitted_lines": len(omitted),
+        "omitted_issues": omitted_issues,
+        "tokens": count_tokens(text),
+    })
+    return text, stats
+
+# -------------------------------
+# Cumulative counters, readable from the services
+# -------------------------------
+PROMPT_STATS = {
+    "prompts": 0,
+    "issues_in": 0,
+    "duplicates_removed": 0,
+    "lines_collapsed": 0,
+    "lines_out": 0,
+    "truncated_prompts": 0,
+    "omitted_issues": 0,
+    "summary_tokens": 0,
+}
+_stats_lock = threading.Lock()
+
+def record(stats):
+    with _stats_lock:
+        PROMPT_STATS["prompts"] += 1
+        PROMPT_STATS["issues_in"] += stats["issues"]
+        PROMPT_STATS["duplicates_removed"] += stats["duplicates"]
+        PROMPT_STATS["lines_collapsed"] += stats["collapsed"]
+        PROMPT_STATS["lines_out"] += stats["lines"]
+        PROMPT_STATS["truncated_prompts"] += 1 if stats["omitted_lines"] else 0
+        PROMPT_STATS["omitted_issues"] += stats["omitted_issues"]
+        PROMPT_STATS["summary_tokens"] += stats["tokens"]
+
+def prompt_stats():
+    with _stats_lock:
+        stats = dict(PROMPT_STATS)
+    stats["avg_summary_tokens"] = round(stats["summary_tokens"] / stats["prompts"], 1) if stats["prompts"] else 0.0
+    return stats
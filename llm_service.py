@@ -1,12 +1,20 @@
-from fastapi import FastAPI
+import copy
+import time
+import threading
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 import uvicorn
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+from transformers import AutoTokenizer, AutoModelForCausalLM, StoppingCriteria, StoppingCriteriaList
 from dotenv import load_dotenv
 import os
-import json
 from typing import List
+from llm_batching import BatchScheduler, QueueFull
+from llm_json import ABSTAIN, JsonScanner, parse_suggestion
+from llm_prompt import build_summary, estimate_tokens, prompt_stats, record
+import metrics
 
 # -------------------------------
 # Env & Model
@@ -14,30 +22,158 @@ from typing import List
 load_dotenv("variables.env")
 
 HF_TOKEN = os.getenv("HUGGING_FACE")
-MODEL_NAME = "mistralai/Mistral-7B-Instruct-v0.2"
+# A small stand-in (e.g. sshleifer/tiny-gpt2) makes the batching benchmarkable on CPU
+MODEL_NAME = os.getenv("LLM_MODEL_NAME", "mistralai/Mistral-7B-Instruct-v0.2")
 
-app = FastAPI(title="DQ AI LLM Service", version="1.0")
+MAX_NEW_TOKENS = int(os.getenv("LLM_MAX_NEW_TOKENS", "400"))
+MAX_BATCH_SIZE = int(os.getenv("LLM_MAX_BATCH_SIZE", "8"))
+MAX_BATCH_WAIT_MS = float(os.getenv("LLM_MAX_BATCH_WAIT_MS", "20"))
+MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "1000"))
+WARMUP = os.getenv("LLM_WARMUP", "true").lower() == "true"
+PREFIX_CACHE = os.getenv("LLM_PREFIX_CACHE", "true").lower() == "true"
+PROMPT_TOKEN_BUDGET = int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", "1500"))
 
-generator = None
+tokenizer = None
+model = None
 
-def get_generator():
-    global generator
-    if generator is None:
-        print("⏳ Loading Mistral 7B Instruct...")
-        tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, token=HF_TOKEN)
+# KV cache of the static prompt prefix, computed once at startup
+prefix_ids = None
+prefix_cache = None
+
+# Time to first token, per batch
+PREFILL_STATS = {"batches": 0, "total_first_token_ms": 0.0, "last_first_token_ms": 0.0}
+_prefill_lock = threading.Lock()
+
+def load_model():
+    global tokenizer, model
+    print(f"⏳ Loading {MODEL_NAME}...")
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, token=HF_TOKEN)
+    # Batches are left-padded so every prompt ends right where generation starts
+    tokenizer.padding_side = "left"
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    if torch.cuda.is_available():
         model = AutoModelForCausalLM.from_pretrained(
             MODEL_NAME,
             torch_dtype=torch.float16,
             device_map="auto",
             token=HF_TOKEN
         )
-        generator = pipeline(
-            "text-generation",
-            model=model,
-            tokenizer=tokenizer,
-            torch_dtype=torch.float16
+    else:
+        model = AutoModelForCausalLM.from_pretrained(MODEL_NAME, torch_dtype=torch.float32, token=HF_TOKEN)
+    model.eval()
+    if PREFIX_CACHE:
+        build_prefix_cache()
+
+    if WARMUP:
+        # One short padded batch so the first real request doesn't pay for kernel setup
+        generate_batch(["Warm-up", "Warm-up prompt of a different length"], max_new_tokens=4)
+    print(f"✅ {MODEL_NAME} ready")
+
+def build_prefix_cache():
+    global prefix_ids, prefix_cache
+    ids = tokenizer(PROMPT_PREFIX)["input_ids"]
+    with torch.inference_mode():
+        cache = model(torch.tensor([ids], device=model.device), use_cache=True).past_key_values
+    if not hasattr(cache, "batch_repeat_interleave"):
+        print("⚠️ This transformers version returns legacy caches; prefix reuse disabled")
+        return
+    prefix_ids, prefix_cache = ids, cache
+    print(f"✅ Cached {len(ids)} prompt-prefix tokens")
+
+def count_tokens(text):
+    if tokenizer is None:
+        return estimate_tokens(text)
+    return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+def _prefixed_inputs(sections):
+    """
+    Cached prefix + customer section per row. Padding goes between the
+    two, masked out, so every row shares the prefix positions the cache
+    was computed for.
+    """
+    section_ids = [tokenizer(section, add_special_tokens=False)["input_ids"] for section in sections]
+    width = max(len(ids) for ids in section_ids)
+    rows, masks = [], []
+    for ids in section_ids:
+        pad = width - len(ids)
+        rows.append(prefix_ids + [tokenizer.pad_token_id] * pad + ids)
+        masks.append([1] * len(prefix_ids) + [0] * pad + [1] * len(ids))
+    return {
+        "input_ids": torch.tensor(rows, device=model.device),
+        "attention_mask": torch.tensor(masks, device=model.device),
+    }
+
+class JsonStop(StoppingCriteria):
+    """
+    Per-sequence stop once the answer's top-level JSON value is closed.
+    Only the newest token of each sequence is decoded on every step.
+    Also records the batch's time to first token.
+    """
+
+    def __init__(self, batch_size):
+        self.scanners = [JsonScanner() for _ in range(batch_size)]
+        self.started = time.perf_counter()
+        self.first_token_ms = None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if self.first_token_ms is None:
+            self.first_token_ms = (time.perf_counter() - self.started) * 1000
+        last = input_ids[:, -1].tolist()
+        done = [scanner.feed(tokenizer.decode([token_id])) for scanner, token_id in zip(self.scanners, last)]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+def generate_batch(sections, max_new_tokens=MAX_NEW_TOKENS):
+    """Generates answers for a batch of customer sections (the prompt minus PROMPT_PREFIX)."""
+    stop = JsonStop(len(sections))
+    with torch.inference_mode():
+        if prefix_cache is not None:
+            inputs = _prefixed_inputs(sections)
+            cache = copy.deepcopy(prefix_cache)  # generate() extends the cache in place
+            cache.batch_repeat_interleave(len(sections))
+            extra = {"past_key_values": cache}
+        else:
+            inputs = tokenizer([PROMPT_PREFIX + section for section in sections],
+                               return_tensors="pt", padding=True).to(model.device)
+            extra = {}
+        output_ids = model.generate(
+            **inputs,
+            **extra,
+            max_new_tokens=max_new_tokens,
+            do_sample=False,
+            pad_token_id=tokenizer.pad_token_id,
+            stopping_criteria=StoppingCriteriaList([stop])
         )
-    return generator
+    if stop.first_token_ms is not None:
+        with _prefill_lock:
+            PREFILL_STATS["batches"] += 1
+            PREFILL_STATS["total_first_token_ms"] += stop.first_token_ms
+            PREFILL_STATS["last_first_token_ms"] = round(stop.first_token_ms, 2)
+    # Every row's prompt ends at the same position, so this drops the echoed prompt
+    new_ids = output_ids[:, inputs["input_ids"].shape[1]:]
+    for tokens_in, tokens_out in zip(inputs["attention_mask"].sum(dim=1).tolist(),
+                                     (new_ids != tokenizer.pad_token_id).sum(dim=1).tolist()):
+        metrics.LLM_TOKENS.labels("in").observe(tokens_in)
+        metrics.LLM_TOKENS.labels("out").observe(tokens_out)
+    return tokenizer.batch_decode(new_ids, skip_special_tokens=True)
+
+scheduler = BatchScheduler(
+    generate_batch,
+    load=load_model,
+    max_batch_size=MAX_BATCH_SIZE,
+    max_wait=MAX_BATCH_WAIT_MS / 1000,
+    max_queue=MAX_QUEUE,
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    scheduler.start()  # loads and warms up the model in the background
+    yield
+    scheduler.stop()
+
+app = FastAPI(title="DQ AI LLM Service", version="1.0", lifespan=lifespan)
+metrics.instrument(app)
+metrics.QUEUE_DEPTH.labels("generation").set_function(scheduler.depth)
 
 # -------------------------------
 # Request schema
@@ -77,7 +213,8 @@ JSON_SCHEMA = """
 }
 """
 
-PROMPT_TEMPLATE = """
+# Split so the static part (identical for every request) can be cached
+PROMPT_PREFIX_TEMPLATE = """
 You are an expert data quality analyst for a financial services company. 
 Your task is to analyze a combined profiling summary for a single customer and provide structured, actionable suggestions. 
 Focus on root cause, anomaly signature, and lineage.
@@ -95,7 +232,9 @@ Based on the profiling summaries below, identify anomalies, propose fixes, hypot
 Output MUST be valid JSON following this schema:
 {schema}
 
-### CUSTOMER CONTEXT
+"""
+
+CUSTOMER_TEMPLATE = """### CUSTOMER CONTEXT
 - Customer ID: {customer_id}
 - Combined Summaries:
 {combined_summary}
@@ -104,58 +243,78 @@ Output MUST be valid JSON following this schema:
 Return only JSON, no extra text.
 """
 
+PROMPT_PREFIX = PROMPT_PREFIX_TEMPLATE.format(schema=JSON_SCHEMA)
+
 # -------------------------------
 # Endpoint
 # -------------------------------
+@app.get("/health")
+def health():
+    return {"status": "ok"}
+
+@app.get("/ready")
+def ready():
+    # Readiness probe: only route traffic once the model is loaded and warmed up
+    if scheduler.ready:
+        return {"status": "ready", "model": MODEL_NAME}
+    status = "failed" if scheduler.load_error else "loading"
+    return JSONResponse(status_code=503, content={"status": status, "error": scheduler.load_error})
+
+@app.get("/batch_stats")
+def batch_stats():
+    return scheduler.stats()
+
+@app.get("/prompt_stats")
+def get_prompt_stats():
+    with _prefill_lock:
+        prefill = dict(PREFILL_STATS)
+    batches = prefill.pop("batches")
+    prefill["avg_first_token_ms"] = round(prefill.pop("total_first_token_ms") / batches, 2) if batches else 0.0
+    return {
+        **prompt_stats(),
+        **prefill,
+        "prefix_cache": prefix_cache is not None,
+        "prefix_tokens": len(prefix_ids) if prefix_ids else 0,
+    }
+
 @app.post("/analyze_combined")
 def analyze_combined(request: CombinedDQRequest):
-    generator = get_generator()
-
-    combined_summary = ""
-    for check in request.all_checks:
-        combined_summary += f"- Table: {check.table_name}, Column: {check.column_name} ({check.column_desc})\n"
-        combined_summary += f"  Check Summary: {check.check_summary}\n\n"
+    combined_summary, stats = build_summary(
+        [(c.table_name, c.column_name, c.column_desc, c.check_summary) for c in request.all_checks],
+        PROMPT_TOKEN_BUDGET,
+        count_tokens,
+    )
+    record(stats)
 
-    prompt = PROMPT_TEMPLATE.format(
-        schema=JSON_SCHEMA,
+    section = CUSTOMER_TEMPLATE.format(
         customer_id=request.customer_id,
         combined_summary=combined_summary
     )
 
-    print("\n================= PROMPT SENT TO MODEL =================")
-    print(prompt)
-    print("========================================================\n")
-
-    result = generator(
-        prompt,
-        max_new_tokens=400,
-        temperature=0.3,
-        do_sample=False
+    metrics.debug_log(
+        "PROMPT SENT TO MODEL (after the cached prefix)",
+        f"{section}\n({stats['issues']} issue(s) -> {stats['lines']} line(s), {stats['omitted_issues']} omitted)",
     )
 
-    raw_output = result[0]["generated_text"]
-    print("\n================= RAW MODEL OUTPUT =================")
-    print(raw_output)
-    print("====================================================\n")
+    start = time.perf_counter()
+    try:
+        # Blocks until the scheduler has run this prompt as part of a batch
+        raw_output = scheduler.generate(section)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except Exception:
+        metrics.LLM_ERRORS.labels("analyze_combined").inc()
+        raise
+    finally:
+        metrics.LLM_SECONDS.labels("analyze_combined").observe(time.perf_counter() - start)
+    metrics.debug_log("RAW MODEL OUTPUT", raw_output)
 
     try:
-        json_start = raw_output.find("{")
-        json_end = raw_output.rfind("}") + 1
-        suggestion_json = json.loads(raw_output[json_start:json_end])
-    except Exception as e:
-        print(f"⚠️ JSON parse failed: {e}")
-        suggestion_json = {
-            "dq_dimension": "Unknown",
-            "suggestion": "Abstain",
-            "rule_template_sql": None,
-            "severity": "low",
-            "confidence": 0.0,
-            "rationale": "Failed to parse model output",
-            "anomaly_signature": None,
-            "root_cause_hypothesis": None,
-            "lineage_hypothesis": [],
-            "follow_up_checks": []
-        }
+        suggestion_json = parse_suggestion(raw_output)
+    except ValueError as e:  # includes json.JSONDecodeError
+        print(f"⚠️ [{metrics.request_id()}] JSON parse failed: {e}")
+        metrics.LLM_PARSE_FAILURES.inc()
+        suggestion_json = dict(ABSTAIN)
 
     return suggestion_json
 
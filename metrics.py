@@ -0,0 +1,97 @@
+# metrics.py
+import os
+import time
+import uuid
+import random
+import contextvars
+from contextlib import contextmanager
+from fastapi import Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# -------------------------------
+# Shared instrumentation for orchestrator-api and the LLM services
+# -------------------------------
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# Fraction of requests whose full prompts / payloads / raw outputs are printed
+DEBUG_LOG_SAMPLE_RATE = float(os.getenv("DEBUG_LOG_SAMPLE_RATE", "0"))
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+_debug_sampled = contextvars.ContextVar("debug_sampled", default=False)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+STAGE_SECONDS = Histogram(
+    "dq_stage_seconds", "Time spent per pipeline stage (fetch, checks, write, llm)",
+    ["stage"], buckets=LATENCY_BUCKETS,
+)
+LLM_SECONDS = Histogram(
+    "dq_llm_request_seconds", "LLM call latency", ["endpoint"], buckets=LATENCY_BUCKETS,
+)
+LLM_ERRORS = Counter("dq_llm_errors_total", "Failed LLM calls", ["endpoint"])
+LLM_PARSE_FAILURES = Counter("dq_llm_parse_failures_total", "Model outputs that could not be parsed")
+LLM_TOKENS = Histogram(
+    "dq_llm_tokens", "Tokens per LLM call", ["direction"], buckets=TOKEN_BUCKETS,
+)
+QUEUE_DEPTH = Gauge("dq_queue_depth", "Items waiting in a work queue", ["queue"])
+CUSTOMERS = Counter("dq_customers_total", "Customers processed, by outcome", ["status"])
+HTTP_SECONDS = Histogram(
+    "dq_http_request_seconds", "Request latency per endpoint", ["method", "path"], buckets=LATENCY_BUCKETS,
+)
+
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(name).observe(time.perf_counter() - start)
+
+# -------------------------------
+# Request ids & sampled debug logging
+# -------------------------------
+def new_request_id():
+    return uuid.uuid4().hex
+
+def request_id():
+    return _request_id.get()
+
+def bind_request(rid=None):
+    """Sets the request id (and the debug sampling decision) for the current context."""
+    rid = rid or new_request_id()
+    _request_id.set(rid)
+    _debug_sampled.set(DEBUG_LOG_SAMPLE_RATE > 0 and random.random() < DEBUG_LOG_SAMPLE_RATE)
+    return rid
+
+def request_headers():
+    # Forwarded on outgoing calls so one request id spans every service
+    rid = request_id()
+    return {REQUEST_ID_HEADER: rid} if rid else {}
+
+def debug_log(title, text):
+    if _debug_sampled.get():
+        print(f"\n================= {title} [{request_id()}] =================")
+        print(text)
+        print("=" * (len(title) + 44) + "\n")
+
+# -------------------------------
+# FastAPI wiring
+# -------------------------------
+def instrument(app):
+    """Adds request-id propagation, per-endpoint latency and GET /metrics."""
+
+    @app.middleware("http")
+    async def request_context(request: Request, call_next):
+        rid = bind_request(request.headers.get(REQUEST_ID_HEADER))
+        start = time.perf_counter()
+        response = await call_next(request)
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        HTTP_SECONDS.labels(request.method, path).observe(time.perf_counter() - start)
+        response.headers[REQUEST_ID_HEADER] = rid
+        return response
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
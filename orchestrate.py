@@ -1,8 +1,23 @@
 import os
 import json
+import time
+import asyncio
+from contextlib import contextmanager
+import httpx
 import requests
-import snowflake.connector
 import pandas as pd
+import dq_rules
+import watermarks
+import severity_model
+import population_stats
+import dq_pushdown
+import dq_runs
+import dq_summary
+import metrics
+import read_replica
+from dq_writer import BulkWriter
+from column_dictionary import ColumnDictionaryCache
+from db_pool import get_pool
 from dotenv import load_dotenv
 
 # -------------------------------
@@ -15,148 +30,445 @@ LLM_API_URL = os.getenv(
 )
 
 # -------------------------------
-# Connect to Snowflake
+# Snowflake connection pool
+# (connections are checked out per request, never shared across threads)
 # -------------------------------
-conn = snowflake.connector.connect(
-    user=os.getenv("SNOWFLAKE_USER"),
-    password=os.getenv("SNOWFLAKE_PASSWORD"),
-    account=os.getenv("SNOWFLAKE_ACCOUNT"),
-    warehouse=os.getenv("SNOWFLAKE_WAREHOUSE"),
-    database=os.getenv("SNOWFLAKE_DATABASE"),
-    schema=os.getenv("SNOWFLAKE_SCHEMA"),
-)
-cur = conn.cursor()
+pool = get_pool()
 
 # -------------------------------
-# Simple severity classifier
+# Severity model (loaded once; rule severities if unavailable)
+# Only a MODEL_VERSION bundle trained on per-customer profiles is used;
+# anything else (e.g. the unversioned table-level pickle) is rejected
 # -------------------------------
-def classify_issue(issue_type, value=None, pct=None):
-    if issue_type == "MISSING" and pct is not None:
-        if pct > 0.3: return "High"
-        elif pct > 0.1: return "Medium"
-        else: return "Low"
-    if issue_type == "NEGATIVE" and value is not None: return "High"
-    if issue_type == "DUPLICATE": return "High"
-    if issue_type == "OUTLIER": return "Medium"
-    return "Low"
+SEVERITY_MODEL_ENABLED = os.getenv("SEVERITY_MODEL_ENABLED", "1") == "1"
+severity_scorer = severity_model.load_scorer() if SEVERITY_MODEL_ENABLED else severity_model.SeverityScorer(
+    info={"loaded": False, "reason": "disabled by SEVERITY_MODEL_ENABLED"}
+)
 
 # -------------------------------
 # Fetch customer data
 # -------------------------------
+BATCH_SIZE = int(os.getenv("ORCHESTRATOR_BATCH_SIZE", "500"))
+
+# CHECK_MODE=pushdown evaluates the rules as SQL aggregates in the warehouse
+# instead of fetching every row into pandas
+CHECK_MODE = os.getenv("CHECK_MODE", "pandas").lower()
+PUSHDOWN_DIALECT = dq_pushdown.dialect_for(os.getenv("DB_BACKEND", "snowflake").lower())
+
+def _placeholders(n):
+    return ", ".join(["%s"] * n)
+
+# Optional local snapshot of the rule tables (REPLICA_DIR); writes still go to the warehouse
+replica = read_replica.ReadReplica(pool, read_replica.REPLICA_DIR) if read_replica.REPLICA_DIR else None
+
+def fetch_customers_data(sk_ids):
+    # One set-based query per rule table for the whole batch
+    # (linked tables such as SAMPLE_INSTALLMENTS are joined through SK_ID_PREV)
+    ids = [int(x) for x in sk_ids]
+    if replica is not None:
+        with metrics.stage("fetch"):
+            frames = replica.fetch(ids)
+        if frames is not None:
+            return frames
+    ph = _placeholders(len(ids))
+    frames = {}
+    with metrics.stage("fetch"), pool.connection() as conn:
+        for table in dq_rules.tables():
+            sql, key = dq_rules.source_query(table)
+            frames[table] = dq_rules.source_frame(
+                pd.read_sql(f"{sql} WHERE {key} IN ({ph})", conn, params=ids)
+            )
+    return frames
+
 def fetch_customer_data(sk_id):
-    app_df = pd.read_sql(f"SELECT * FROM SAMPLE_APPLICATION WHERE SK_ID_CURR = {sk_id}", conn)
-    bureau_df = pd.read_sql(f"SELECT * FROM SAMPLE_BUREAU WHERE SK_ID_CURR = {sk_id}", conn)
-    return app_df, bureau_df
+    return fetch_customers_data([sk_id])
+
+def fetch_column_descriptions():
+    with pool.cursor() as cur:
+        cur.execute("SELECT TABLE_NAME, ROW_NAME, DESCRIPTION FROM COLUMN_DICTIONARY")
+        return {(t, c): d for t, c, d in cur.fetchall()}
+
+# Loaded once, refreshed on TTL or via the API's invalidate endpoint
+column_descriptions = ColumnDictionaryCache(
+    fetch_column_descriptions,
+    ttl=int(os.getenv("COLUMN_DICTIONARY_TTL", "3600")),
+)
 
 # -------------------------------
-# Process one customer
+# Population statistics for OUTLIER / DUPLICATE checks
+# (full-table scan on first use, reloaded in the background every refresh period)
+# -------------------------------
+population = population_stats.PopulationStatsCache(
+    lambda: population_stats.load(pool),
+    refresh=int(os.getenv("POPULATION_STATS_REFRESH", "3600")),
+)
+
+# -------------------------------
+# LLM call
+# -------------------------------
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+ORCHESTRATOR_CONCURRENCY = int(os.getenv("ORCHESTRATOR_CONCURRENCY", "32"))
+
+# Optional packed endpoint (llm-gemini /analyze_batch); unset = one call per customer
+LLM_BATCH_API_URL = os.getenv("LLM_BATCH_API_URL")
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "20"))
+
+# Keep-alive session for the sync path
+http = requests.Session()
+
+def _llm_payload(sk_id, payload_checks):
+    payload = {"sk_id": int(sk_id), "issues": payload_checks}
+    metrics.debug_log(f"PAYLOAD FOR {LLM_API_URL}", json.dumps(payload, indent=2))
+    return payload
+
+def _suggestion_rows(sk_id, payload_checks, llm):
+    metrics.debug_log(f"LLM RESPONSE FOR CUSTOMER {sk_id}", json.dumps(llm, indent=2))
+
+    raw_output = llm.get("raw_output", "")
+    suggestions = llm.get("parsed_json", [])
+    if isinstance(suggestions, dict):
+        suggestions = [suggestions]
+
+    return [
+        (
+            payload_checks[0]["table"],
+            payload_checks[0]["column"],
+            int(sk_id),
+            json.dumps(payload_checks),
+            raw_output,
+            json.dumps(suggestion),
+            suggestion.get("confidence", 0.0),
+            suggestion.get("root_cause_hypothesis"),
+            json.dumps(suggestion.get("lineage_hypothesis", []))
+        )
+        for suggestion in suggestions
+    ]
+
+def request_suggestions(sk_id, payload_checks):
+    payload = _llm_payload(sk_id, payload_checks)
+    with _timed_llm_call("analyze_combined"):
+        resp = http.post(LLM_API_URL, json=payload, headers=metrics.request_headers(),
+                         timeout=(LLM_CONNECT_TIMEOUT, LLM_TIMEOUT))
+        resp.raise_for_status()
+    return _suggestion_rows(sk_id, payload_checks, resp.json())
+
+@contextmanager
+def _timed_llm_call(endpoint):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        metrics.LLM_ERRORS.labels(endpoint).inc()
+        raise
+    finally:
+        metrics.LLM_SECONDS.labels(endpoint).observe(time.perf_counter() - start)
+
+def _llm_groups(payloads):
+    items = list(payloads.items())
+    return [items[i:i + LLM_BATCH_SIZE] for i in range(0, len(items), LLM_BATCH_SIZE)]
+
+def _batch_body(group):
+    print(f"📤 [{metrics.request_id()}] Sending {len(group)} customer(s) to LLM batch API")
+    return {"customers": [{"sk_id": int(sk_id), "issues": checks} for sk_id, checks in group]}
+
+def _record_batch_response(results, writer, group, body):
+    by_id = {int(r["sk_id"]): r for r in body.get("results", [])}
+    for sk_id, payload_checks in group:
+        llm = by_id.get(int(sk_id))
+        if llm is None:
+            _record_llm_result(results, writer, sk_id, error="missing from batch response")
+        else:
+            _record_llm_result(results, writer, sk_id, rows=_suggestion_rows(sk_id, payload_checks, llm))
+
+def _use_batch_api(payloads):
+    return bool(LLM_BATCH_API_URL) and len(payloads) > 1
+
 # -------------------------------
-def process_customer(sk_id: int):
-    # 🧹 Delete old anomalies & suggestions
-    cur.execute("DELETE FROM DQ_ANOMALIES WHERE SK_ID_CURR = %s", (sk_id,))
-    cur.execute("DELETE FROM DQ_AI_SUGGESTIONS WHERE SK_ID_CURR = %s", (sk_id,))
-    conn.commit()
-
-    app_df, bureau_df = fetch_customer_data(sk_id)
-    all_checks = []
-
-    # --- Application table checks ---
-    for col in ["AMT_ANNUITY", "AMT_CREDIT", "AMT_INCOME_TOTAL", "DAYS_EMPLOYED"]:
-        vals = app_df[col].dropna()
-        missing_pct = 1 - len(vals) / len(app_df) if len(app_df) else 0
-        if missing_pct > 0:
-            sev = classify_issue("MISSING", pct=missing_pct)
-            all_checks.append(("SAMPLE_APPLICATION", col, "MISSING", sev, round(missing_pct*100, 1)))
-        for v in vals:
-            if v < 0:
-                sev = classify_issue("NEGATIVE", value=v)
-                all_checks.append(("SAMPLE_APPLICATION", col, "NEGATIVE", sev, v))
-
-    # --- Bureau table checks ---
-    for col in ["AMT_CREDIT_SUM", "AMT_ANNUITY"]:
-        vals = bureau_df[col].dropna()
-        missing_pct = 1 - len(vals) / len(bureau_df) if len(bureau_df) else 0
-        if missing_pct > 0:
-            sev = classify_issue("MISSING", pct=missing_pct)
-            all_checks.append(("SAMPLE_BUREAU", col, "MISSING", sev, round(missing_pct*100, 1)))
-        for v in vals:
-            if v < 0:
-                sev = classify_issue("NEGATIVE", value=v)
-                all_checks.append(("SAMPLE_BUREAU", col, "NEGATIVE", sev, v))
+# Pipeline stages (shared by sync & async paths)
+# -------------------------------
+def _check_stage(sk_ids, frames=None, llm=True, force=False):
+    results = {sk_id: {"sk_id": sk_id, "status": "processed", "anomalies": 0, "suggestions": 0}
+               for sk_id in sk_ids}
+    writer = BulkWriter()
+    stats = population.get()
+    profiles = None
+
+    if frames is None and CHECK_MODE == "pushdown":
+        # -------------------------------
+        # Aggregates computed in the warehouse; only offending values come back.
+        # There are no rows to hash, so push-down runs neither skip unchanged
+        # customers nor write watermarks.
+        # -------------------------------
+        with metrics.stage("checks"), pool.connection() as conn:
+            anomalies, profiles, present = dq_pushdown.run_checks(conn, sk_ids, PUSHDOWN_DIALECT, population=stats)
+        for sk_id in sk_ids:
+            if sk_id not in present:
+                results[sk_id]["status"] = "no_data"
+        hashes = {}
+    else:
+        if frames is None:
+            frames = fetch_customers_data(sk_ids)
+
+        # -------------------------------
+        # Skip customers whose source rows are unchanged since the last run
+        # -------------------------------
+        hashes = watermarks.content_hashes(frames, population=stats)
+        for sk_id in sk_ids:
+            if sk_id not in hashes:
+                results[sk_id]["status"] = "no_data"
+        if not force and hashes:
+            stored = watermarks.load_watermarks(pool, list(hashes))
+            unchanged = {k for k, h in hashes.items() if stored.get(k) == h}
+            if unchanged:
+                for sk_id in unchanged:
+                    results[sk_id]["status"] = "unchanged"
+                    del hashes[sk_id]
+                frames = {t: df[~df["SK_ID_CURR"].isin(unchanged)] for t, df in frames.items()}
+        with metrics.stage("checks"):
+            anomalies = dq_rules.run_checks(frames, population=stats)
+
+    if stats is None:
+        # without population stats the outlier/duplicate checks are skipped,
+        # so the result is incomplete and must not be watermarked
+        hashes = {}
+    if not llm:
+        # a checks-only run doesn't produce suggestions, so it can't mark a customer done
+        hashes = {}
+
+    # 🔁 The new run replaces the published anomalies in the same transaction as its
+    # writes; superseded rows are compacted in the background. Suggestions are only
+    # replaced once the customer's LLM result is in (see _record_llm_result), so
+    # checks-only runs and failed LLM calls keep the published ones.
+    replaced = [sk_id for sk_id in sk_ids if results[sk_id]["status"] != "unchanged"]
+    writer.replace_customers(replaced, suggestions=False)
+
+    if severity_scorer.uses_model and not anomalies.empty:
+        with metrics.stage("severity"):
+            anomalies = dq_rules.score_severity(anomalies, frames, severity_scorer,
+                                                population=stats, profiles=profiles)
 
     # -------------------------------
-    # Insert anomalies & build payload
+    # Build anomaly rows & payloads
     # -------------------------------
-    payload_checks = []
-    for table_name, col, issue_type, severity, detail in all_checks:
-        cur.execute("""
-            SELECT DESCRIPTION 
-            FROM COLUMN_DICTIONARY 
-            WHERE TABLE_NAME=%s AND ROW_NAME=%s
-        """, (table_name, col))
-        desc_row = cur.fetchone()
-        column_desc = desc_row[0] if desc_row else "No description available"
-
-        anomaly_details = {"issue_type": issue_type, "detail": detail}
-        cur.execute("""
-            INSERT INTO DQ_ANOMALIES
-            (TABLE_NAME, COLUMN_NAME, SK_ID_CURR, SK_ID_PREV, ANOMALY_TYPE, ANOMALY_DETAILS, TIMESTAMP)
-            SELECT %s, %s, %s, %s, %s, PARSE_JSON(%s), CURRENT_TIMESTAMP
-        """, (
-            table_name, col, int(sk_id), None,
-            issue_type, json.dumps(anomaly_details)
+    payloads = {}
+    for a in anomalies.itertuples(index=False):
+        sk_id = int(a.SK_ID_CURR)
+        sk_id_prev = None if pd.isna(a.SK_ID_PREV) else int(a.SK_ID_PREV)
+        anomaly_details = {"issue_type": a.ANOMALY_TYPE, "detail": a.DETAIL, "severity": a.SEVERITY}
+        writer.add_anomaly((
+            a.TABLE_NAME, a.COLUMN_NAME, sk_id, sk_id_prev,
+            a.ANOMALY_TYPE, json.dumps(anomaly_details, default=float)
         ))
-        conn.commit()
-
-        payload_checks.append({
-            "table": table_name,
-            "column": col,
-            "desc": column_desc,
-            "summary": f"{severity} severity {issue_type} issue: {detail}"
+        summary = f"{a.SEVERITY} severity {a.ANOMALY_TYPE} issue: {a.DETAIL}"
+        if sk_id_prev is not None:
+            summary += f" (SK_ID_PREV {sk_id_prev})"
+        payloads.setdefault(sk_id, []).append({
+            "table": a.TABLE_NAME,
+            "column": a.COLUMN_NAME,
+            "desc": column_descriptions.get(a.TABLE_NAME, a.COLUMN_NAME),
+            "summary": summary
         })
+    for sk_id, payload_checks in payloads.items():
+        results[sk_id]["anomalies"] = len(payload_checks)
+    if llm:
+        # No anomalies, no LLM call: their (now empty) suggestions are final
+        writer.replace_suggestions([sk_id for sk_id in replaced if sk_id not in payloads])
+
+    return results, writer, payloads, hashes
+
+def _record_llm_result(results, writer, sk_id, rows=None, error=None):
+    if error is not None:
+        error = str(error) or repr(error)  # some httpx errors have an empty message
+        print(f"❌ [{metrics.request_id()}] Error sending to LLM for customer {sk_id}: {error}")
+        results[sk_id]["status"] = "llm_failed"
+        results[sk_id]["error"] = error
+        return
+    writer.add_suggestions(rows)
+    writer.replace_suggestions([sk_id])
+    results[sk_id]["suggestions"] = len(rows)
+
+def _persist_stage(writer, payloads, results, hashes):
+    # Watermarks only for customers that completed (LLM failures get retried)
+    if hashes:
+        watermarks.ensure_table(pool)  # forced runs never read it first
+    dq_runs.ensure_tables(pool)
+    dq_summary.ensure_table(pool)
+    for sk_id, content_hash in hashes.items():
+        if results[sk_id]["status"] == "processed":
+            writer.add_watermark(sk_id, content_hash)
 
     # -------------------------------
-    # Send combined payload to LLM
+    # Single-transaction flush
     # -------------------------------
-    payload = {"sk_id": int(sk_id), "issues": payload_checks}
-    print(f"\n📤 Sending to LLM API: {LLM_API_URL}")
-    print(f"Payload:\n{json.dumps(payload, indent=2)}\n")
+    with metrics.stage("write"), pool.connection() as conn:
+        written = writer.flush(conn)
+    for result in results.values():
+        metrics.CUSTOMERS.labels(result["status"]).inc()
+    print(f"✅ [{metrics.request_id()}] Stored {written['suggestions']} AI suggestion(s) "
+          f"for {len(payloads)} customer(s)")
 
-    try:
-        resp = requests.post(LLM_API_URL, json=payload)
-        print(f"📥 Response status: {resp.status_code}")
-        resp.raise_for_status()
-        llm = resp.json()
-        print(f"📥 Raw LLM response: {json.dumps(llm, indent=2)}")
-
-        raw_output = llm.get("raw_output", "")
-        suggestions = llm.get("parsed_json", [])
-        if isinstance(suggestions, dict):
-            suggestions = [suggestions]
-
-        for suggestion in suggestions:
-            cur.execute("""
-                INSERT INTO DQ_AI_SUGGESTIONS
-                (TABLE_NAME, COLUMN_NAME, SK_ID_CURR, ISSUE_DESCRIPTION, RAW_LLM_OUTPUT, AI_SUGGESTION, 
-                 CONFIDENCE_SCORE, ROOT_CAUSE_HYPOTHESIS, LINEAGE_HYPOTHESIS, TIMESTAMP)
-                SELECT %s, %s, %s, %s, %s, PARSE_JSON(%s), %s, %s, PARSE_JSON(%s), CURRENT_TIMESTAMP
-            """, (
-                payload_checks[0]["table"],
-                payload_checks[0]["column"],
-                int(sk_id),
-                json.dumps(payload_checks),
-                raw_output,
-                json.dumps(suggestion),
-                suggestion.get("confidence", 0.0),
-                suggestion.get("root_cause_hypothesis"),
-                json.dumps(suggestion.get("lineage_hypothesis", []))
-            ))
-            conn.commit()
-
-        print(f"✅ Stored {len(suggestions)} AI suggestion(s) for customer {sk_id}")
-
-    except Exception as e:
-        print(f"❌ Error sending to LLM or inserting suggestions: {e}")
+def _failed(batch, e):
+    print(f"❌ [{metrics.request_id()}] Batch of {len(batch)} customer(s) failed: {e}")
+    metrics.CUSTOMERS.labels("failed").inc(len(batch))
+    return [{"sk_id": sk_id, "status": "failed", "anomalies": 0,
+             "suggestions": 0, "error": str(e)} for sk_id in batch]
+
+def _batches(sk_ids):
+    # Deduplicate while keeping order, then work in BATCH_SIZE chunks
+    sk_ids = list(dict.fromkeys(int(x) for x in sk_ids))
+    return [sk_ids[i:i + BATCH_SIZE] for i in range(0, len(sk_ids), BATCH_SIZE)]
+
+# -------------------------------
+# Process a batch of customers
+# -------------------------------
+def _process_batch(sk_ids, force=False):
+    results, writer, payloads, hashes = _check_stage(sk_ids, force=force)
+
+    # -------------------------------
+    # Send combined payloads to LLM
+    # -------------------------------
+    with metrics.stage("llm"):
+        if _use_batch_api(payloads):
+            for group in _llm_groups(payloads):
+                try:
+                    with _timed_llm_call("analyze_batch"):
+                        resp = http.post(LLM_BATCH_API_URL, json=_batch_body(group),
+                                         headers=metrics.request_headers(),
+                                         timeout=(LLM_CONNECT_TIMEOUT, LLM_TIMEOUT))
+                        resp.raise_for_status()
+                    _record_batch_response(results, writer, group, resp.json())
+                except Exception as e:
+                    for sk_id, _ in group:
+                        _record_llm_result(results, writer, sk_id, error=e)
+        else:
+            for sk_id, payload_checks in payloads.items():
+                try:
+                    rows = request_suggestions(sk_id, payload_checks)
+                    _record_llm_result(results, writer, sk_id, rows=rows)
+                except Exception as e:
+                    _record_llm_result(results, writer, sk_id, error=e)
+
+    _persist_stage(writer, payloads, results, hashes)
+    return [results[sk_id] for sk_id in sk_ids]
+
+def process_customers(sk_ids, force=False):
+    results = []
+    for batch in _batches(sk_ids):
+        try:
+            results.extend(_process_batch(batch, force))
+        except Exception as e:
+            results.extend(_failed(batch, e))
+    return results
+
+# -------------------------------
+# Process one customer
+# -------------------------------
+def process_customer(sk_id: int, force=False):
+    return process_customers([sk_id], force)[0]
+
+# -------------------------------
+# Incremental run: customers changed since T
+# -------------------------------
+def _refresh_replica():
+    # A changed-since run must not check the replica's older copy of the rows it was asked about
+    if replica is not None:
+        replica.refresh(background=False)
+
+def process_changed_since(since, force=False):
+    _refresh_replica()
+    return process_customers(watermarks.changed_since(pool, since), force)
+
+# -------------------------------
+# Async pipeline
+# DB stages run in worker threads on pooled connections; LLM calls share
+# one keep-alive client and are bounded by a semaphore.
+# -------------------------------
+_async_client = None
+_llm_semaphore = None
+
+def get_async_client():
+    global _async_client, _llm_semaphore
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=ORCHESTRATOR_CONCURRENCY,
+                max_keepalive_connections=ORCHESTRATOR_CONCURRENCY,
+            ),
+        )
+        _llm_semaphore = asyncio.Semaphore(ORCHESTRATOR_CONCURRENCY)
+    return _async_client
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+async def request_suggestions_async(sk_id, payload_checks):
+    client = get_async_client()
+    payload = _llm_payload(sk_id, payload_checks)
+    async with _llm_semaphore:
+        with _timed_llm_call("analyze_combined"):
+            resp = await client.post(LLM_API_URL, json=payload, headers=metrics.request_headers())
+            resp.raise_for_status()
+    return _suggestion_rows(sk_id, payload_checks, resp.json())
+
+async def _process_batch_async(sk_ids, frames=None, llm=True, force=False, on_stage=None):
+    # on_stage(stage, payloads) is called as the batch enters "llm" and "persist"
+    results, writer, payloads, hashes = await asyncio.to_thread(_check_stage, sk_ids, frames, llm, force)
+    if on_stage:
+        on_stage("llm", payloads)
+    if not llm:
+        payloads = {}
+
+    async def suggest(sk_id, payload_checks):
+        try:
+            rows = await request_suggestions_async(sk_id, payload_checks)
+            _record_llm_result(results, writer, sk_id, rows=rows)
+        except Exception as e:
+            _record_llm_result(results, writer, sk_id, error=e)
+
+    async def suggest_group(group):
+        client = get_async_client()
+        try:
+            async with _llm_semaphore:
+                with _timed_llm_call("analyze_batch"):
+                    resp = await client.post(LLM_BATCH_API_URL, json=_batch_body(group),
+                                             headers=metrics.request_headers())
+                    resp.raise_for_status()
+            _record_batch_response(results, writer, group, resp.json())
+        except Exception as e:
+            for sk_id, _ in group:
+                _record_llm_result(results, writer, sk_id, error=e)
+
+    with metrics.stage("llm"):
+        if _use_batch_api(payloads):
+            await asyncio.gather(*(suggest_group(g) for g in _llm_groups(payloads)))
+        else:
+            await asyncio.gather(*(suggest(sk_id, checks) for sk_id, checks in payloads.items()))
+    if on_stage:
+        on_stage("persist", payloads)
+    await asyncio.to_thread(_persist_stage, writer, payloads, results, hashes)
+    return [results[sk_id] for sk_id in sk_ids]
+
+async def process_customers_async(sk_ids, force=False):
+    batches = _batches(sk_ids)
+    outcomes = await asyncio.gather(*(_process_batch_async(b, force=force) for b in batches),
+                                    return_exceptions=True)
+    results = []
+    for batch, outcome in zip(batches, outcomes):
+        results.extend(_failed(batch, outcome) if isinstance(outcome, Exception) else outcome)
+    return results
+
+async def process_customer_async(sk_id: int, force=False):
+    return (await process_customers_async([sk_id], force))[0]
+
+async def process_changed_since_async(since, force=False):
+    await asyncio.to_thread(_refresh_replica)
+    sk_ids = await asyncio.to_thread(watermarks.changed_since, pool, since)
+    return await process_customers_async(sk_ids, force)
 
 # -------------------------------
 # MAIN (for standalone runs)
@@ -164,5 +476,4 @@ def process_customer(sk_id: int):
 if __name__ == "__main__":
     test_sk_id = 171559
     process_customer(test_sk_id)
-    cur.close()
-    conn.close()
+    pool.close_all()
@@ -1,22 +1,210 @@
 # orchestrator_api.py
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Response
 from pydantic import BaseModel
-from orchestrate import process_customer  # reuse your existing function
+import pandas as pd
+from orchestrate import (  # reuse your existing functions
+    process_customer_async, process_customers_async, process_changed_since_async, close_async_client,
+    column_descriptions, pool, population, replica, severity_scorer,
+)
+from scan import SCAN_CHUNK_ROWS, SCAN_JOBS, start_scan_job
+from jobs import JobQueue, QueueFull
+from dq_writer import WRITE_STATS
+import dq_runs
+import dq_summary
+import metrics
+from severity_model import FEATURES
 
-app = FastAPI(title="Orchestrator API")
+job_queue = JobQueue()
+compactor = dq_runs.Compactor(pool)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    job_queue.start()
+    compactor.start()
+    population.refresh()  # warm up in the background
+    if replica is not None:
+        replica.refresh()
+    yield
+    await job_queue.stop()
+    compactor.stop()
+    await close_async_client()
+
+app = FastAPI(title="Orchestrator API", lifespan=lifespan)
+metrics.instrument(app)
 
 class ProcessRequest(BaseModel):
     sk_id: int
+    force: bool = False
+    wait: bool = False  # run inline instead of queueing
 
 class ProcessResponse(BaseModel):
     status: str
     sk_id: int
+    job_id: Optional[str] = None
+    deduplicated: bool = False
+
+class BatchProcessRequest(BaseModel):
+    sk_ids: List[int]
+    force: bool = False
+
+class ChangedSinceRequest(BaseModel):
+    since: datetime
+    force: bool = False
+
+class CustomerStatus(BaseModel):
+    sk_id: int
+    status: str
+    anomalies: int = 0
+    suggestions: int = 0
+    error: Optional[str] = None
+
+class BatchProcessResponse(BaseModel):
+    processed: int
+    failed: int
+    results: List[CustomerStatus]
+
+class ColumnProfile(BaseModel):
+    missing_pct: float
+    dup_rate: float = 0.0
+    zscore_outlier_pct: float = 0.0
+
+class SeverityRequest(BaseModel):
+    profiles: List[ColumnProfile]
+
+class ScanRequest(BaseModel):
+    chunk_rows: int = SCAN_CHUNK_ROWS
+    llm: bool = True
+    force: bool = False
+
+def _batch_response(results):
+    failed = sum(1 for r in results if r["status"] in ("failed", "llm_failed"))
+    return {"processed": len(results) - failed, "failed": failed, "results": results}
 
 @app.get("/healthz")
 def health():
     return {"status": "ok"}
 
-@app.post("/process_customer", response_model=ProcessResponse)
-def process(request: ProcessRequest):
-    process_customer(request.sk_id)
-    return {"status": "processed", "sk_id": request.sk_id}
+@app.get("/pool_stats")
+def pool_stats():
+    return pool.stats()
+
+@app.get("/writer_stats")
+def writer_stats():
+    return WRITE_STATS
+
+@app.get("/column_dictionary/stats")
+def column_dictionary_stats():
+    return column_descriptions.stats()
+
+@app.post("/column_dictionary/invalidate")
+def column_dictionary_invalidate():
+    column_descriptions.invalidate()
+    return {"status": "invalidated"}
+
+@app.get("/population_stats")
+def population_stats():
+    return population.stats()
+
+@app.post("/population_stats/refresh")
+def population_stats_refresh():
+    population.refresh()
+    return {"status": "refreshing"}
+
+@app.get("/replica")
+def replica_stats():
+    return replica.stats() if replica is not None else {"enabled": False}
+
+@app.post("/replica/refresh")
+def replica_refresh(full: bool = False):
+    if replica is None:
+        raise HTTPException(status_code=404, detail="Read replica is disabled (REPLICA_DIR is not set)")
+    replica.refresh(full=full)
+    return {"status": "refreshing"}
+
+@app.get("/runs/compaction")
+def runs_compaction():
+    return compactor.stats()
+
+@app.post("/runs/compact")
+def runs_compact():
+    compactor.trigger()
+    return {"status": "compacting"}
+
+@app.get("/summary")
+def summary(since: Optional[str] = None, until: Optional[str] = None, table: Optional[str] = None,
+            anomaly_type: Optional[str] = None, severity: Optional[str] = None,
+            page: int = 0, page_size: int = 50):
+    dq_summary.ensure_table(pool)
+    filters = {"since": since, "until": until, "table": table,
+               "anomaly_type": anomaly_type, "severity": severity}
+    with pool.cursor() as cur:
+        totals = dq_summary.severity_totals(cur, filters)
+        rows, total_groups = dq_summary.portfolio_page(cur, filters, page, page_size)
+    columns = ["TABLE_NAME", "COLUMN_NAME", "ANOMALY_TYPE", "SEVERITY", "ANOMALIES"]
+    return {
+        "severity_totals": totals,
+        "total_groups": total_groups,
+        "page": page,
+        "rows": [dict(zip(columns, list(row[:4]) + [int(row[4])])) for row in rows],
+    }
+
+@app.post("/summary/rebuild")
+def summary_rebuild():
+    dq_summary.ensure_table(pool)
+    with pool.connection() as conn:
+        return dq_summary.rebuild(conn)
+
+@app.post("/process_customer", response_model=ProcessResponse, status_code=202)
+async def process(request: ProcessRequest, response: Response):
+    if request.wait:
+        response.status_code = 200
+        result = await process_customer_async(request.sk_id, request.force)
+        return {"status": result["status"], "sk_id": request.sk_id}
+    try:
+        job, deduplicated = job_queue.submit(request.sk_id, request.force, request_id=metrics.request_id())
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return {"status": job["status"], "sk_id": request.sk_id,
+            "job_id": job["job_id"], "deduplicated": deduplicated}
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return {**job, "queue_depth": job_queue.depth()}
+
+@app.post("/process_customers", response_model=BatchProcessResponse)
+async def process_batch(request: BatchProcessRequest):
+    return _batch_response(await process_customers_async(request.sk_ids, request.force))
+
+@app.post("/process_changed", response_model=BatchProcessResponse)
+async def process_changed(request: ChangedSinceRequest):
+    return _batch_response(await process_changed_since_async(request.since, request.force))
+
+@app.post("/scan")
+async def start_scan(request: ScanRequest):
+    return {"job_id": start_scan_job(request.chunk_rows, request.llm, request.force)}
+
+@app.get("/scan/{job_id}")
+def scan_status(job_id: str):
+    if job_id not in SCAN_JOBS:
+        raise HTTPException(status_code=404, detail="Unknown scan job")
+    return SCAN_JOBS[job_id]
+
+@app.get("/severity/model")
+def severity_model_info():
+    return severity_scorer.info
+
+@app.post("/severity/score")
+def severity_score(request: SeverityRequest):
+    profiles = pd.DataFrame([p.model_dump() for p in request.profiles], columns=FEATURES)
+    labels, confidence = severity_scorer.predict(profiles)
+    return {
+        "severities": labels.tolist(),
+        "confidence": [round(float(c), 4) for c in confidence],
+        "model": severity_scorer.uses_model,
+    }
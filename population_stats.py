@@ -0,0 +1,220 @@
+# population_stats.py
+import os
+import time
+import threading
+import numpy as np
+import pandas as pd
+import dq_rules
+from profiling import TableProfiler
+
+POPULATION_CHUNK_ROWS = int(os.getenv("POPULATION_CHUNK_ROWS", "100000"))
+POPULATION_SAMPLE_ROWS = int(os.getenv("POPULATION_SAMPLE_ROWS", "100000"))
+QUANTILES = [0.01, 0.25, 0.5, 0.75, 0.99]
+
+# -------------------------------
+# Key hashing
+# -------------------------------
+def key_hashes(values):
+    # Numeric keys are compared as float64 so the same id hashes the same
+    # whether it came back as int64 or (with NULLs present) float64
+    if pd.api.types.is_numeric_dtype(values):
+        values = values.astype("float64")
+    return pd.util.hash_pandas_object(values, index=False).to_numpy()
+
+# -------------------------------
+# Per-table statistics
+# -------------------------------
+class TableStats:
+    """
+    Population statistics of one table: mean / std / count / quantiles per
+    numeric column, and for each key column the hashes of key values that
+    occur more than once (with their counts). Per-customer lookups against
+    it are hash lookups, never population scans.
+    """
+
+    def __init__(self, table, rows, columns, duplicate_keys):
+        self.table = table
+        self.rows = rows
+        self.columns = columns  # DataFrame indexed by column name
+        self.duplicate_keys = duplicate_keys  # {key column: Series(count, index=hash)}
+
+    def moments(self, column):
+        """(mean, std) of `column`, or None when it has no usable spread."""
+        if column not in self.columns.index:
+            return None
+        mean, std = self.columns.at[column, "mean"], self.columns.at[column, "std"]
+        if not std > 0:
+            return None
+        return float(mean), float(std)
+
+    def zscores(self, df, column):
+        moments = self.moments(column)
+        if moments is None:
+            return None
+        mean, std = moments
+        return (pd.to_numeric(df[column], errors="coerce") - mean) / std
+
+    def duplicate_counts(self, df, column):
+        """Population occurrences of each row's key value (0 where unique)."""
+        index = self.duplicate_keys.get(column)
+        if index is None:
+            return None
+        counts = index.reindex(key_hashes(df[column])).fillna(0).to_numpy(dtype=int)
+        return np.where(df[column].isna().to_numpy(), 0, counts)
+
+    def summary(self):
+        return {
+            "rows": self.rows,
+            "columns": {
+                col: {k: (None if pd.isna(v) else float(v)) for k, v in stats.items()}
+                for col, stats in self.columns.to_dict(orient="index").items()
+            },
+            "duplicate_keys": {col: int(len(index)) for col, index in self.duplicate_keys.items()},
+        }
+
+def compute_table_stats(table, chunks, key_cols, sample_rows=POPULATION_SAMPLE_ROWS, seed=0):
+    """
+    Builds TableStats in one pass over `chunks`. Moments are streamed with
+    the profiler, quantiles come from a uniform bottom-k sample of at most
+    `sample_rows` rows, and keys are kept only as 8-byte hashes.
+    """
+    rng = np.random.default_rng(seed)
+    profiler = TableProfiler([], exclude=set(key_cols) | {dq_rules.CUSTOMER_KEY})
+    sample, priority = None, None
+    hashes = {col: [] for col in key_cols}
+
+    for chunk in chunks:
+        profiler.update(chunk)
+        for col in key_cols:
+            if col in chunk.columns:
+                hashes[col].append(key_hashes(chunk[col][chunk[col].notna()]))
+        if profiler.numeric:
+            numeric = chunk[profiler.numeric].apply(pd.to_numeric, errors="coerce")
+            p = rng.random(len(numeric))
+            if sample is not None:
+                numeric = pd.concat([sample, numeric], ignore_index=True)
+                p = np.concatenate([priority, p])
+            keep = np.argsort(p, kind="stable")[:sample_rows]
+            sample, priority = numeric.iloc[keep].reset_index(drop=True), p[keep]
+
+    columns = profiler.stats()
+    if sample is not None and not columns.empty:
+        quantiles = sample.quantile(QUANTILES).T
+        quantiles.columns = [f"p{int(q * 100):02d}" for q in QUANTILES]
+        columns = columns.join(quantiles)
+
+    duplicate_keys = {}
+    for col, parts in hashes.items():
+        if not parts:
+            continue
+        values, counts = np.unique(np.concatenate(parts), return_counts=True)
+        dup = counts > 1
+        duplicate_keys[col] = pd.Series(counts[dup], index=values[dup])
+
+    return TableStats(table, profiler.rows, columns, duplicate_keys)
+
+# -------------------------------
+# Population snapshot
+# -------------------------------
+class PopulationStats:
+    def __init__(self, tables, computed_at=None, duration=None):
+        self.tables = tables  # {table: TableStats}
+        self.computed_at = computed_at or time.time()
+        self.duration = duration
+
+    def get(self, table):
+        return self.tables.get(table)
+
+def load(pool, tables=None, chunk_rows=POPULATION_CHUNK_ROWS):
+    """Scans each rule table once (in chunks) and returns a PopulationStats."""
+    started = time.monotonic()
+    out = {}
+    for table in tables or dq_rules.tables():
+        with pool.connection() as conn:
+            chunks = pd.read_sql(f"SELECT * FROM {table}", conn, chunksize=chunk_rows)
+            out[table] = compute_table_stats(table, chunks, dq_rules.duplicate_key_columns(table))
+        print(f"✅ Population stats for {table}: {out[table].rows} rows")
+    return PopulationStats(out, duration=time.monotonic() - started)
+
+# -------------------------------
+# In-process cache with periodic refresh
+# -------------------------------
+class PopulationStatsCache:
+    """
+    Holds the latest PopulationStats. The first get() waits for a load;
+    after `refresh` seconds the next get() starts a background reload and
+    keeps serving the previous snapshot until it is ready.
+    """
+
+    def __init__(self, loader, refresh=3600, retry=60):
+        self.loader = loader  # callable returning PopulationStats
+        self.refresh_interval = refresh
+        self.retry = retry
+        self._stats = None
+        self._loaded_at = 0.0
+        self._failed_at = None
+        self._load_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._refreshing = False
+        self.loads = 0
+        self.failures = 0
+        self.last_error = None
+
+    def _recently_failed(self):
+        return self._failed_at is not None and time.monotonic() - self._failed_at < self.retry
+
+    def _load_locked(self):
+        try:
+            stats = self.loader()
+        except Exception as e:
+            print(f"⚠️ Could not load population stats: {e}")
+            self.failures += 1
+            self.last_error = str(e)
+            self._failed_at = time.monotonic()
+            return
+        self._stats = stats
+        self._loaded_at = time.monotonic()
+        self._failed_at = None
+        self.loads += 1
+
+    def _background_load(self):
+        try:
+            with self._load_lock:
+                self._load_locked()
+        finally:
+            self._refreshing = False
+
+    def refresh(self, background=True):
+        if not background:
+            with self._load_lock:
+                self._load_locked()
+            return
+        with self._state_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_load, daemon=True).start()
+
+    def get(self):
+        """Returns the current PopulationStats, or None if none could be loaded."""
+        if self._stats is None:
+            with self._load_lock:
+                # A load in progress (e.g. the startup warm-up) may have finished meanwhile
+                if self._stats is None and not self._recently_failed():
+                    self._load_locked()
+        elif time.monotonic() - self._loaded_at > self.refresh_interval and not self._recently_failed():
+            self.refresh()
+        return self._stats
+
+    def stats(self):
+        return {
+            "loaded": self._stats is not None,
+            "loads": self.loads,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "refreshing": self._refreshing,
+            "refresh_seconds": self.refresh_interval,
+            "age_seconds": round(time.monotonic() - self._loaded_at, 1) if self._stats is not None else None,
+            "load_seconds": round(self._stats.duration, 1) if self._stats and self._stats.duration else None,
+            "tables": {t: s.summary() for t, s in self._stats.tables.items()} if self._stats else {},
+        }
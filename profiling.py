@@ -0,0 +1,192 @@
+# profiling.py
+import numpy as np
+import pandas as pd
+
+# -------------------------------
+# Streaming column moments
+# -------------------------------
+class ColumnMoments:
+    """
+    Per-column count / mean / M2 accumulated chunk by chunk with the
+    parallel (Chan et al.) update, so mean and std over a whole table come
+    out of fixed memory.
+    """
+
+    def __init__(self):
+        self.count = None
+        self.mean = None
+        self.m2 = None
+
+    def update(self, numeric):
+        count = numeric.count().astype(float)
+        mean = numeric.mean().fillna(0.0)
+        m2 = (numeric.var(ddof=0) * count).fillna(0.0)
+        if self.count is None:
+            self.count, self.mean, self.m2 = count, mean, m2
+            return
+        if not count.index.equals(self.count.index):
+            # A column first seen in this chunk starts from zero moments
+            columns = self.count.index.union(count.index, sort=False)
+            self.count, self.mean, self.m2 = (s.reindex(columns, fill_value=0.0) for s in (self.count, self.mean, self.m2))
+            count, mean, m2 = (s.reindex(columns, fill_value=0.0) for s in (count, mean, m2))
+        total = self.count + count
+        delta = mean - self.mean
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.mean = (self.mean + delta * (count / total)).fillna(0.0)
+            self.m2 = self.m2 + m2 + delta ** 2 * (self.count * count / total).fillna(0.0)
+        self.count = total
+
+    def std(self):
+        # Sample std (ddof=1), matching pandas' Series.std()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.sqrt(self.m2 / (self.count - 1))
+
+# -------------------------------
+# Bounded distinct-key count
+# -------------------------------
+class DistinctCounter:
+    """
+    Counts distinct 64-bit key hashes in bounded memory: exact (a sorted
+    array of unique hashes) up to `exact_limit` values, then a HyperLogLog
+    with 2**precision one-byte registers (16 KB, ~0.8% relative error at
+    the default precision 14).
+    """
+
+    def __init__(self, exact_limit=1_000_000, precision=14):
+        self.exact_limit = exact_limit
+        self.precision = precision
+        self.exact = np.array([], dtype=np.uint64)
+        self.registers = None
+
+    def update(self, hashes):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if self.registers is None:
+            self.exact = np.unique(np.concatenate([self.exact, hashes]))
+            if len(self.exact) <= self.exact_limit:
+                return
+            self.registers = np.zeros(1 << self.precision, dtype=np.uint8)
+            hashes, self.exact = self.exact, np.array([], dtype=np.uint64)
+        p = self.precision
+        index = (hashes >> np.uint64(64 - p)).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - p)) - 1)
+        # Bit length of `rest` from its two 32-bit halves (exact in float64)
+        hi = (rest >> np.uint64(32)).astype(np.float64)
+        lo = (rest & np.uint64(0xFFFFFFFF)).astype(np.float64)
+        with np.errstate(divide="ignore"):
+            bits = np.where(hi > 0, 33 + np.floor(np.log2(hi)), np.where(lo > 0, 1 + np.floor(np.log2(lo)), 0))
+        rank = ((64 - p) - bits + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def count(self):
+        if self.registers is None:
+            return len(self.exact)
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.exp2(-self.registers.astype(float)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)  # linear counting for small cardinalities
+        return float(estimate)
+
+# -------------------------------
+# Table profile
+# -------------------------------
+class TableProfiler:
+    """
+    Two-pass streaming profile of one table.
+
+    Pass 1 (update): row count, null counts, numeric moments and a
+    DistinctCounter of key hashes for the duplicate rate. Pass 2
+    (update_outliers): counts of |z| > 3 against the final mean/std. Memory
+    is bounded by the columns and the counter, not by the row count; the
+    duplicate rate is exact up to the counter's exact_limit distinct keys
+    and a HyperLogLog estimate beyond it.
+    """
+
+    def __init__(self, key_cols, z_threshold=3.0, exclude=()):
+        self.key_cols = list(key_cols)
+        self.exclude = set(self.key_cols) | set(exclude)
+        self.z_threshold = z_threshold
+        self.rows = 0
+        self.columns = None
+        self.numeric = None
+        self.nulls = None
+        self.moments = ColumnMoments()
+        self.distinct_keys = DistinctCounter()
+        self.keyed_rows = 0
+        self.outliers = None
+
+    def update(self, chunk):
+        if self.columns is None:
+            self.columns = [c for c in chunk.columns if c not in self.exclude]
+            self.numeric = []
+            self.nulls = pd.Series(0, index=self.columns, dtype="int64")
+        # A column that is all NULL in a chunk arrives as object dtype, so
+        # numeric columns are picked up from whichever chunk first shows them
+        added = {c for c in self.columns if c not in self.numeric and pd.api.types.is_numeric_dtype(chunk[c])}
+        if added:
+            self.numeric = [c for c in self.columns if c in added or c in self.numeric]
+        self.rows += len(chunk)
+        self.nulls = self.nulls.add(chunk[self.columns].isna().sum(), fill_value=0)
+        if self.numeric:
+            self.moments.update(chunk[self.numeric].apply(pd.to_numeric, errors="coerce"))
+        keys = [k for k in self.key_cols if k in chunk.columns]
+        if keys:
+            self.distinct_keys.update(pd.util.hash_pandas_object(chunk[keys], index=False).to_numpy())
+            self.keyed_rows += len(chunk)
+
+    def update_outliers(self, chunk):
+        if not self.numeric:
+            return
+        values = chunk[self.numeric].apply(pd.to_numeric, errors="coerce")
+        std = self.moments.std()
+        std = std.where(std > 0)  # constant columns have no outliers
+        z = (values - self.moments.mean) / std
+        counts = (z.abs() > self.z_threshold).sum()
+        self.outliers = counts if self.outliers is None else self.outliers.add(counts, fill_value=0)
+
+    def dup_rate(self):
+        # Fraction of rows whose key already appeared earlier in the table
+        if not self.rows or not self.keyed_rows:
+            return 0.0
+        distinct = min(self.distinct_keys.count(), self.keyed_rows)
+        return (self.keyed_rows - distinct) / self.rows
+
+    def features(self):
+        if self.columns is None:
+            return pd.DataFrame(columns=["column", "missing_pct", "dup_rate", "zscore_outlier_pct"])
+        rows = max(self.rows, 1)
+        outliers = (self.outliers if self.outliers is not None else pd.Series(dtype=float))
+        outliers = outliers.reindex(self.columns).fillna(0)
+        return pd.DataFrame({
+            "column": self.columns,
+            "missing_pct": (self.nulls.reindex(self.columns) / rows).to_numpy(dtype=float),
+            "dup_rate": self.dup_rate(),
+            "zscore_outlier_pct": (outliers / rows).to_numpy(dtype=float),
+        })
+
+    def stats(self):
+        """Per numeric column mean / std / count, for reuse as population statistics."""
+        if not self.numeric:
+            return pd.DataFrame(columns=["mean", "std", "count"])
+        return pd.DataFrame({
+            "mean": self.moments.mean,
+            "std": self.moments.std(),
+            "count": self.moments.count,
+        })
+
+def profile_chunks(read_chunks, key_cols, exclude=()):
+    """
+    Profiles a table given `read_chunks`, a callable returning a fresh
+    iterator of DataFrame chunks (it is called once per pass). Columns in
+    `key_cols` or `exclude` (e.g. foreign ids) are not profiled.
+    """
+    profiler = TableProfiler(key_cols, exclude=exclude)
+    for chunk in read_chunks():
+        profiler.update(chunk)
+    for chunk in read_chunks():
+        profiler.update_outliers(chunk)
+    return profiler
+
+def compute_features(df, key_cols, exclude=()):
+    # In-memory convenience wrapper over the streaming profiler
+    return profile_chunks(lambda: [df], key_cols, exclude).features()
@@ -0,0 +1,344 @@
+# read_replica.py
+import os
+import json
+import time
+import threading
+import numpy as np
+import pandas as pd
+import dq_rules
+from watermarks import SOURCE_UPDATED_AT_COLUMN
+
+# -------------------------------
+# Settings (REPLICA_DIR unset = every fetch goes to the warehouse)
+# -------------------------------
+REPLICA_DIR = os.getenv("REPLICA_DIR")
+# Diff refresh period, and how often a full snapshot is taken instead
+# (a diff can't see customers whose rows were deleted)
+REPLICA_REFRESH = int(os.getenv("REPLICA_REFRESH", "900"))
+REPLICA_FULL_REFRESH = int(os.getenv("REPLICA_FULL_REFRESH", "86400"))
+REPLICA_CHUNK_ROWS = int(os.getenv("REPLICA_CHUNK_ROWS", "100000"))
+REPLICA_DIFF_IDS = 1000  # SK_ID_CURRs per IN (...) when re-reading changed customers
+
+KEY = dq_rules.CUSTOMER_KEY
+MANIFEST = "manifest.json"
+
+# -------------------------------
+# One table: an Arrow IPC file sorted by SK_ID_CURR, memory-mapped
+# -------------------------------
+class TableSnapshot:
+    """
+    Rows of one rule table as returned by dq_rules.source_query, sorted by
+    SK_ID_CURR. The file is memory-mapped, so opening it doesn't read the
+    rows; the sorted key column is the index and a lookup is two binary
+    searches per customer plus a take() of the matching rows.
+    """
+
+    def __init__(self, table, path):
+        import pyarrow as pa
+        self.table = table
+        self.path = path
+        self._source = pa.memory_map(path, "r")  # kept open: the columns point into the map
+        # Without the pandas metadata to_pandas() skips rebuilding the stored index
+        self.data = pa.ipc.open_file(self._source).read_all().replace_schema_metadata(None)
+        self.keys = self.data.column(KEY).to_numpy()
+        self.rows = self.data.num_rows
+
+    def lookup(self, sk_ids):
+        ids = np.unique(np.asarray(sk_ids, dtype=self.keys.dtype))
+        starts = np.searchsorted(self.keys, ids, side="left")
+        ends = np.searchsorted(self.keys, ids, side="right")
+        hits = ends > starts
+        if hits.sum() == 1:
+            # one customer's rows are contiguous: a zero-copy slice of the map
+            rows = self.data.slice(starts[hits][0], (ends - starts)[hits][0])
+        else:
+            rows = self.data.take(np.concatenate([np.arange(s, e) for s, e in zip(starts[hits], ends[hits])])
+                                  if hits.any() else np.empty(0, dtype=np.int64))
+        # per-call thread pool start-up costs more than converting a handful of rows
+        return rows.to_pandas(use_threads=False)
+
+    def updated_at_max(self):
+        if SOURCE_UPDATED_AT_COLUMN not in self.data.column_names or self.rows == 0:
+            return None
+        import pyarrow.compute as pc
+        value = pc.max(self.data.column(SOURCE_UPDATED_AT_COLUMN)).as_py()
+        return None if value is None else str(value)
+
+def _to_arrow(df, schema=None):
+    import pyarrow as pa
+    df = df[df[KEY].notna()].astype({KEY: "int64"})  # rows without a customer can't be looked up
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+def _write(table, data, directory):
+    # Written next to the live file and renamed over it; readers that still
+    # map the old file keep a valid view until they drop it
+    import pyarrow as pa
+    path = os.path.join(directory, f"{table}.arrow")
+    tmp = f"{path}.tmp"
+    data = data.sort_by(KEY).combine_chunks()
+    with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, data.schema) as writer:
+        writer.write_table(data)
+    os.replace(tmp, path)
+    return path
+
+# -------------------------------
+# Snapshot & diff
+# -------------------------------
+def snapshot_table(conn, table, directory, chunk_rows=REPLICA_CHUNK_ROWS, schema=None):
+    """
+    Copies the whole table to the replica. Rows are read in SK_ID_CURR order
+    and each chunk is appended to the IPC file as it arrives, so only one
+    chunk is held in memory. The schema is the first chunk's (or `schema`);
+    a later chunk that doesn't fit it (a column that was all NULL so far,
+    or ints that turn out to be floats) restarts the copy with the widened
+    schema.
+    """
+    import pyarrow as pa
+    sql, key = dq_rules.source_query(table)
+    path = os.path.join(directory, f"{table}.arrow")
+    tmp = f"{path}.tmp"
+    sink, writer = None, None
+    try:
+        for df in pd.read_sql(f"{sql} WHERE {key} IS NOT NULL ORDER BY {key}", conn, chunksize=chunk_rows):
+            chunk = _to_arrow(dq_rules.source_frame(df))
+            if writer is None:
+                schema = schema or chunk.schema
+                sink = pa.OSFile(tmp, "wb")
+                writer = pa.ipc.new_file(sink, schema)
+            try:
+                chunk = chunk.select(schema.names).cast(schema)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError, KeyError):
+                widened = pa.unify_schemas([schema, chunk.schema], promote_options="permissive")
+                if widened.equals(schema):
+                    raise
+                writer.close()
+                sink.close()
+                writer = sink = None
+                print(f"🔄 Schema of {table} widened mid-snapshot, copying it again")
+                return snapshot_table(conn, table, directory, chunk_rows, widened)
+            writer.write_table(chunk)
+        if writer is None:
+            empty = schema or _to_arrow(dq_rules.source_frame(pd.read_sql(f"{sql} WHERE 1 = 0", conn))).schema
+            sink = pa.OSFile(tmp, "wb")
+            writer = pa.ipc.new_file(sink, empty)
+        writer.close()
+        sink.close()
+        writer = sink = None
+        # Renamed over the live file; readers that still map it keep a valid view
+        os.replace(tmp, path)
+        return path
+    finally:
+        if writer is not None:
+            writer.close()
+        if sink is not None:
+            sink.close()
+
+def changed_customers(conn, table, since):
+    from_clause, key = dq_rules.source_from(table)
+    # >= so rows committed later with the same timestamp are not missed
+    sql = f"SELECT DISTINCT {key} FROM {from_clause} WHERE t.{SOURCE_UPDATED_AT_COLUMN} >= %s"
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, [since])
+        return sorted(int(row[0]) for row in cur.fetchall() if row[0] is not None)
+    finally:
+        cur.close()
+
+def diff_table(conn, snapshot, directory, since):
+    """
+    Re-reads every row of the customers with a row modified at or after
+    `since` and replaces their rows in the snapshot. Returns (path, customers).
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    changed = changed_customers(conn, snapshot.table, since)
+    if not changed:
+        return snapshot.path, 0
+
+    sql, key = dq_rules.source_query(snapshot.table)
+    parts = []
+    for i in range(0, len(changed), REPLICA_DIFF_IDS):
+        ids = changed[i:i + REPLICA_DIFF_IDS]
+        ph = ", ".join(["%s"] * len(ids))
+        parts.append(dq_rules.source_frame(pd.read_sql(f"{sql} WHERE {key} IN ({ph})", conn, params=ids)))
+    fresh = _to_arrow(pd.concat(parts, ignore_index=True), schema=snapshot.data.schema)
+
+    kept = snapshot.data.filter(pc.invert(pc.is_in(snapshot.data.column(KEY), pa.array(changed, pa.int64()))))
+    return _write(snapshot.table, pa.concat_tables([kept, fresh]), directory), len(changed)
+
+# -------------------------------
+# In-process replica with periodic refresh
+# -------------------------------
+class ReadReplica:
+    """
+    Local copy of the rule tables for per-customer fetches. Until every
+    table has a snapshot fetch() returns None and callers read the
+    warehouse. After `refresh` seconds the next fetch() starts a background
+    diff refresh (a full snapshot every `full_refresh` seconds, or for
+    tables without SOURCE_UPDATED_AT_COLUMN) and keeps serving the current
+    snapshots until the new ones are swapped in. Snapshots left in
+    `directory` by an earlier process are reused on startup.
+    """
+
+    def __init__(self, pool, directory, tables=None, refresh=REPLICA_REFRESH, full_refresh=REPLICA_FULL_REFRESH,
+                 retry=60):
+        self.pool = pool
+        self.directory = directory
+        self.tables = list(tables or dq_rules.tables())
+        self.refresh_interval = refresh
+        self.full_refresh_interval = full_refresh
+        self.retry = retry
+        self._snapshots = {}  # {table: TableSnapshot}, replaced as a whole
+        self._manifest = {}   # {table: {"updated_at_max", "full_at", "refreshed_at"}} (wall-clock times)
+        self._failed_at = None
+        self._load_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._refreshing = False
+        self.refreshes = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_refresh = None
+        self.lookups = 0
+        self.lookup_ms = 0.0
+        os.makedirs(directory, exist_ok=True)
+        self._open_existing()
+
+    # ---- files ----
+    def _manifest_path(self):
+        return os.path.join(self.directory, MANIFEST)
+
+    def _open_existing(self):
+        try:
+            with open(self._manifest_path()) as f:
+                manifest = json.load(f)
+            snapshots = {t: TableSnapshot(t, os.path.join(self.directory, f"{t}.arrow")) for t in self.tables}
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"⚠️ Ignoring the replica in {self.directory}: {e}")
+            return
+        if all(t in manifest for t in self.tables):
+            self._manifest, self._snapshots = manifest, snapshots
+            print(f"✅ Opened the read replica in {self.directory}")
+
+    def _save_manifest(self, manifest):
+        tmp = f"{self._manifest_path()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, self._manifest_path())
+
+    # ---- refresh ----
+    def _age(self):
+        refreshed = [m["refreshed_at"] for m in self._manifest.values()]
+        return time.time() - min(refreshed) if refreshed else None
+
+    def _recently_failed(self):
+        return self._failed_at is not None and time.monotonic() - self._failed_at < self.retry
+
+    def _refresh_locked(self, full=False):
+        started = time.monotonic()
+        snapshots, manifest = dict(self._snapshots), dict(self._manifest)
+        summary = {"full": [], "diff": {}}
+        try:
+            with self.pool.connection() as conn:
+                for table in self.tables:
+                    now = time.time()
+                    entry = manifest.get(table, {})
+                    current = snapshots.get(table)
+                    since = entry.get("updated_at_max")
+                    if (full or current is None or since is None
+                            or now - entry.get("full_at", 0) > self.full_refresh_interval):
+                        path = snapshot_table(conn, table, self.directory)
+                        entry = {"full_at": now}
+                        summary["full"].append(table)
+                    else:
+                        try:
+                            path, changed = diff_table(conn, current, self.directory, since)
+                        except Exception as e:
+                            # e.g. the source table gained a column; start over from a full copy
+                            print(f"⚠️ Diff refresh of {table} failed ({e}), taking a full snapshot")
+                            path, changed, entry = snapshot_table(conn, table, self.directory), None, {"full_at": now}
+                            summary["full"].append(table)
+                        if changed is not None:
+                            summary["diff"][table] = changed
+                            if not changed:
+                                manifest[table] = {**entry, "refreshed_at": now}
+                                continue
+                    snapshot = TableSnapshot(table, path)
+                    snapshots[table] = snapshot
+                    manifest[table] = {**entry, "updated_at_max": snapshot.updated_at_max() or since,
+                                       "refreshed_at": now}
+        except Exception as e:
+            print(f"⚠️ Could not refresh the read replica: {e}")
+            self.failures += 1
+            self.last_error = str(e)
+            self._failed_at = time.monotonic()
+            return
+        self._save_manifest(manifest)
+        self._snapshots, self._manifest = snapshots, manifest
+        self._failed_at = None
+        self.refreshes += 1
+        self.last_refresh = {**summary, "seconds": round(time.monotonic() - started, 2)}
+        print(f"✅ Read replica refreshed in {self.last_refresh['seconds']}s "
+              f"(full: {summary['full'] or 'none'}, changed customers: {summary['diff'] or 'none'})")
+
+    def _background_refresh(self, full):
+        try:
+            with self._load_lock:
+                self._refresh_locked(full)
+        finally:
+            self._refreshing = False
+
+    def refresh(self, background=True, full=False):
+        if not background:
+            with self._load_lock:
+                self._refresh_locked(full)
+            return
+        with self._state_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, args=(full,), daemon=True).start()
+
+    # ---- reads ----
+    def fetch(self, sk_ids):
+        """{table: DataFrame} for `sk_ids`, or None while the replica is incomplete."""
+        snapshots = self._snapshots
+        age = self._age()
+        if age is None or age > self.refresh_interval:
+            if not self._recently_failed():
+                self.refresh()
+        if len(snapshots) < len(self.tables):
+            return None
+        start = time.perf_counter()
+        frames = {table: snapshots[table].lookup(sk_ids) for table in self.tables}
+        self.lookups += 1
+        self.lookup_ms += (time.perf_counter() - start) * 1000
+        return frames
+
+    def stats(self):
+        snapshots, manifest = self._snapshots, self._manifest
+        age = self._age()
+        return {
+            "enabled": True,
+            "directory": self.directory,
+            "ready": len(snapshots) == len(self.tables),
+            "refreshing": self._refreshing,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_refresh": self.last_refresh,
+            "refresh_seconds": self.refresh_interval,
+            "full_refresh_seconds": self.full_refresh_interval,
+            "age_seconds": round(age, 1) if age is not None else None,
+            "lookups": self.lookups,
+            "avg_lookup_ms": round(self.lookup_ms / self.lookups, 3) if self.lookups else 0.0,
+            "tables": {
+                t: {
+                    "rows": s.rows,
+                    "bytes": os.path.getsize(s.path) if os.path.exists(s.path) else None,
+                    "updated_at_max": manifest.get(t, {}).get("updated_at_max"),
+                }
+                for t, s in snapshots.items()
+            },
+        }
@@ -0,0 +1,241 @@
+# scan.py
+import os
+import time
+import uuid
+import queue
+import asyncio
+import argparse
+import threading
+import pandas as pd
+import dq_rules
+import orchestrate
+from orchestrate import pool
+
+SCAN_CHUNK_ROWS = int(os.getenv("SCAN_CHUNK_ROWS", "50000"))
+SCAN_INFLIGHT = int(os.getenv("SCAN_INFLIGHT", "2"))
+
+KEY = dq_rules.CUSTOMER_KEY
+
+# -------------------------------
+# Streaming reads
+# -------------------------------
+def stream_table(conn, table, chunk_rows):
+    # Ordered by customer so chunks from different tables can be aligned;
+    # rows without a customer can't be aligned and are counted by null_key_rows()
+    sql, key = dq_rules.source_query(table)
+    cur = conn.cursor()
+    try:
+        cur.execute(f"{sql} WHERE {key} IS NOT NULL ORDER BY {key}")
+        columns = [d[0] for d in cur.description]
+        while True:
+            rows = cur.fetchmany(chunk_rows)
+            if not rows:
+                break
+            yield dq_rules.source_frame(pd.DataFrame(rows, columns=columns))
+    finally:
+        cur.close()
+
+def null_key_rows(conn, tables=None):
+    """{table: rows whose SK_ID_CURR is NULL} for the tables that have any."""
+    counts = {}
+    cur = conn.cursor()
+    try:
+        for table in tables or dq_rules.tables():
+            from_clause, key = dq_rules.source_from(table)
+            cur.execute(f"SELECT COUNT(*) FROM {from_clause} WHERE {key} IS NULL")
+            n = int(cur.fetchone()[0])
+            if n:
+                counts[table] = n
+    finally:
+        cur.close()
+    return counts
+
+def aligned_chunks(streams):
+    """
+    Merges per-table chunk streams (each ordered by SK_ID_CURR) into
+    {table: DataFrame} chunks that always hold every row of the customers
+    they contain. Memory stays at roughly one chunk per table. Rows with a
+    NULL SK_ID_CURR are dropped (a NaN cutoff would stall the merge).
+    """
+    iterators = {t: iter(s) for t, s in streams.items()}
+    buffers = {t: None for t in iterators}
+    done = set()
+
+    def pull(table):
+        while True:
+            try:
+                chunk = next(iterators[table])
+            except StopIteration:
+                done.add(table)
+                return
+            chunk = chunk[chunk[KEY].notna()]
+            if not chunk.empty:
+                break
+        buf = buffers[table]
+        buffers[table] = chunk if buf is None else pd.concat([buf, chunk], ignore_index=True)
+
+    for table in iterators:
+        pull(table)
+
+    while True:
+        live = [t for t in iterators if t not in done]
+        if not live:
+            rest = {t: b for t, b in buffers.items() if b is not None and not b.empty}
+            if rest:
+                yield rest
+            return
+
+        # The last customer of a live table may continue in its next chunk
+        cutoff = min(buffers[t][KEY].iloc[-1] for t in live)
+        out = {}
+        for table, buf in buffers.items():
+            if buf is None:
+                continue
+            mask = (buf[KEY] < cutoff).to_numpy()
+            out[table] = buf[mask]
+            buffers[table] = buf[~mask].reset_index(drop=True)
+        if any(not df.empty for df in out.values()):
+            yield out
+
+        for table in live:
+            if buffers[table][KEY].iloc[-1] <= cutoff:
+                pull(table)
+
+# -------------------------------
+# Scan pipeline
+# reader thread -> bounded queue -> checks -> LLM -> writer
+# -------------------------------
+def new_progress():
+    return {
+        "status": "running",
+        "chunks": 0,
+        "rows": 0,
+        "customers": 0,
+        "unchanged": 0,
+        "anomalies": 0,
+        "suggestions": 0,
+        "llm_failed": 0,
+        "failed": 0,
+        "null_key_rows": {},
+        "elapsed_s": 0.0,
+        "rows_per_sec": 0.0,
+    }
+
+def _read_chunks(chunk_rows, out_q, stop, progress):
+    try:
+        with pool.connection() as conn:
+            progress["null_key_rows"] = null_key_rows(conn)
+            if progress["null_key_rows"]:
+                print(f"⚠️ Skipping rows without SK_ID_CURR: {progress['null_key_rows']}")
+            streams = {t: stream_table(conn, t, chunk_rows) for t in dq_rules.tables()}
+            for chunk in aligned_chunks(streams):
+                if stop.is_set():
+                    break
+                out_q.put(chunk)
+    except Exception as e:
+        out_q.put(e)
+    finally:
+        out_q.put(None)
+
+async def run_scan_async(chunk_rows=SCAN_CHUNK_ROWS, llm=True, progress=None, force=False):
+    progress = progress if progress is not None else new_progress()
+    start = time.perf_counter()
+    chunks_q = queue.Queue(maxsize=SCAN_INFLIGHT)
+    stop = threading.Event()
+    reader = threading.Thread(target=_read_chunks, args=(chunk_rows, chunks_q, stop, progress), daemon=True)
+    reader.start()
+
+    inflight = asyncio.Semaphore(SCAN_INFLIGHT)
+    tasks = set()
+
+    async def process_chunk(frames):
+        try:
+            sk_ids = sorted(set().union(*(df[KEY].astype(int).tolist() for df in frames.values())))
+            rows = sum(len(df) for df in frames.values())
+            try:
+                results = await orchestrate._process_batch_async(sk_ids, frames, llm=llm, force=force)
+            except Exception as e:
+                results = orchestrate._failed(sk_ids, e)
+            progress["chunks"] += 1
+            progress["rows"] += rows
+            progress["customers"] += len(results)
+            for r in results:
+                progress["anomalies"] += r["anomalies"]
+                progress["suggestions"] += r["suggestions"]
+                if r["status"] in ("failed", "llm_failed", "unchanged"):
+                    progress[r["status"]] += 1
+            elapsed = time.perf_counter() - start
+            progress["elapsed_s"] = round(elapsed, 1)
+            progress["rows_per_sec"] = round(progress["rows"] / elapsed, 1) if elapsed else 0.0
+            print(f"🔎 Chunk {progress['chunks']}: {rows} rows, {len(results)} customers "
+                  f"({progress['rows_per_sec']} rows/sec)")
+        finally:
+            inflight.release()
+
+    error = None
+    try:
+        while True:
+            item = await asyncio.to_thread(chunks_q.get)
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                error = item
+                continue
+            await inflight.acquire()
+            task = asyncio.create_task(process_chunk(item))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+    finally:
+        stop.set()
+
+    if error is not None:
+        progress["status"] = "failed"
+        progress["error"] = str(error)
+        raise error
+    progress["status"] = "completed"
+    print(f"✅ Scan complete: {progress['rows']} rows, {progress['customers']} customers, "
+          f"{progress['anomalies']} anomalies in {progress['elapsed_s']}s "
+          f"({progress['rows_per_sec']} rows/sec)")
+    return progress
+
+# -------------------------------
+# Background scan jobs (used by the API)
+# -------------------------------
+SCAN_JOBS = {}
+_scan_tasks = set()
+
+def start_scan_job(chunk_rows=SCAN_CHUNK_ROWS, llm=True, force=False):
+    job_id = uuid.uuid4().hex
+    progress = new_progress()
+    SCAN_JOBS[job_id] = progress
+
+    async def run():
+        try:
+            await run_scan_async(chunk_rows, llm, progress, force)
+        except Exception as e:
+            print(f"❌ Scan {job_id} failed: {e}")
+
+    task = asyncio.get_running_loop().create_task(run())
+    _scan_tasks.add(task)
+    task.add_done_callback(_scan_tasks.discard)
+    return job_id
+
+# -------------------------------
+# CLI
+# -------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream all source tables through the DQ checks")
+    parser.add_argument("--chunk-rows", type=int, default=SCAN_CHUNK_ROWS)
+    parser.add_argument("--no-llm", action="store_true", help="run checks only, skip AI suggestions")
+    parser.add_argument("--force", action="store_true", help="reprocess customers whose data is unchanged")
+    args = parser.parse_args()
+
+    async def main():
+        try:
+            await run_scan_async(args.chunk_rows, llm=not args.no_llm, force=args.force)
+        finally:
+            await orchestrate.close_async_client()
+
+    asyncio.run(main())
+    pool.close_all()
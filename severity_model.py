@@ -0,0 +1,122 @@
+# severity_model.py
+import os
+import warnings
+import numpy as np
+import pandas as pd
+
+FEATURES = ["missing_pct", "dup_rate", "zscore_outlier_pct"]
+# Bump when the feature set / label scheme changes
+# 1: table-level profiles; 2: per-customer dq_rules.column_profiles()
+MODEL_VERSION = 2
+MODEL_PATH = os.getenv("DQ_SEVERITY_MODEL_PATH", "dq_severity_model.pkl")
+
+# -------------------------------
+# Heuristic fallback
+# (same labelling rule the trainer bootstraps its labels with)
+# -------------------------------
+def heuristic_severity(profiles):
+    missing = profiles["missing_pct"].to_numpy(dtype=float)
+    outlier = profiles["zscore_outlier_pct"].to_numpy(dtype=float)
+    return np.select(
+        [(missing > 0.4) | (outlier > 0.2), (missing > 0.1) | (outlier > 0.05)],
+        ["High", "Medium"],
+        default="Low",
+    ).astype(object)
+
+# -------------------------------
+# Model-backed scorer
+# -------------------------------
+class SeverityScorer:
+    """
+    Scores column profiles (FEATURES columns) with the trained RandomForest
+    in one predict_proba call per batch, or with heuristic_severity() when
+    no usable model is loaded.
+    """
+
+    def __init__(self, model=None, info=None):
+        self.model = model
+        self.info = info or {"loaded": False, "reason": "no model"}
+
+    @property
+    def uses_model(self):
+        return self.model is not None
+
+    def predict(self, profiles):
+        """
+        Returns (severity labels, confidence) arrays aligned with `profiles`.
+        """
+        if len(profiles) == 0:
+            return np.array([], dtype=object), np.array([], dtype=float)
+        if self.model is None:
+            return heuristic_severity(profiles), np.ones(len(profiles))
+        proba = self.model.predict_proba(profiles[FEATURES].astype(float))
+        best = proba.argmax(axis=1)
+        return self.model.classes_[best].astype(object), proba[np.arange(len(best)), best]
+
+def load_scorer(path=MODEL_PATH):
+    """
+    Loads the model once. Only the trainer's bundle
+    ({"model", "features", "model_version", "sklearn_version"}) is used;
+    falls back to the heuristic when the file is missing, unreadable, not a
+    bundle of MODEL_VERSION, trained on a different feature set or pickled
+    by another scikit-learn version.
+    """
+    try:
+        import joblib
+        import sklearn
+        from sklearn.exceptions import InconsistentVersionWarning
+    except ImportError as e:
+        return SeverityScorer(info={"loaded": False, "reason": f"scikit-learn unavailable: {e}"})
+
+    if not os.path.exists(path):
+        return SeverityScorer(info={"loaded": False, "reason": f"{path} not found"})
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        try:
+            obj = joblib.load(path)
+        except Exception as e:
+            print(f"⚠️ Could not load severity model: {e}")
+            return SeverityScorer(info={"loaded": False, "reason": str(e)})
+
+    if isinstance(obj, dict):
+        model = obj.get("model")
+        features = list(obj.get("features", []))
+        model_version = obj.get("model_version")
+        trained_with = obj.get("sklearn_version")
+    else:
+        model = obj
+        features = list(getattr(obj, "feature_names_in_", FEATURES))
+        model_version = None
+        trained_with = None
+
+    info = {
+        "loaded": False,
+        "path": path,
+        "model_version": model_version,
+        "trained_with_sklearn": trained_with,
+        "sklearn_version": sklearn.__version__,
+        # One warning per estimator in the forest; keep each message once
+        "warnings": list(dict.fromkeys(str(w.message) for w in caught)),
+    }
+    if model_version is None:
+        info["reason"] = "unversioned model (retrain to get a model_version bundle)"
+    elif model_version != MODEL_VERSION:
+        info["reason"] = f"model version {model_version}, expected {MODEL_VERSION}"
+    elif features != FEATURES:
+        info["reason"] = f"feature mismatch: {features}"
+    elif any(issubclass(w.category, InconsistentVersionWarning) for w in caught):
+        info["reason"] = f"pickled with scikit-learn {trained_with or 'of another version'}, running {sklearn.__version__}"
+    else:
+        try:
+            # Smoke test so an incompatible pickle fails here, not mid-batch
+            model.predict_proba(pd.DataFrame([[0.0] * len(FEATURES)], columns=FEATURES))
+        except Exception as e:
+            info["reason"] = f"model unusable: {e}"
+        else:
+            info["loaded"] = True
+            print(f"✅ Loaded severity model from {path}")
+            return SeverityScorer(model, info)
+
+    print(f"⚠️ Severity model not used ({info['reason']}); falling back to heuristic")
+    return SeverityScorer(info=info)
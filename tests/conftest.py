@@ -0,0 +1,72 @@
+# tests/conftest.py
+import os
+import sys
+
+# Modules live at the repo root; the tests run against the SQLite stand-in
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DB_BACKEND", "sqlite")
+os.environ.setdefault("SEVERITY_MODEL_ENABLED", "0")
+
+import pytest
+
+@pytest.fixture(scope="session")
+def dataset(tmp_path_factory):
+    """Path of a small synthetic Home Credit SQLite database (see benchmark.py)."""
+    import benchmark
+    path = str(tmp_path_factory.mktemp("data") / "creditsense.db")
+    benchmark.generate_dataset(path, customers=300, nulls=0.1, negatives=0.05, duplicates=0.05, outliers=0.02)
+    return path
+
+@pytest.fixture
+def db(dataset, tmp_path):
+    """A pool over a private copy of the dataset."""
+    import shutil
+    from db_pool import ConnectionPool, SqliteConnection
+    path = str(tmp_path / "creditsense.db")
+    shutil.copy(dataset, path)
+    pool = ConnectionPool(lambda: SqliteConnection(path), size=2)
+    yield pool
+    pool.close_all()
+
+@pytest.fixture
+def results_db(db, monkeypatch):
+    """`db` with the DQ result tables (runs, summary, watermarks) set up."""
+    import dq_runs
+    import dq_summary
+    import watermarks
+    # Each test gets a fresh database, so the "already created" flags must reset
+    monkeypatch.setattr(dq_runs, "_tables_ready", False)
+    monkeypatch.setattr(dq_summary, "_table_ready", False)
+    monkeypatch.setattr(watermarks, "_table_ready", False)
+    dq_summary.ensure_table(db)
+    watermarks.ensure_table(db)
+    return db
+
+@pytest.fixture
+def pipeline(results_db, monkeypatch):
+    """orchestrate wired to `results_db`, with the LLM call replaced by `pipeline.llm`."""
+    import types
+    import orchestrate
+    import population_stats
+    from column_dictionary import ColumnDictionaryCache
+
+    state = types.SimpleNamespace(pool=results_db, calls=[], fail=False)
+
+    def request_suggestions(sk_id, payload_checks):
+        state.calls.append(sk_id)
+        if state.fail:
+            raise ConnectionError("LLM unreachable")
+        return orchestrate._suggestion_rows(sk_id, payload_checks, {
+            "raw_output": "{}", "parsed_json": {"suggestion": f"fix {sk_id}", "confidence": 0.5},
+        })
+
+    monkeypatch.setattr(orchestrate, "pool", results_db)
+    monkeypatch.setattr(orchestrate, "replica", None)
+    monkeypatch.setattr(orchestrate, "CHECK_MODE", "pandas")
+    monkeypatch.setattr(orchestrate, "LLM_BATCH_API_URL", None)
+    monkeypatch.setattr(orchestrate, "request_suggestions", request_suggestions)
+    monkeypatch.setattr(orchestrate, "population", population_stats.PopulationStatsCache(
+        lambda: population_stats.load(results_db)))
+    monkeypatch.setattr(orchestrate, "column_descriptions", ColumnDictionaryCache(lambda: {}))
+    state.orchestrate = orchestrate
+    return state
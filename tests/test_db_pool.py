@@ -0,0 +1,89 @@
+# tests/test_db_pool.py
+import threading
+import pytest
+from db_pool import ConnectionPool, sqlite_connect
+
+@pytest.fixture
+def connect(tmp_path):
+    made = []
+
+    def connect():
+        made.append(sqlite_connect(str(tmp_path / "pool.db")))
+        return made[-1]
+
+    connect.made = made
+    return connect
+
+def test_size_bounds_checked_out_connections(connect):
+    pool = ConnectionPool(connect, size=2, timeout=0.2)
+    with pool.connection() as a, pool.connection() as b:
+        assert a is not b
+        with pytest.raises(TimeoutError):
+            with pool.connection():
+                pass
+    assert pool.stats() == {"size": 2, "open": 2, "idle": 2, "reconnects": 0}
+
+    # A slot freed by another thread unblocks the waiter
+    pool.timeout = 5
+    held = pool._acquire()
+    release = threading.Timer(0.1, pool._release, [held])
+    release.start()
+    with pool.connection(), pool.connection():
+        pass
+    release.join()
+    assert len(connect.made) == 2
+
+def test_idle_connections_are_reused(connect):
+    pool = ConnectionPool(connect, size=2)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        assert second is first
+    assert len(connect.made) == 1
+
+def test_stale_connection_is_replaced(connect):
+    pool = ConnectionPool(connect, size=1, health_check_interval=0)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as same:  # still answers the health query
+        assert same is first
+    first.close()
+    with pool.cursor() as cur:
+        cur.execute("SELECT 1")
+        assert cur.fetchone() == (1,)
+    assert len(connect.made) == 2
+    assert pool.stats()["reconnects"] == 1 and pool.stats()["open"] == 1
+
+def test_fresh_idle_connections_are_not_pinged(connect):
+    pool = ConnectionPool(connect, size=1, health_check_interval=3600, health_query="SELECT missing")
+    with pool.connection() as first:
+        pass
+    with pool.connection() as same:
+        assert same is first
+    assert pool.reconnects == 0
+
+def test_broken_connection_is_discarded(connect):
+    pool = ConnectionPool(connect, size=1)
+    with pytest.raises(RuntimeError):
+        with pool.connection() as conn:
+            conn.close()
+            raise RuntimeError("lost")
+    assert pool.stats() == {"size": 1, "open": 0, "idle": 0, "reconnects": 1}
+    with pool.connection() as fresh:
+        assert fresh is not conn
+
+def test_query_errors_keep_a_healthy_connection(connect):
+    pool = ConnectionPool(connect, size=1)
+    with pytest.raises(Exception):
+        with pool.cursor() as cur:
+            cur.execute("SELECT * FROM no_such_table")
+    with pool.connection() as conn:
+        assert conn is connect.made[0]
+    assert pool.reconnects == 0
+
+def test_close_all_closes_idle_connections(connect):
+    pool = ConnectionPool(connect, size=2)
+    with pool.connection(), pool.connection():
+        pass
+    pool.close_all()
+    assert pool.stats()["open"] == 0 and pool.stats()["idle"] == 0
@@ -0,0 +1,113 @@
+# tests/test_dq_writer.py
+import json
+from collections import Counter
+import pytest
+import dq_runs
+import dq_summary
+import watermarks
+from dq_writer import BulkWriter
+
+@pytest.fixture
+def pool(results_db):
+    return results_db
+
+def anomaly(sk_id, column, severity="High", issue="MISSING"):
+    return ("SAMPLE_APPLICATION", column, sk_id, None, issue, json.dumps({"severity": severity}))
+
+def suggestion(sk_id, column):
+    return ("SAMPLE_APPLICATION", column, sk_id, "desc", "raw", json.dumps({"fix": "x"}), 0.9, "cause", "[]")
+
+def flush(pool, writer):
+    with pool.connection() as conn:
+        return writer.flush(conn)
+
+def rows(pool, sql, params=()):
+    with pool.cursor() as cur:
+        cur.execute(sql, list(params))
+        return cur.fetchall()
+
+def published(pool):
+    return Counter(
+        (table, column, issue, dq_summary.severity_of(details))
+        for table, column, issue, details in rows(pool, f"""
+            SELECT a.TABLE_NAME, a.COLUMN_NAME, a.ANOMALY_TYPE, a.ANOMALY_DETAILS
+            FROM {dq_runs.CURRENT_ANOMALIES}
+        """)
+    )
+
+def summary(pool):
+    counts = Counter()
+    for table, column, issue, severity, n in rows(pool, """
+        SELECT TABLE_NAME, COLUMN_NAME, ANOMALY_TYPE, SEVERITY, ANOMALY_COUNT FROM DQ_SUMMARY
+    """):
+        counts[(table, column, issue, severity)] += n
+    return +counts
+
+def current_columns(pool, sk_id, source=dq_runs.CURRENT_ANOMALIES):
+    return sorted(r[0] for r in rows(pool, f"SELECT a.COLUMN_NAME FROM {source} WHERE a.SK_ID_CURR = %s", [sk_id]))
+
+def test_flush_publishes_and_keeps_summary_consistent(pool):
+    writer = BulkWriter()
+    writer.replace_customers([1, 2])
+    writer.add_anomaly(anomaly(1, "AMT_CREDIT"))
+    writer.add_anomaly(anomaly(1, "AMT_ANNUITY", "Low"))
+    writer.add_anomaly(anomaly(2, "AMT_CREDIT", "Medium"))
+    writer.add_suggestions([suggestion(1, "AMT_CREDIT")])
+    writer.add_watermark(1, "abc")
+    assert flush(pool, writer)["anomalies"] == 3
+    assert summary(pool) == published(pool)
+    assert current_columns(pool, 1) == ["AMT_ANNUITY", "AMT_CREDIT"]
+    assert watermarks.load_watermarks(pool, [1, 2]) == {1: "abc"}
+
+    # Re-check customer 1 only: its old rows disappear from readers and the summary
+    writer.replace_customers([1])
+    writer.add_anomaly(anomaly(1, "AMT_INCOME_TOTAL", "Medium"))
+    flush(pool, writer)
+    assert current_columns(pool, 1) == ["AMT_INCOME_TOTAL"]
+    assert current_columns(pool, 2) == ["AMT_CREDIT"]
+    assert current_columns(pool, 1, dq_runs.CURRENT_SUGGESTIONS) == []
+    assert summary(pool) == published(pool)
+
+def test_checks_only_run_keeps_published_suggestions(pool):
+    writer = BulkWriter()
+    writer.replace_customers([1])
+    writer.add_anomaly(anomaly(1, "AMT_CREDIT"))
+    writer.add_suggestions([suggestion(1, "AMT_CREDIT")])
+    flush(pool, writer)
+
+    writer.replace_customers([1], suggestions=False)
+    flush(pool, writer)
+    assert current_columns(pool, 1) == []
+    assert current_columns(pool, 1, dq_runs.CURRENT_SUGGESTIONS) == ["AMT_CREDIT"]
+    assert summary(pool) == published(pool)
+
+def test_failed_flush_changes_nothing(pool):
+    writer = BulkWriter()
+    writer.replace_customers([1])
+    writer.add_anomaly(anomaly(1, "AMT_CREDIT"))
+    flush(pool, writer)
+    before = summary(pool), rows(pool, "SELECT * FROM DQ_CURRENT_RUN")
+
+    writer.replace_customers([1])
+    writer.add_anomaly(anomaly(1, "AMT_ANNUITY"))
+    writer.add_suggestions([("too", "short")])
+    with pytest.raises(Exception):
+        flush(pool, writer)
+    assert (summary(pool), rows(pool, "SELECT * FROM DQ_CURRENT_RUN")) == before
+    assert current_columns(pool, 1) == ["AMT_CREDIT"]
+
+def test_rebuild_and_compaction_agree_with_incremental_summary(pool):
+    writer = BulkWriter()
+    for column in ["AMT_CREDIT", "AMT_ANNUITY", "AMT_CREDIT"]:
+        writer.replace_customers([1, 2])
+        writer.add_anomaly(anomaly(1, column))
+        writer.add_anomaly(anomaly(2, column, "Low", "NEGATIVE"))
+        flush(pool, writer)
+    incremental = summary(pool)
+
+    result = dq_runs.compact(pool, retention=-1)
+    assert result["anomalies_deleted"] == 4
+    assert rows(pool, "SELECT COUNT(*) FROM DQ_ANOMALIES") == [(2,)]
+    with pool.connection() as conn:
+        dq_summary.rebuild(conn)
+    assert summary(pool) == incremental == published(pool)
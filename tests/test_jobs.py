@@ -0,0 +1,131 @@
+# tests/test_jobs.py
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+import orchestrate
+import orchestrator_api
+from jobs import JobQueue, QueueFull
+
+@pytest.fixture
+def processed(monkeypatch):
+    # Stands in for the pipeline; each call waits until the test releases it
+    calls = []
+    release = asyncio.Event()
+
+    async def process_batch(sk_ids, force=False, on_stage=None):
+        calls.append(list(sk_ids))
+        on_stage("llm", {sk_ids[0]: [{"issue": "x"}]})
+        await release.wait()
+        on_stage("persist", None)
+        return [{"sk_id": sk_ids[0], "status": "processed"}]
+
+    monkeypatch.setattr(orchestrate, "_process_batch_async", process_batch)
+    return calls, release
+
+def test_running_customer_is_deduplicated(processed):
+    calls, release = processed
+
+    async def scenario():
+        queue = JobQueue(workers=2, max_queue=10)
+        queue.start()
+        first, dup = queue.submit(1)
+        assert not dup
+        await asyncio.sleep(0.01)
+        assert first["status"] == "running" and first["stage"] == "llm"
+        assert first["anomalies"] == [{"issue": "x"}]
+        again, dup = queue.submit(1)
+        assert dup and again is first
+
+        release.set()
+        for _ in range(100):
+            if first["status"] == "completed":
+                break
+            await asyncio.sleep(0.01)
+        assert first["result"] == {"sk_id": 1, "status": "processed"}
+        assert list(first["stages"]) == ["checks", "llm", "persist", "done"]
+
+        # Finished customers get a new job
+        later, dup = queue.submit(1)
+        assert not dup and later["job_id"] != first["job_id"]
+        await asyncio.sleep(0.01)
+        await queue.stop()
+
+    asyncio.run(scenario())
+    assert calls == [[1], [1]]
+
+def test_forced_submit_is_not_absorbed_by_an_unforced_job(monkeypatch):
+    runs = []
+    release = asyncio.Event()
+
+    async def process_batch(sk_ids, force=False, on_stage=None):
+        runs.append((sk_ids[0], force))
+        await release.wait()
+        return [{"sk_id": sk_ids[0], "status": "processed"}]
+
+    monkeypatch.setattr(orchestrate, "_process_batch_async", process_batch)
+
+    async def scenario():
+        queue = JobQueue(workers=1, max_queue=10)
+        queue.start()
+        running, _ = queue.submit(1)
+        queued, _ = queue.submit(2)
+        await asyncio.sleep(0.01)
+        assert running["status"] == "running" and queued["status"] == "queued"
+
+        # Queued: upgraded in place
+        upgraded, dup = queue.submit(2, force=True)
+        assert dup and upgraded is queued and queued["force"]
+        # Running: a forced job follows it and stays deduplicated
+        follow, dup = queue.submit(1, force=True)
+        assert not dup and follow is not running and follow["force"]
+        assert queue.submit(1, force=True) == (follow, True)
+        assert queue.submit(1) == (follow, True)
+
+        release.set()
+        for _ in range(100):
+            if follow["status"] == "completed":
+                break
+            await asyncio.sleep(0.01)
+        assert 1 not in queue.active
+        await queue.stop()
+
+    asyncio.run(scenario())
+    assert runs == [(1, False), (2, True), (1, True)]
+
+def test_full_queue_raises_and_dedup_still_answers():
+    queue = JobQueue(workers=0, max_queue=2)
+    queue.start()
+    queue.submit(1)
+    queue.submit(2)
+    with pytest.raises(QueueFull):
+        queue.submit(3)
+    assert queue.submit(2)[1] is True
+    assert queue.depth() == 2
+
+def test_history_drops_oldest_finished_jobs():
+    queue = JobQueue(workers=0, max_queue=10, history=2)
+    queue.start()
+    first, _ = queue.submit(1)
+    first["status"] = "completed"
+    queue.active.pop(1)
+    queue.submit(2)
+    queue.submit(3)
+    assert queue.get(first["job_id"]) is None and len(queue.jobs) == 2
+
+def test_api_returns_429_when_the_queue_is_full(monkeypatch):
+    queue = JobQueue(workers=0, max_queue=1)
+    queue.start()
+    monkeypatch.setattr(orchestrator_api, "job_queue", queue)
+    client = TestClient(orchestrator_api.app)  # no lifespan: nothing else starts
+
+    accepted = client.post("/process_customer", json={"sk_id": 1})
+    assert accepted.status_code == 202
+    job_id = accepted.json()["job_id"]
+    duplicate = client.post("/process_customer", json={"sk_id": 1})
+    assert duplicate.status_code == 202
+    assert duplicate.json()["deduplicated"] and duplicate.json()["job_id"] == job_id
+
+    full = client.post("/process_customer", json={"sk_id": 2})
+    assert full.status_code == 429
+    assert client.get(f"/jobs/{job_id}").json()["status"] == "queued"
+    assert client.get("/jobs/unknown").status_code == 404
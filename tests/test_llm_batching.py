@@ -0,0 +1,85 @@
+# tests/test_llm_batching.py
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from llm_batching import BatchScheduler, QueueFull
+
+@pytest.fixture
+def started():
+    schedulers = []
+
+    def start(scheduler):
+        schedulers.append(scheduler)
+        scheduler.start()
+        return scheduler
+
+    yield start
+    for scheduler in schedulers:
+        scheduler.stop()
+
+def test_concurrent_prompts_share_a_batch(started):
+    batches = []
+    scheduler = started(BatchScheduler(
+        lambda prompts: batches.append(list(prompts)) or [p.upper() for p in prompts],
+        max_batch_size=4, max_wait=0.2,
+    ))
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda p: scheduler.generate(p, timeout=5), [f"p{i}" for i in range(8)]))
+    assert results == [f"P{i}" for i in range(8)]
+    assert max(len(b) for b in batches) > 1 and all(len(b) <= 4 for b in batches)
+    stats = scheduler.stats()
+    assert stats["requests"] == 8 and stats["batches"] == len(batches) and stats["largest_batch"] <= 4
+
+def test_load_runs_once_before_generating(started):
+    events = []
+    scheduler = started(BatchScheduler(
+        lambda prompts: events.append("generate") or prompts,
+        load=lambda: events.append("load"),
+    ))
+    assert scheduler.generate("a", timeout=5) == "a"
+    assert scheduler.generate("b", timeout=5) == "b"
+    assert events == ["load", "generate", "generate"] and scheduler.ready
+
+def test_failed_load_fails_queued_and_later_prompts(started):
+    release = threading.Event()
+
+    def load():
+        release.wait(5)
+        raise RuntimeError("no GPU")
+
+    scheduler = started(BatchScheduler(lambda prompts: prompts, load=load))
+    queued = scheduler.submit("a")
+    release.set()
+    with pytest.raises(RuntimeError, match="no GPU"):
+        queued.result(5)
+    with pytest.raises(RuntimeError, match="no GPU"):
+        scheduler.submit("b")
+    assert not scheduler.ready and scheduler.stats()["load_error"] == "no GPU"
+
+def test_generation_errors_reach_every_caller(started):
+    def generate(prompts):
+        raise ValueError("boom")
+
+    scheduler = started(BatchScheduler(generate))
+    with pytest.raises(ValueError, match="boom"):
+        scheduler.generate("a", timeout=5)
+    assert scheduler.stats()["failed_batches"] == 1
+
+def test_wrong_output_count_is_an_error(started):
+    scheduler = started(BatchScheduler(lambda prompts: []))
+    with pytest.raises(RuntimeError, match="Expected 1 outputs"):
+        scheduler.generate("a", timeout=5)
+
+def test_full_queue_and_cancelled_callers():
+    seen = []
+    scheduler = BatchScheduler(lambda prompts: seen.extend(prompts) or prompts, max_queue=2)
+    kept = scheduler.submit("kept")
+    scheduler.submit("cancelled").cancel()
+    with pytest.raises(QueueFull):
+        scheduler.submit("overflow")
+    scheduler.start()
+    try:
+        assert kept.result(5) == "kept"
+        assert seen == ["kept"]
+    finally:
+        scheduler.stop()
@@ -0,0 +1,61 @@
+# tests/test_llm_cache.py
+import llm_cache
+from llm_cache import LLMResponseCache, cache_key, fill_customer, strip_customer
+
+ISSUES = [
+    {"table": "SAMPLE_APPLICATION", "column": "AMT_CREDIT", "desc": "Credit", "summary": "High severity NEGATIVE issue: -5"},
+    {"table": "SAMPLE_BUREAU", "column": "AMT_ANNUITY", "desc": "Annuity", "summary": "Low severity MISSING issue: 0.1"},
+]
+
+def test_key_ignores_issue_order_and_repeats():
+    assert cache_key(ISSUES, "t", "m") == cache_key(ISSUES[::-1] + ISSUES[:1], "t", "m")
+
+def test_key_depends_on_template_model_and_prompt_settings():
+    base = cache_key(ISSUES, "t", "m", "budget=1500")
+    assert base != cache_key(ISSUES, "t2", "m", "budget=1500")
+    assert base != cache_key(ISSUES, "t", "m2", "budget=1500")
+    assert base != cache_key(ISSUES, "t", "m", "budget=800")
+
+def test_lru_evicts_least_recently_used():
+    cache = LLMResponseCache(max_entries=2, ttl=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now the oldest
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    cache = LLMResponseCache(max_entries=10, ttl=60)
+    cache.put("a", 1)
+    now[0] += 59
+    assert cache.get("a") == 1
+    now[0] += 2
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+def test_persisted_entries_survive_a_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    LLMResponseCache(ttl=60, path=path).put("a", {"x": 1})
+    assert LLMResponseCache(ttl=60, path=path).get("a") == {"x": 1}
+
+def test_customer_id_is_replaced_for_the_next_customer():
+    result = {
+        "raw_output": '[{"suggestion": "Fix customer 100001 (not 1000012)"}]',
+        "parsed_json": [{"suggestion": "Fix customer 100001 (not 1000012)"}],
+    }
+    stored = strip_customer(result, 100001)
+    assert "100001" not in str(stored).replace("1000012", "")
+    served = fill_customer(stored, 100777)
+    assert served["parsed_json"][0]["suggestion"] == "Fix customer 100777 (not 1000012)"
+    assert "100777" in served["raw_output"]
+
+def test_values_equal_to_the_customer_id_are_not_cached():
+    issues = [{"table": "SAMPLE_APPLICATION", "column": "DAYS_EMPLOYED", "desc": "Days employed",
+               "summary": "High severity OUTLIER issue: 365243"}]
+    result = {"parsed_json": [{"suggestion": "DAYS_EMPLOYED 365243 for customer 365243 is a sentinel"}]}
+    assert strip_customer(result, 365243, issues) is None
+    stored = strip_customer(result, 100001, issues)
+    assert fill_customer(stored, 100002) == result
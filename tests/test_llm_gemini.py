@@ -0,0 +1,83 @@
+# tests/test_llm_gemini.py
+import importlib.util
+import json
+import os
+import pytest
+
+pytest.importorskip("google.generativeai")
+pytest.importorskip("prometheus_client")
+
+from llm_cache import LLMResponseCache
+
+@pytest.fixture
+def gemini(monkeypatch):
+    # The module name has a hyphen, so it is loaded from its path
+    monkeypatch.setenv("LLM_CACHE_PATH", "")
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "llm-gemini.py")
+    spec = importlib.util.spec_from_file_location("llm_gemini", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.cache = LLMResponseCache(ttl=60)
+    return module
+
+def customer(module, sk_id, issues=1):
+    # Issues differ per customer: cache keys don't include the id
+    return module.CombinedRequest(sk_id=sk_id, issues=[
+        module.IssueCheck(table="SAMPLE_APPLICATION", column=f"C{i}", desc="desc",
+                          summary=f"High severity MISSING issue: {sk_id % 1000}.{i}")
+        for i in range(issues)
+    ])
+
+def answer(sk_id):
+    return [{"suggestion": f"fix {sk_id}", "severity": "high"}]
+
+def test_packs_respect_the_token_budget(gemini, monkeypatch):
+    monkeypatch.setattr(gemini, "BATCH_TOKEN_BUDGET", 1200)
+    customers = [customer(gemini, 100001 + i, issues=5) for i in range(6)] + [customer(gemini, 100100, issues=200)]
+    packs = gemini.pack_customers(customers)
+    assert [c.sk_id for pack in packs for c, _, _ in pack] == [c.sk_id for c in customers]
+    static = gemini.estimate_tokens(gemini.BATCH_PROMPT_TEMPLATE.format(schema=gemini.JSON_SCHEMA, customer_sections=""))
+    for pack in packs[:-1]:
+        assert len(pack) > 0
+        assert static + sum(gemini.estimate_tokens(section) for _, section, _ in pack) <= 1200
+    assert [c.sk_id for c, _, _ in packs[-1]] == [100100]  # too large: packed alone
+
+def test_split_keeps_only_valid_answers(gemini):
+    raw = "```json\n" + json.dumps({
+        "100001": answer(100001),
+        "100002": answer(100002)[0],  # a single object is normalized to a list
+        "100003": [{"severity": "low"}],  # no suggestion
+        "100004": "n/a",
+    }) + "\n```"
+    parsed = gemini.split_packed_output(raw, [100001, 100002, 100003, 100004, 100005])
+    assert parsed == {100001: answer(100001), 100002: answer(100002)}
+
+@pytest.mark.parametrize("raw", ["no json", '{"100001": [', '["not", "a", "map"]'])
+def test_split_of_malformed_output_is_empty(gemini, raw):
+    assert gemini.split_packed_output(raw, [100001]) == {}
+
+def test_batch_falls_back_per_customer(gemini, monkeypatch):
+    calls = []
+
+    def generate(prompt, endpoint):
+        calls.append(endpoint)
+        if endpoint == "analyze_batch":
+            return json.dumps({"100001": answer(100001)})  # 100002 is missing
+        return json.dumps(answer("single"))
+
+    monkeypatch.setattr(gemini, "generate", generate)
+    request = gemini.BatchRequest(customers=[customer(gemini, 100001), customer(gemini, 100002)])
+    results = {r["sk_id"]: r for r in gemini.analyze_batch(request)["results"]}
+    assert calls == ["analyze_batch", "analyze_combined"]
+    assert results[100001]["packed"] and results[100001]["parsed_json"] == answer(100001)
+    assert not results[100002]["packed"] and results[100002]["parsed_json"] == answer("single")
+
+    # Both answers were cached; nothing is sent the second time
+    results = gemini.analyze_batch(request)["results"]
+    assert len(calls) == 2 and all(r["cache_hit"] for r in results)
+
+def test_unparseable_single_answer_abstains(gemini, monkeypatch):
+    monkeypatch.setattr(gemini, "generate", lambda prompt, endpoint: '[{"suggestion": }]')
+    result = gemini.analyze_combined(customer(gemini, 100001))
+    assert result["parsed_json"] == [gemini.ABSTAIN] and not result["cache_hit"]
+    assert gemini.cache.stats()["entries"] == 0
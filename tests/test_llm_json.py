@@ -0,0 +1,67 @@
+# tests/test_llm_json.py
+import json
+import pytest
+from llm_json import JsonScanner, parse_suggestion, validate_suggestion
+
+ANSWER = {
+    "suggestion": "Backfill AMT_ANNUITY from the bureau feed",
+    "severity": "High",
+    "confidence": 1.4,
+    "rationale": 'Braces in strings } ] and an escaped quote \\" do not count',
+    "lineage_hypothesis": [{"from_table": "SAMPLE_BUREAU", "to_table": "SAMPLE_APPLICATION", "extra": 1}],
+}
+
+def scan(pieces):
+    scanner = JsonScanner()
+    for n, piece in enumerate(pieces, 1):
+        if scanner.feed(piece):
+            return scanner, n
+    return scanner, None
+
+def test_stops_at_the_end_of_the_first_value():
+    text = "Sure! ```json\n" + json.dumps(ANSWER) + "\n``` and then the prompt again {"
+    scanner, _ = scan([text])
+    assert scanner.done and json.loads(scanner.text) == ANSWER
+
+@pytest.mark.parametrize("size", [1, 2, 7])
+def test_token_by_token_feeding(size):
+    value = "prose " + json.dumps(ANSWER)
+    text = value + ' trailing {"x": 1}'
+    pieces = [text[i:i + size] for i in range(0, len(text), size)]
+    scanner, n = scan(pieces)
+    assert json.loads(scanner.text) == ANSWER
+    assert n == -(-len(value) // size)  # done on the piece that closes the value
+
+def test_incomplete_value_is_not_done():
+    scanner, n = scan(['{"a": [1, 2', ', "}"'])
+    assert n is None and not scanner.done
+    assert scanner.feed("]}") and json.loads(scanner.text) == {"a": [1, 2, "}"]}
+    assert scanner.feed("ignored") and scanner.text.endswith("]}")
+
+def test_top_level_array():
+    scanner, _ = scan(["[", '{"a": "]"}', "] tail"])
+    assert json.loads(scanner.text) == [{"a": "]"}]
+
+def test_parse_normalizes_the_answer():
+    result = parse_suggestion("Answer: " + json.dumps([ANSWER]) + " done")
+    assert result["severity"] == "high" and result["confidence"] == 1.0
+    assert result["lineage_hypothesis"] == [
+        {"from_table": "SAMPLE_BUREAU", "to_table": "SAMPLE_APPLICATION", "key": None, "reason": None}
+    ]
+    assert result["follow_up_checks"] == [] and result["rule_template_sql"] is None
+
+@pytest.mark.parametrize("text", [
+    "no json here",
+    '{"suggestion": "x", "severity": "urgent"}',
+    '{"severity": "low"}',
+    '{"suggestion": "x", "severity": "low", "confidence": "sure"}',
+    '{"suggestion": "x", "severity": "low", "lineage_hypothesis": "a->b"}',
+    '{"suggestion": "x", "severity": "low"',
+])
+def test_parse_rejects_bad_answers(text):
+    with pytest.raises(ValueError):
+        parse_suggestion(text)
+
+def test_validate_rejects_non_objects():
+    with pytest.raises(ValueError):
+        validate_suggestion("text")
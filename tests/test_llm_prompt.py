@@ -0,0 +1,60 @@
+# tests/test_llm_prompt.py
+from llm_prompt import MAX_LISTED_PREV, build_summary, compact_issues
+
+APP, BUREAU = "SAMPLE_APPLICATION", "SAMPLE_BUREAU"
+
+def issue(summary, table=APP, column="AMT_CREDIT"):
+    return (table, column, "Credit amount", summary)
+
+def test_exact_repeats_are_dropped():
+    issues = [issue("High severity MISSING issue: 50.0")] * 3
+    entries, stats = compact_issues(issues)
+    assert len(entries) == 1 and entries[0][5] == 1
+    assert stats == {"issues": 3, "duplicates": 2, "collapsed": 0}
+
+def test_row_level_values_collapse_into_one_ranged_line():
+    issues = [
+        issue("Medium severity NEGATIVE issue: -5 (SK_ID_PREV 11)"),
+        issue("High severity MISSING issue: 20.0"),
+        issue("Medium severity NEGATIVE issue: -120.5 (SK_ID_PREV 12)"),
+        issue("Medium severity NEGATIVE issue: -7 (SK_ID_PREV 13)"),
+        issue("Medium severity NEGATIVE issue: -1", column="AMT_ANNUITY"),
+    ]
+    entries, stats = compact_issues(issues)
+    assert [e[3] for e in entries] == [
+        "Medium severity NEGATIVE issue: 3 values from -120.5 to -5 (SK_ID_PREV 11, 12, 13)",
+        "High severity MISSING issue: 20.0",
+        "Medium severity NEGATIVE issue: -1",
+    ]
+    assert [e[5] for e in entries] == [3, 1, 1]
+    assert stats["collapsed"] == 2
+
+def test_severities_and_tables_are_not_merged():
+    issues = [
+        issue("High severity OUTLIER issue: 9"),
+        issue("Low severity OUTLIER issue: 4"),
+        issue("High severity OUTLIER issue: 8", table=BUREAU),
+    ]
+    entries, _ = compact_issues(issues)
+    assert len(entries) == 3
+
+def test_long_prev_lists_are_truncated():
+    issues = [issue(f"Low severity OUTLIER issue: {i} (SK_ID_PREV {100 + i})") for i in range(MAX_LISTED_PREV + 3)]
+    (entry,), _ = compact_issues(issues)
+    assert entry[3].endswith("104 +3 more)")
+
+def test_unparsed_summaries_pass_through():
+    entries, _ = compact_issues([issue("something else entirely")])
+    assert entries[0][3] == "something else entirely" and entries[0][4] is None
+
+def test_budget_keeps_highest_severity_lines_and_notes_the_rest():
+    issues = [issue(f"Low severity MISSING issue: {i}.0", column=f"C{i}") for i in range(20)]
+    issues.insert(10, issue("High severity MISSING issue: 99.0", column="KEY"))
+    full, full_stats = build_summary(issues, budget=10_000)
+    assert full_stats["omitted_lines"] == 0 and "omitted" not in full
+
+    text, stats = build_summary(issues, budget=120)
+    assert stats["tokens"] <= 120
+    assert "High severity MISSING issue: 99.0" in text
+    assert stats["omitted_lines"] > 0
+    assert f"{stats['omitted_issues']} more issue(s) on {stats['omitted_lines']} column check(s) omitted" in text
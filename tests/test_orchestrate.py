@@ -0,0 +1,44 @@
+# tests/test_orchestrate.py
+import dq_runs
+
+SK_ID = 100002
+
+def published_suggestions(pool, sk_id):
+    with pool.cursor() as cur:
+        cur.execute(f"SELECT COUNT(*) FROM {dq_runs.CURRENT_SUGGESTIONS} WHERE a.SK_ID_CURR = %s", [sk_id])
+        return cur.fetchone()[0]
+
+def suggestions_published_at(pool, sk_id):
+    with pool.cursor() as cur:
+        cur.execute("SELECT PUBLISHED_AT, SUGGESTIONS_PUBLISHED_AT FROM DQ_CURRENT_RUN WHERE SK_ID_CURR = %s", [sk_id])
+        return cur.fetchone()
+
+def test_failed_llm_call_keeps_the_published_suggestions(pipeline):
+    first = pipeline.orchestrate.process_customer(SK_ID)
+    assert first["status"] == "processed" and first["suggestions"] > 0
+    kept = published_suggestions(pipeline.pool, SK_ID)
+    _, suggested_at = suggestions_published_at(pipeline.pool, SK_ID)
+    assert kept > 0 and suggested_at is not None
+
+    with pipeline.pool.cursor() as cur:
+        # Make the later publish distinguishable
+        cur.execute("UPDATE DQ_CURRENT_RUN SET SUGGESTIONS_PUBLISHED_AT = '2000-01-01 00:00:00'")
+        cur.execute("COMMIT")
+    pipeline.fail = True
+    again = pipeline.orchestrate.process_customer(SK_ID, force=True)
+    assert again["status"] == "llm_failed"
+    assert published_suggestions(pipeline.pool, SK_ID) == kept
+    published_at, suggested_at = suggestions_published_at(pipeline.pool, SK_ID)
+    assert suggested_at == "2000-01-01 00:00:00" and published_at > suggested_at
+
+    pipeline.fail = False
+    pipeline.orchestrate.process_customer(SK_ID, force=True)
+    assert published_suggestions(pipeline.pool, SK_ID) == kept
+    assert suggestions_published_at(pipeline.pool, SK_ID)[1] > "2000-01-01 00:00:00"
+
+def test_checks_only_run_keeps_suggestions(pipeline):
+    import asyncio
+    pipeline.orchestrate.process_customer(SK_ID)
+    kept = published_suggestions(pipeline.pool, SK_ID)
+    asyncio.run(pipeline.orchestrate._process_batch_async([SK_ID], llm=False, force=True))
+    assert published_suggestions(pipeline.pool, SK_ID) == kept
@@ -0,0 +1,67 @@
+# tests/test_profiling.py
+import numpy as np
+import pandas as pd
+from profiling import ColumnMoments, DistinctCounter, compute_features, profile_chunks
+
+def hashes(values):
+    return pd.util.hash_pandas_object(pd.Series(values), index=False).to_numpy()
+
+def test_exact_below_limit():
+    counter = DistinctCounter(exact_limit=100)
+    counter.update(hashes([1, 2, 2]))
+    counter.update(hashes([3, 1]))
+    assert counter.count() == 3 and counter.registers is None
+
+def test_switch_to_sketch_keeps_the_exact_values():
+    counter = DistinctCounter(exact_limit=1000)
+    counter.update(hashes(range(800)))
+    assert counter.registers is None and counter.count() == 800
+    counter.update(hashes(range(400, 1200)))  # crosses the limit mid-chunk
+    assert counter.registers is not None and len(counter.exact) == 0
+    assert abs(counter.count() - 1200) / 1200 < 0.05
+    counter.update(hashes(range(1200)))  # repeats don't move the estimate
+    assert abs(counter.count() - 1200) / 1200 < 0.05
+
+def test_sketch_above_limit_is_bounded_and_close():
+    counter = DistinctCounter(exact_limit=1000)
+    for part in np.array_split(np.arange(200_000), 20):
+        counter.update(hashes(np.concatenate([part, part[:100]])))
+    assert counter.registers is not None and len(counter.exact) == 0
+    assert abs(counter.count() - 200_000) / 200_000 < 0.03
+
+def test_table_dup_rate():
+    df = pd.DataFrame({"k": [1, 1, 2, 3], "v": [1.0, 2.0, 3.0, 4.0]})
+    assert compute_features(df, ["k"])["dup_rate"].tolist() == [0.25]
+
+def test_moments_merge_across_chunks():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"a": rng.normal(5, 2, 1000), "b": rng.integers(0, 9, 1000).astype(float)})
+    df.loc[rng.random(1000) < 0.2, "a"] = np.nan
+    moments = ColumnMoments()
+    for start in range(0, len(df), 150):
+        moments.update(df.iloc[start:start + 150])
+    assert np.allclose(moments.mean, df.mean())
+    assert np.allclose(moments.std(), df.std())
+    assert moments.count.tolist() == df.count().tolist()
+
+def test_column_null_in_the_first_chunk_is_still_profiled():
+    chunks = [
+        pd.DataFrame({"k": [1, 2], "late": [None, None], "v": [1.0, 2.0]}),
+        pd.DataFrame({"k": [3, 4, 5], "late": [10.0, 20.0, 30.0], "v": [3.0, 4.0, 5.0]}),
+    ]
+    assert chunks[0]["late"].dtype == object
+    profiler = profile_chunks(lambda: iter(chunks), ["k"])
+    assert profiler.numeric == ["late", "v"]
+    stats = profiler.stats()
+    assert stats.loc["late", "mean"] == 20.0 and stats.loc["late", "count"] == 3
+    assert stats.loc["late", "std"] == 10.0 and stats.loc["v", "mean"] == 3.0
+
+def test_outliers_use_the_whole_table_moments():
+    # Each chunk on its own looks normal; only table-wide moments flag the 100s
+    base = [0.0] * 40
+    chunks = [pd.DataFrame({"k": range(40), "v": base}),
+              pd.DataFrame({"k": range(40, 42), "v": [100.0, 100.0]})]
+    profiler = profile_chunks(lambda: iter(chunks), ["k"])
+    assert profiler.outliers["v"] == 2
+    features = profiler.features().set_index("column")
+    assert features.loc["v", "zscore_outlier_pct"] == 2 / 42
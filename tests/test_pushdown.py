@@ -0,0 +1,91 @@
+# tests/test_pushdown.py
+import pandas as pd
+import pytest
+import dq_pushdown
+import dq_rules
+import population_stats
+from dq_rules import CUSTOMER_KEY
+
+SK_IDS = list(range(100001, 100301, 3))
+
+def local_frames(conn, ids):
+    ph = ", ".join(["%s"] * len(ids))
+    frames = {}
+    for table in dq_rules.tables():
+        sql, key = dq_rules.source_query(table)
+        cur = conn.cursor()
+        try:
+            cur.execute(f"{sql} WHERE {key} IN ({ph})", ids)
+            df = pd.DataFrame(cur.fetchall(), columns=[d[0] for d in cur.description])
+        finally:
+            cur.close()
+        frames[table] = dq_rules.source_frame(df)
+    return frames
+
+def normalized(anomalies):
+    out = anomalies.astype({"DETAIL": float}).copy()
+    out[dq_rules.PREV_KEY] = pd.to_numeric(out[dq_rules.PREV_KEY])
+    out["DETAIL"] = out["DETAIL"].round(6)
+    return out.sort_values(list(out.columns)).reset_index(drop=True)
+
+@pytest.fixture
+def population(db):
+    return population_stats.load(db)
+
+def test_pushdown_matches_pandas(db, population):
+    with db.connection() as conn:
+        frames = local_frames(conn, SK_IDS)
+        pushed, profiles, present = dq_pushdown.run_checks(conn, SK_IDS, dq_pushdown.SqliteDialect(), population)
+    local = dq_rules.run_checks(frames, population=population)
+
+    assert not local.empty
+    assert set(local["ANOMALY_TYPE"]) == set(dq_rules.CHECKS)
+    pd.testing.assert_frame_equal(normalized(pushed), normalized(local), check_dtype=False)
+    assert present == set(frames["SAMPLE_APPLICATION"][CUSTOMER_KEY])
+
+def test_pushdown_profiles_match_pandas(db, population):
+    with db.connection() as conn:
+        frames = local_frames(conn, SK_IDS)
+        _, pushed, _ = dq_pushdown.run_checks(conn, SK_IDS, dq_pushdown.SqliteDialect(), population)
+    local = dq_rules.column_profiles(frames, population=population)
+
+    keys = [CUSTOMER_KEY, "TABLE_NAME", "COLUMN_NAME"]
+    merged = local.merge(pushed, on=keys, suffixes=("", "_pushed"))
+    assert len(merged) == len(local) == len(pushed)
+    for feature in ["missing_pct", "dup_rate", "zscore_outlier_pct"]:
+        assert (merged[feature] - merged[f"{feature}_pushed"]).abs().max() < 1e-9, feature
+
+def installment_anomalies(anomalies):
+    rows = anomalies[anomalies["TABLE_NAME"] == "SAMPLE_INSTALLMENTS"]
+    return normalized(rows[rows["ANOMALY_TYPE"].isin(["NEGATIVE", "OUTLIER"])])
+
+def test_duplicated_parent_key_does_not_repeat_linked_rows(db, population):
+    with db.cursor() as cur:
+        cur.execute("""
+            SELECT p.SK_ID_CURR, p.SK_ID_PREV FROM SAMPLE_PREVIOUS_APP p
+            JOIN SAMPLE_INSTALLMENTS i ON i.SK_ID_PREV = p.SK_ID_PREV
+            WHERE i.AMT_PAYMENT < 0 GROUP BY p.SK_ID_CURR, p.SK_ID_PREV
+            HAVING COUNT(DISTINCT p.rowid) = 1 LIMIT 1
+        """)
+        sk_id, prev = cur.fetchone()
+        cur.execute("SELECT COUNT(*) FROM SAMPLE_INSTALLMENTS WHERE SK_ID_PREV = %s", [prev])
+        installments = cur.fetchone()[0]
+
+    def checked():
+        with db.connection() as conn:
+            frames = local_frames(conn, [sk_id])
+            pushed, _, _ = dq_pushdown.run_checks(conn, [sk_id], dq_pushdown.SqliteDialect(), population)
+        linked = frames["SAMPLE_INSTALLMENTS"]
+        assert (linked[dq_rules.PREV_KEY] == prev).sum() == installments
+        local = installment_anomalies(dq_rules.run_checks(frames, population=population))
+        pd.testing.assert_frame_equal(installment_anomalies(pushed), local, check_dtype=False)
+        return local
+
+    before = checked()
+    assert not before.empty
+    with db.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("INSERT INTO SAMPLE_PREVIOUS_APP SELECT * FROM SAMPLE_PREVIOUS_APP WHERE SK_ID_PREV = %s", [prev])
+        conn.commit()
+        cur.close()
+    pd.testing.assert_frame_equal(checked(), before)
@@ -0,0 +1,112 @@
+# tests/test_read_replica.py
+import json
+import os
+import pandas as pd
+import pytest
+import dq_rules
+import read_replica
+from read_replica import ReadReplica, TableSnapshot, diff_table, snapshot_table
+from watermarks import content_hashes
+
+SK_IDS = [100001, 100050, 100299, 999999]
+
+def warehouse(pool, sk_ids):
+    ph = ", ".join(["%s"] * len(sk_ids))
+    frames = {}
+    with pool.connection() as conn:
+        for table in dq_rules.tables():
+            sql, key = dq_rules.source_query(table)
+            cur = conn.cursor()
+            try:
+                cur.execute(f"{sql} WHERE {key} IN ({ph})", sk_ids)
+                frames[table] = dq_rules.source_frame(
+                    pd.DataFrame(cur.fetchall(), columns=[d[0] for d in cur.description]))
+            finally:
+                cur.close()
+    return frames
+
+def execute(pool, sql, params=()):
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute(sql, list(params))
+        conn.commit()
+        cur.close()
+
+@pytest.fixture
+def replica(db, tmp_path):
+    r = ReadReplica(db, str(tmp_path / "replica"), refresh=3600, full_refresh=86400)
+    r.refresh(background=False)
+    return r
+
+def test_snapshot_is_sorted_and_streams_in_chunks(db, tmp_path):
+    with db.connection() as conn:
+        path = snapshot_table(conn, "SAMPLE_INSTALLMENTS", str(tmp_path), chunk_rows=100)
+    snapshot = TableSnapshot("SAMPLE_INSTALLMENTS", path)
+    assert snapshot.data.column(read_replica.KEY).num_chunks > 1  # one record batch per chunk
+    assert (snapshot.keys[1:] >= snapshot.keys[:-1]).all()
+    sql, key = dq_rules.source_query("SAMPLE_INSTALLMENTS")
+    with db.cursor() as cur:
+        cur.execute(f"SELECT COUNT(*) FROM ({sql} WHERE {key} IS NOT NULL) s")
+        assert snapshot.rows == cur.fetchone()[0]
+
+def test_snapshot_widens_a_column_that_starts_all_null(db, tmp_path):
+    execute(db, "UPDATE SAMPLE_APPLICATION SET AMT_ANNUITY = NULL WHERE SK_ID_CURR < 100100")
+    execute(db, "UPDATE SAMPLE_APPLICATION SET DAYS_EMPLOYED = NULL WHERE SK_ID_CURR < 100100")
+    with db.connection() as conn:
+        path = snapshot_table(conn, "SAMPLE_APPLICATION", str(tmp_path), chunk_rows=50)
+    snapshot = TableSnapshot("SAMPLE_APPLICATION", path)
+    assert snapshot.rows == 300
+    assert snapshot.lookup([100200])["AMT_ANNUITY"].notna().all()
+
+def test_lookup_matches_the_warehouse(db, replica):
+    frames = replica.fetch(SK_IDS)
+    assert content_hashes(frames) == content_hashes(warehouse(db, SK_IDS))
+    single = replica.fetch([100050])
+    assert content_hashes(single) == content_hashes(warehouse(db, [100050]))
+    assert all(df.empty for df in replica.fetch([999999]).values())
+
+def test_diff_replaces_only_changed_customers(db, replica, tmp_path):
+    execute(db, "UPDATE SAMPLE_BUREAU SET AMT_ANNUITY = -1, UPDATED_AT = '2030-01-01' WHERE SK_ID_CURR = 100050")
+    snapshot = replica._snapshots["SAMPLE_BUREAU"]
+    with db.connection() as conn:
+        path, changed = diff_table(conn, snapshot, replica.directory, "2030-01-01")
+    assert changed == 1
+    fresh = TableSnapshot("SAMPLE_BUREAU", path)
+    assert fresh.rows == snapshot.rows
+    assert (fresh.lookup([100050])["AMT_ANNUITY"] == -1).all()
+    assert (fresh.keys[1:] >= fresh.keys[:-1]).all()
+    with db.connection() as conn:
+        assert diff_table(conn, fresh, replica.directory, "2031-01-01") == (path, 0)
+
+def test_refresh_diffs_then_goes_full_when_due(db, replica):
+    assert sorted(replica.last_refresh["full"]) == sorted(dq_rules.tables())
+    execute(db, "UPDATE SAMPLE_APPLICATION SET AMT_CREDIT = 1, UPDATED_AT = '2030-01-01' WHERE SK_ID_CURR = 100001")
+    replica.refresh(background=False)
+    assert replica.last_refresh["full"] == []
+    assert replica.last_refresh["diff"]["SAMPLE_APPLICATION"] >= 1  # plus ties at the old watermark
+    assert content_hashes(replica.fetch([100001])) == content_hashes(warehouse(db, [100001]))
+
+    # Deleted rows are only dropped by a full snapshot
+    execute(db, "DELETE FROM SAMPLE_BUREAU WHERE SK_ID_CURR = 100050")
+    replica.refresh(background=False)
+    assert not replica.fetch([100050])["SAMPLE_BUREAU"].empty
+    replica.full_refresh_interval = -1
+    replica.refresh(background=False)
+    assert sorted(replica.last_refresh["full"]) == sorted(dq_rules.tables())
+    assert replica.fetch([100050])["SAMPLE_BUREAU"].empty
+
+def test_manifest_is_reused_by_the_next_process(db, replica):
+    with open(os.path.join(replica.directory, read_replica.MANIFEST)) as f:
+        manifest = json.load(f)
+    assert set(manifest) == set(dq_rules.tables())
+    assert manifest["SAMPLE_APPLICATION"]["updated_at_max"].startswith("2024-01")
+
+    reopened = ReadReplica(db, replica.directory, refresh=3600)
+    assert reopened.stats()["ready"] and reopened.refreshes == 0
+    assert content_hashes(reopened.fetch(SK_IDS)) == content_hashes(replica.fetch(SK_IDS))
+
+def test_incomplete_replica_falls_back_to_the_warehouse(db, tmp_path):
+    r = ReadReplica(db, str(tmp_path / "empty"), tables=dq_rules.tables(), refresh=3600)
+    r._failed_at = float("inf")  # no background refresh in this test
+    r.retry = float("inf")
+    assert r.fetch(SK_IDS) is None
@@ -0,0 +1,55 @@
+# tests/test_scan.py
+import sqlite3
+import numpy as np
+import pandas as pd
+import db_pool
+import scan
+from scan import KEY, aligned_chunks, null_key_rows, stream_table
+
+def frames(*keys):
+    return [pd.DataFrame({KEY: np.array(k, dtype=float), "V": range(len(k))}) for k in keys]
+
+def collect(streams):
+    chunks = list(aligned_chunks(streams))
+    out = {t: pd.concat([c[t] for c in chunks if t in c] + frames([]), ignore_index=True) for t in streams}
+    return chunks, out
+
+def test_chunks_hold_every_row_of_their_customers():
+    chunks, out = collect({"A": frames([1, 2, 2], [2, 3, 5]), "B": frames([1, 3], [3, 3, 4], [5])})
+    assert sorted(out["A"][KEY]) == [1, 2, 2, 2, 3, 5]
+    assert sorted(out["B"][KEY]) == [1, 3, 3, 3, 4, 5]
+    seen = set()
+    for chunk in chunks:
+        ids = set().union(*(set(df[KEY]) for df in chunk.values()))
+        assert not ids & seen
+        seen |= ids
+
+def test_null_keys_do_not_stall_the_merge():
+    # Used to spin forever: the NaN tail made the cutoff NaN
+    _, out = collect({"A": frames([1, 2], [3, np.nan]), "B": frames([1, 3])})
+    assert sorted(out["A"][KEY]) == [1, 2, 3]
+    assert sorted(out["B"][KEY]) == [1, 3]
+
+def test_all_null_chunks_are_skipped():
+    _, out = collect({"A": frames([np.nan], [1, 2]), "B": frames([np.nan, np.nan])})
+    assert sorted(out["A"][KEY]) == [1, 2]
+    assert out["B"].empty
+
+def test_stream_skips_and_reports_null_keys(tmp_path):
+    path = str(tmp_path / "scan.db")
+    raw = sqlite3.connect(path)
+    raw.execute("CREATE TABLE SAMPLE_APPLICATION (SK_ID_CURR INTEGER, AMT_CREDIT REAL)")
+    raw.executemany("INSERT INTO SAMPLE_APPLICATION VALUES (?, ?)", [(2, 1.0), (None, 2.0), (1, 3.0), (None, 4.0)])
+    raw.commit()
+    raw.close()
+
+    conn = db_pool.SqliteConnection(path)
+    try:
+        streamed = pd.concat(stream_table(conn, "SAMPLE_APPLICATION", 1), ignore_index=True)
+        assert list(streamed[KEY]) == [1, 2]
+        assert null_key_rows(conn, ["SAMPLE_APPLICATION"]) == {"SAMPLE_APPLICATION": 2}
+    finally:
+        conn.close()
+
+def test_new_progress_reports_null_key_rows():
+    assert scan.new_progress()["null_key_rows"] == {}
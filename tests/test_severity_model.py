@@ -0,0 +1,93 @@
+# tests/test_severity_model.py
+import warnings
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+import sklearn
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.exceptions import InconsistentVersionWarning
+import dq_rules
+from severity_model import FEATURES, MODEL_VERSION, SeverityScorer, load_scorer
+
+def bundle(**overrides):
+    X = pd.DataFrame([[0.0, 0.0, 0.0], [0.5, 0.0, 0.0], [0.2, 0.0, 0.0]], columns=FEATURES)
+    model = RandomForestClassifier(n_estimators=3, random_state=0).fit(X, ["Low", "High", "Medium"])
+    obj = {"model": model, "features": FEATURES, "model_version": MODEL_VERSION,
+           "sklearn_version": sklearn.__version__}
+    obj.update(overrides)
+    return obj
+
+def test_versioned_bundle_is_loaded(tmp_path):
+    path = str(tmp_path / "model.pkl")
+    joblib.dump(bundle(), path)
+    scorer = load_scorer(path)
+    assert scorer.uses_model and scorer.info["loaded"]
+
+def test_unversioned_pickles_are_rejected(tmp_path):
+    path = str(tmp_path / "model.pkl")
+    joblib.dump(bundle()["model"], path)
+    scorer = load_scorer(path)
+    assert not scorer.uses_model
+    assert "unversioned" in scorer.info["reason"]
+
+def test_other_model_version_is_rejected(tmp_path):
+    path = str(tmp_path / "model.pkl")
+    joblib.dump(bundle(model_version=MODEL_VERSION + 1), path)
+    assert not load_scorer(path).uses_model
+
+def test_table_level_bundles_are_rejected(tmp_path):
+    # Version 1 bundles were trained on table-level profiles
+    path = str(tmp_path / "model.pkl")
+    joblib.dump(bundle(model_version=1), path)
+    scorer = load_scorer(path)
+    assert not scorer.uses_model and "expected 2" in scorer.info["reason"]
+
+def test_sklearn_version_mismatch_falls_back(tmp_path, monkeypatch):
+    path = str(tmp_path / "model.pkl")
+    joblib.dump(bundle(sklearn_version="0.0"), path)
+    real_load = joblib.load
+
+    def load(p):
+        for _ in range(3):  # one warning per estimator, like a real forest
+            warnings.warn(InconsistentVersionWarning(
+                estimator_name="DecisionTreeClassifier", current_sklearn_version=sklearn.__version__,
+                original_sklearn_version="0.0"))
+        return real_load(p)
+
+    monkeypatch.setattr(joblib, "load", load)
+    scorer = load_scorer(path)
+    assert not scorer.uses_model
+    assert "0.0" in scorer.info["reason"]
+    assert len(scorer.info["warnings"]) == 1
+    assert "DecisionTreeClassifier" in scorer.info["warnings"][0]
+
+class FixedScorer(SeverityScorer):
+    def __init__(self, label):
+        super().__init__(model=object())
+        self.label = label
+
+    def predict(self, profiles):
+        return np.full(len(profiles), self.label, dtype=object), np.ones(len(profiles))
+
+def test_model_never_lowers_a_rule_high():
+    frames = {"SAMPLE_APPLICATION": pd.DataFrame({"SK_ID_CURR": [1, 2], "AMT_ANNUITY": [np.nan, 1.0]})}
+    rules = [r for r in dq_rules.RULES if (r.table, r.column, r.check) == ("SAMPLE_APPLICATION", "AMT_ANNUITY", "MISSING")]
+    anomalies = dq_rules.run_checks(frames, rules)
+    assert list(anomalies["SEVERITY"]) == ["High"]
+    profiles = dq_rules.column_profiles(frames, rules)
+    scored = dq_rules.score_severity(anomalies, frames, FixedScorer("Low"), profiles=profiles)
+    assert list(scored["SEVERITY"]) == ["High"]
+
+@pytest.mark.parametrize("mates", [[], [2]])
+def test_dup_rate_does_not_depend_on_batch_mates(mates):
+    # Customer 2 carries the same bureau id as customer 1
+    bureau = pd.DataFrame({"SK_ID_CURR": [1, 1, 2], "SK_ID_BUREAU": [10, 11, 10], "AMT_CREDIT_SUM": [1.0, 2.0, 3.0], "AMT_ANNUITY": [1.0, 2.0, 3.0]})
+    frames = {"SAMPLE_BUREAU": bureau[bureau["SK_ID_CURR"].isin([1] + mates)]}
+    profiles = dq_rules.column_profiles(frames)
+    assert (profiles.loc[profiles["SK_ID_CURR"] == 1, "dup_rate"] == 0.0).all()
+
+def test_dup_rate_counts_repeats_within_a_customer():
+    frames = {"SAMPLE_BUREAU": pd.DataFrame({"SK_ID_CURR": [1, 1], "SK_ID_BUREAU": [10, 10], "AMT_CREDIT_SUM": [1.0, 2.0], "AMT_ANNUITY": [1.0, 2.0]})}
+    profiles = dq_rules.column_profiles(frames)
+    assert (profiles["dup_rate"] == 0.5).all()
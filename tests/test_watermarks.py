@@ -0,0 +1,100 @@
+# tests/test_watermarks.py
+import numpy as np
+import pandas as pd
+import dq_rules
+import population_stats
+import watermarks
+from watermarks import content_hashes
+
+def frames():
+    return {
+        "SAMPLE_APPLICATION": pd.DataFrame({"SK_ID_CURR": [1, 2], "AMT_CREDIT": [100.0, 200.0]}),
+        "SAMPLE_BUREAU": pd.DataFrame({
+            "SK_ID_CURR": [1, 1, 2], "SK_ID_BUREAU": [10, 11, 12], "AMT_ANNUITY": [1.0, np.nan, 3.0],
+        }),
+    }
+
+def test_one_hash_per_customer():
+    hashes = content_hashes(frames())
+    assert set(hashes) == {1, 2}
+    assert hashes[1] != hashes[2]
+    assert all(len(h) == 16 for h in hashes.values())
+
+def test_row_order_and_column_order_do_not_matter():
+    shuffled = {t: df.iloc[::-1, ::-1] for t, df in frames().items()}
+    assert content_hashes(shuffled) == content_hashes(frames())
+
+def test_int_and_float_columns_hash_the_same():
+    changed = frames()
+    changed["SAMPLE_APPLICATION"]["AMT_CREDIT"] = changed["SAMPLE_APPLICATION"]["AMT_CREDIT"].astype("int64")
+    assert content_hashes(changed) == content_hashes(frames())
+
+def test_all_null_column_hashes_the_same_as_object_or_float():
+    as_float, as_object = frames(), frames()
+    as_float["SAMPLE_APPLICATION"]["NOTE"] = np.nan
+    as_object["SAMPLE_APPLICATION"]["NOTE"] = pd.Series([None, None], dtype=object)
+    assert content_hashes(as_float) == content_hashes(as_object)
+
+def test_only_the_changed_customer_changes():
+    before = content_hashes(frames())
+    changed = frames()
+    changed["SAMPLE_BUREAU"].loc[1, "AMT_ANNUITY"] = 2.0
+    after = content_hashes(changed)
+    assert after[1] != before[1] and after[2] == before[2]
+
+def test_same_rows_in_another_table_hash_differently():
+    app = frames()["SAMPLE_APPLICATION"]
+    assert content_hashes({"SAMPLE_APPLICATION": app}) != content_hashes({"SAMPLE_BUREAU": app})
+
+def test_rule_changes_invalidate_every_hash(monkeypatch):
+    before = content_hashes(frames())
+    monkeypatch.setattr(dq_rules, "RULES", dq_rules.RULES[:-1])
+    after = content_hashes(frames())
+    assert all(after[k] != before[k] for k in before)
+
+def test_empty_frames():
+    assert content_hashes({"SAMPLE_APPLICATION": frames()["SAMPLE_APPLICATION"].iloc[:0]}) == {}
+
+def test_changed_since_reads_every_rule_table(db):
+    since = "2024-01-29"
+    expected = set()
+    with db.cursor() as cur:
+        for table in dq_rules.tables():
+            from_clause, key = dq_rules.source_from(table)
+            cur.execute(f"SELECT {key} FROM {from_clause} WHERE t.UPDATED_AT > %s", [since])
+            expected.update(int(r[0]) for r in cur.fetchall())
+    changed = watermarks.changed_since(db, since)
+    assert changed == sorted(expected) and 0 < len(changed) < 300
+
+def population(bureau_ids, annuities):
+    bureau = pd.DataFrame({"SK_ID_BUREAU": bureau_ids, "AMT_ANNUITY": annuities, "AMT_CREDIT_SUM": annuities})
+    table = population_stats.compute_table_stats("SAMPLE_BUREAU", [bureau], ["SK_ID_BUREAU"])
+    return population_stats.PopulationStats({"SAMPLE_BUREAU": table})
+
+def test_new_duplicate_elsewhere_changes_only_the_affected_customer():
+    before = content_hashes(frames(), population([10, 11, 12, 99], [1.0, 2.0, 3.0, 4.0]))
+    # Another customer's new row reuses customer 1's SK_ID_BUREAU 10
+    after = content_hashes(frames(), population([10, 11, 12, 99, 10], [1.0, 2.0, 3.0, 4.0, 4.0]))
+    assert after[1] != before[1]
+
+def test_unchanged_duplicates_keep_the_hash():
+    a = content_hashes(frames(), population([10, 11, 12, 12], [1.0, 2.0, 3.0, 4.0]))
+    b = content_hashes(frames(), population([10, 11, 12, 12], [1.0, 2.0, 3.0, 4.0]))
+    assert a == b
+
+def test_shifted_outlier_moments_change_the_hash():
+    before = content_hashes(frames(), population([10, 11, 12], [1.0, 2.0, 3.0]))
+    after = content_hashes(frames(), population([10, 11, 12], [1.0, 2.0, 30.0]))
+    assert all(after[k] != before[k] for k in (1, 2))
+
+def test_load_watermarks_reads_long_id_lists_in_chunks(results_db):
+    from dq_writer import BulkWriter
+    writer = BulkWriter()
+    for sk_id in range(1, 2501):
+        writer.add_watermark(sk_id, f"h{sk_id}")
+    with results_db.connection() as conn:
+        writer.flush(conn)
+    ids = list(range(2600, 0, -1)) + [7, 7]
+    loaded = watermarks.load_watermarks(results_db, ids)
+    assert loaded == {sk_id: f"h{sk_id}" for sk_id in range(1, 2501)}
+    assert watermarks.load_watermarks(results_db, []) == {}
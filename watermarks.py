@@ -0,0 +1,127 @@
+# watermarks.py
+import os
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+import dq_rules
+
+KEY = dq_rules.CUSTOMER_KEY
+
+# Optional last-modified column on the source tables, used by "changed since T" runs
+SOURCE_UPDATED_AT_COLUMN = os.getenv("SOURCE_UPDATED_AT_COLUMN", "UPDATED_AT")
+
+WATERMARK_DDL = """
+    CREATE TABLE IF NOT EXISTS DQ_WATERMARKS (
+        SK_ID_CURR NUMBER,
+        CONTENT_HASH VARCHAR,
+        PROCESSED_AT TIMESTAMP
+    )
+"""
+
+# -------------------------------
+# Content hashes
+# -------------------------------
+def _salt(text):
+    return np.uint64(int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "big"))
+
+def rules_version():
+    # Changing the rule set invalidates every watermark
+    return _salt(repr(dq_rules.RULES))
+
+def population_inputs(df, table, population):
+    """
+    What the population checks of `table` read besides the rows: the
+    population count of each row's duplicate-checked keys (added as
+    columns) and the mean / std the outlier z-scores use (a salt).
+    """
+    table_stats = population.get(table) if population is not None else None
+    if table_stats is None:
+        return df, np.uint64(0)
+    df = df.copy()
+    for column in dq_rules.duplicate_key_columns(table):
+        counts = table_stats.duplicate_counts(df, column) if column in df.columns else None
+        if counts is not None:
+            df[f"POPULATION_COUNT:{column}"] = counts
+    moments = [(r.column, table_stats.moments(r.column)) for r in dq_rules.RULES
+               if r.table == table and r.check == "OUTLIER"]
+    return df, _salt(repr(moments))
+
+def content_hashes(frames, population=None):
+    """
+    Returns {sk_id: hex hash} over every source row of each customer.
+    Row hashes are summed per customer, so the result does not depend on
+    row order, and numeric columns are compared as float64 so the same
+    data hashes the same whichever query fetched it (an all-NULL column
+    comes back as object from some drivers and as float64 from others).
+    With `population`, the hash also covers the population statistics the
+    DUPLICATE / OUTLIER checks use (see population_inputs), so a new
+    duplicate elsewhere or a shifted mean / std re-checks the customer.
+    """
+    keys, hashes = [], []
+    for table in sorted(frames):
+        df = frames[table]
+        if df.empty:
+            continue
+        df, population_salt = population_inputs(df, table, population)
+        cols = sorted(df.columns)
+        normalized = df[cols].apply(
+            lambda s: s.astype("float64") if pd.api.types.is_numeric_dtype(s) or s.isna().all() else s
+        )
+        salt = _salt(table) ^ population_salt
+        hashes.append(pd.util.hash_pandas_object(normalized, index=False).to_numpy() ^ salt)
+        keys.append(df[KEY].to_numpy())
+
+    if not hashes:
+        return {}
+    combined = pd.Series(np.concatenate(hashes)).groupby(np.concatenate(keys)).sum()
+    version = rules_version()
+    return {int(k): f"{int(np.uint64(v) ^ version):016x}" for k, v in combined.items()}
+
+# -------------------------------
+# Stored watermarks
+# -------------------------------
+_table_ready = False
+_table_lock = threading.Lock()
+
+def ensure_table(pool):
+    global _table_ready
+    with _table_lock:
+        if not _table_ready:
+            with pool.connection() as conn:
+                cur = conn.cursor()
+                try:
+                    cur.execute(WATERMARK_DDL)
+                    conn.commit()
+                finally:
+                    cur.close()
+            _table_ready = True
+
+def load_watermarks(pool, sk_ids):
+    ensure_table(pool)
+    ids = list(dict.fromkeys(int(x) for x in sk_ids))
+    if not ids:
+        return {}
+    found = {}
+    with pool.cursor() as cur:
+        for i in range(0, len(ids), 1000):
+            chunk = ids[i:i + 1000]
+            cur.execute(
+                f"SELECT SK_ID_CURR, CONTENT_HASH FROM DQ_WATERMARKS WHERE SK_ID_CURR IN ({', '.join(['%s'] * len(chunk))})",
+                chunk,
+            )
+            found.update((int(k), h) for k, h in cur.fetchall())
+    return found
+
+def changed_since(pool, since, tables=None):
+    """
+    SK_ID_CURRs with a source row modified after `since`, read from the
+    SOURCE_UPDATED_AT_COLUMN of each table.
+    """
+    selects = []
+    for table in (tables or dq_rules.tables()):
+        from_clause, key = dq_rules.source_from(table)
+        selects.append(f"SELECT DISTINCT {key} FROM {from_clause} WHERE t.{SOURCE_UPDATED_AT_COLUMN} > %s")
+    with pool.cursor() as cur:
+        cur.execute(" UNION ".join(selects), [since] * len(selects))
+        return sorted(int(row[0]) for row in cur.fetchall())